@@ -0,0 +1,123 @@
+"""
+Micro-benchmark: per-query text cleanup CPU, before and after load-time cleaning
+
+Before: every answer ran the multi-pass clean_pdf_text() (eight uncompiled
+re.sub / str.replace passes) over its snippet.
+After: pages are cleaned once at load with the precompiled cleaner,
+so a query only slices and strips the already-clean passage.
+
+Usage:
+    python benchmarks/bench_clean_text.py [--page-chars 50000] [--repeat 2000] [--json]
+
+Runtime: Python 3.10
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from kb_passages import chunk_text  # noqa: E402
+from kb_text import clean_pdf_text  # noqa: E402
+
+
+def legacy_clean_pdf_text(text):
+    """
+    The per-snippet cleaner as it was before cleaning moved to load time.
+    """
+    text = re.sub(r' +', ' ', text)
+    text = re.sub(r'[•▪▫◦⚫⚬○●]', '• ', text)
+    text = re.sub(r'\n+•', '\n• ', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = text.replace('ﬁ', 'fi')
+    text = text.replace('ﬂ', 'fl')
+    text = text.replace('—', '-')
+    text = re.sub(r'\s+([,.;:!?])', r'\1', text)
+    text = re.sub(r'\.([A-Z])', r'. \1', text)
+    return text.strip()
+
+
+def make_large_page(chars, seed=7):
+    """
+    Synthetic PDF-extracted page with the artifacts the cleaner targets.
+    """
+    rng = random.Random(seed)
+    words = ('lambda', 'cold', 'start', 'container', 'dynamodb', 'table', 'ﬁle', 'ﬂow',
+             'bucket', 'region', 'throughput', 'capacity', 'timeout', 'memory')
+    parts = []
+    size = 0
+    while size < chars:
+        sentence = ' '.join(rng.choice(words) for _ in range(rng.randint(6, 16)))
+        sentence = sentence.capitalize() + rng.choice(['.', ' .', '.', '?', ' ,and more.'])
+        sentence += rng.choice([' ', '  ', '\n', '\n\n\n\n', '\n● ', '\n▪ ', ' — '])
+        parts.append(sentence)
+        size += len(sentence)
+    return ''.join(parts)[:chars]
+
+
+def cpu_per_call(func, repeat):
+    """
+    Mean CPU time of func() in microseconds.
+    """
+    started = time.process_time()
+    for _ in range(repeat):
+        func()
+    return (time.process_time() - started) / repeat * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--page-chars', type=int, default=50000, help='Size of the synthetic page')
+    parser.add_argument('--snippet-chars', type=int, default=1000, help='Size of an answer snippet')
+    parser.add_argument('--repeat', type=int, default=2000, help='Iterations per measurement')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args(argv)
+
+    raw_page = make_large_page(args.page_chars)
+    raw_snippet = raw_page[:args.snippet_chars]
+
+    cleaned_page = clean_pdf_text(raw_page)
+    start, end = chunk_text(cleaned_page)[0]
+
+    load_repeat = max(1, args.repeat // 50)
+    results = {
+        'page_chars': args.page_chars,
+        'snippet_chars': args.snippet_chars,
+        'per_query_us': {
+            'before_legacy_clean_snippet': cpu_per_call(lambda: legacy_clean_pdf_text(raw_snippet), args.repeat),
+            'compiled_clean_snippet': cpu_per_call(lambda: clean_pdf_text(raw_snippet), args.repeat),
+            'after_precleaned_slice': cpu_per_call(lambda: cleaned_page[start:end].strip(), args.repeat),
+        },
+        'per_page_load_us': {
+            'legacy_clean_page': cpu_per_call(lambda: legacy_clean_pdf_text(raw_page), load_repeat),
+            'compiled_clean_page': cpu_per_call(lambda: clean_pdf_text(raw_page), load_repeat),
+        },
+    }
+
+    per_query = results['per_query_us']
+    results['per_query_speedup'] = round(
+        per_query['before_legacy_clean_snippet'] / max(per_query['after_precleaned_slice'], 1e-9), 1
+    )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"Page: {args.page_chars} chars, snippet: {args.snippet_chars} chars")
+    print("Per query (CPU µs):")
+    for name, value in per_query.items():
+        print(f"  {name:32s} {value:10.2f}")
+    print("Per page at load (CPU µs):")
+    for name, value in results['per_page_load_us'].items():
+        print(f"  {name:32s} {value:10.2f}")
+    print(f"Per-query speedup: {results['per_query_speedup']}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Micro-benchmark: locating the first of several keywords in a page
+
+The old extract_relevant_section() helper found the earliest occurrence of
+any query keyword with one lowercased copy of the page plus one str.find()
+per keyword. This compares that against single-pass alternatives for 1 to 8
+keywords, both for keywords the page contains and for absent ones (every
+strategy then has to scan the whole page):
+
+- per_keyword_find:   lower() + str.find() per keyword
+- bounded_find:       as above, each find stopping at the earliest hit so far
+- alternation:        one precompiled IGNORECASE 'k1|k2|...' regex search
+- lowered_alternation: lower() + one precompiled 'k1|k2|...' regex search
+
+When a keyword occurs early, the IGNORECASE alternation stops there and
+skips the lowered copy of the page, which is most of the find cost. When no
+keyword occurs, it loses: str.find() runs at memory speed, while the regex
+engine tries every alternative at every position of the page. The
+single-pass matcher was therefore not adopted. The helper itself has since
+been removed, because answers are pre-sliced passages.
+
+Usage:
+    python benchmarks/bench_keyword_scan.py [--page-chars 5000] [--repeat 2000] [--json]
+
+Runtime: Python 3.10
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+
+from bench_clean_text import cpu_per_call, make_large_page
+
+KEYWORD_COUNTS = (1, 2, 4, 8)
+PAGE_WORDS = ('lambda', 'cold', 'start', 'container', 'dynamodb', 'table', 'bucket',
+              'region', 'throughput', 'capacity', 'timeout', 'memory')
+ABSENT_WORDS = ('kinesis', 'redshift', 'sagemaker', 'athena', 'glue', 'fargate', 'aurora', 'cognito')
+
+
+def per_keyword_find(page, keywords):
+    lowered = page.lower()
+    earliest = len(page)
+    for keyword in keywords:
+        position = lowered.find(keyword)
+        if position != -1 and position < earliest:
+            earliest = position
+    return earliest
+
+
+def bounded_find(page, keywords):
+    lowered = page.lower()
+    earliest = len(page)
+    for keyword in keywords:
+        position = lowered.find(keyword, 0, earliest + len(keyword) - 1)
+        if position != -1:
+            earliest = position
+    return earliest
+
+
+def alternation_search(pattern, page):
+    match = pattern.search(page)
+    return match.start() if match else len(page)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--page-chars', type=int, default=5000, help='Size of the synthetic page')
+    parser.add_argument('--repeat', type=int, default=2000, help='Iterations per measurement')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args(argv)
+
+    page = make_large_page(args.page_chars)
+    rng = random.Random(7)
+
+    results = {'page_chars': args.page_chars, 'scan_us': {}}
+    for case, words in (('present', PAGE_WORDS), ('absent', ABSENT_WORDS)):
+        for count in KEYWORD_COUNTS:
+            keywords = rng.sample(words, count)
+            alternatives = '|'.join(map(re.escape, sorted(keywords, key=len, reverse=True)))
+            pattern = re.compile(alternatives, re.IGNORECASE)
+            lowered_pattern = re.compile(alternatives)
+
+            expected = per_keyword_find(page, keywords)
+            assert bounded_find(page, keywords) == expected
+            assert alternation_search(pattern, page) == expected
+            assert alternation_search(lowered_pattern, page.lower()) == expected
+
+            results['scan_us'][f"{case}_{count}"] = {
+                'per_keyword_find': round(cpu_per_call(lambda: per_keyword_find(page, keywords), args.repeat), 2),
+                'bounded_find': round(cpu_per_call(lambda: bounded_find(page, keywords), args.repeat), 2),
+                'alternation': round(cpu_per_call(lambda: alternation_search(pattern, page), args.repeat), 2),
+                'lowered_alternation': round(cpu_per_call(
+                    lambda: alternation_search(lowered_pattern, page.lower()), args.repeat), 2),
+            }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    strategies = ('per_keyword_find', 'bounded_find', 'alternation', 'lowered_alternation')
+    print(f"Page: {args.page_chars} chars, CPU µs per scan")
+    print(f"  {'keywords':12s}" + ''.join(f" {name:>20s}" for name in strategies))
+    for case, timings in results['scan_us'].items():
+        print(f"  {case:12s}" + ''.join(f" {timings[name]:20.2f}" for name in strategies))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Micro-benchmark: PyPDF2 extraction time by worker count
+
+Times extract_pdf_pages_parallel() with 1, 2 and 4 workers (1 is the
+sequential extract_pdf_pages()) on a synthetic PDF, plus the page count
+the parallel path needs before it forks: len(PdfReader.pages), which
+resolves every page, against pdf_page_count(), which reads /Count.
+
+The speed-up depends on the CPUs the host really has (os.cpu_count() is
+printed with the results); on Lambda that is set by MemorySize. Run it on
+the target size before turning PDF_EXTRACT_WORKERS on.
+
+Usage:
+    python benchmarks/bench_pdf_extract.py [--pages 300] [--workers 1 2 4] [--repeat 3] [--json]
+
+Runtime: Python 3.10
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+sys.path.insert(0, BENCH_DIR)
+
+from bench_pipeline import make_pages, make_pdf  # noqa: E402
+from kb_text import clean_pdf_text  # noqa: E402
+from pdf_extract import PdfReader, extract_pdf_pages_parallel, pdf_page_count  # noqa: E402
+
+
+def best_of(repeat, func, *args, **kwargs):
+    """
+    Fastest of repeat calls, in seconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args, **kwargs)
+        durations.append(time.perf_counter() - started)
+    return min(durations)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=300)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args(argv)
+
+    pdf_bytes = make_pdf(make_pages(args.pages, random.Random(args.seed)))
+    expected = None
+    results = {'pages': args.pages, 'pdf_bytes': len(pdf_bytes), 'cpu_count': os.cpu_count(), 'extract_s': {}}
+
+    results['page_count_s'] = {
+        'len(pages)': best_of(args.repeat, lambda: len(PdfReader(io.BytesIO(pdf_bytes)).pages)),
+        'pdf_page_count': best_of(args.repeat, pdf_page_count, pdf_bytes),
+    }
+
+    for workers in args.workers:
+        # Keep the extractor's progress lines out of the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            pages = extract_pdf_pages_parallel(pdf_bytes, workers, clean=clean_pdf_text)
+            seconds = best_of(args.repeat, extract_pdf_pages_parallel, pdf_bytes, workers, clean=clean_pdf_text)
+        if expected is None:
+            expected = pages
+        elif pages != expected:
+            raise SystemExit(f"{workers} workers extracted different pages")
+        results['extract_s'][workers] = seconds
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{args.pages} pages ({len(pdf_bytes) // 1024} KB), {os.cpu_count()} CPUs, best of {args.repeat}")
+    for method, seconds in results['page_count_s'].items():
+        print(f"  page count via {method:<15} {seconds * 1000:8.1f} ms")
+    baseline = results['extract_s'][args.workers[0]]
+    for workers, seconds in results['extract_s'].items():
+        print(f"  {workers} worker(s): {seconds:6.2f} s  ({baseline / seconds:.2f}x)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
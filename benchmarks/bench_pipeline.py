@@ -0,0 +1,429 @@
+"""
+Offline benchmark: fallback search pipeline on synthetic PDF corpora
+
+Generates synthetic PDFs (10, 100 and 1,000 pages by default), serves them
+from an in-memory stand-in for s3_client and keeps sessions in an in-memory
+stand-in for the DynamoDB table, so load_knowledge_base() / load_pdf_from_s3(),
+search_pdf_for_answer() and lambda_handler() can be timed without deploying
+anything.
+
+Each corpus size runs in its own child process so peak RSS is per corpus.
+The pipeline's own log output goes to /dev/null while it is being measured.
+Knowledge base settings are read from the environment as in Lambda, e.g.
+PDF_LAZY_LOAD=true or PDF_EXTRACT_WORKERS=4 benchmark those paths.
+
+Results are printed (or written with --output) as JSON so runs from
+different versions can be compared.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--pages 10 100 1000] [--queries 200]
+                                        [--seed 7] [--output results.json]
+
+Runtime: Python 3.10
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+BENCH_BUCKET = 'bench-kb-bucket'
+BENCH_KEY = 'aws_knowledge_base.pdf'
+
+# Topic words the synthetic questions ask about
+TOPIC_WORDS = (
+    'lambda', 'cold', 'start', 'container', 'memory', 'timeout', 'concurrency',
+    'dynamodb', 'table', 'partition', 'capacity', 'throughput', 'index', 'stream',
+    's3', 'bucket', 'object', 'prefix', 'lifecycle', 'versioning', 'encryption',
+    'api', 'gateway', 'route', 'throttling', 'lex', 'bot', 'intent', 'slot',
+    'session', 'vpc', 'subnet', 'region', 'role', 'policy', 'cloudwatch', 'metric'
+)
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ren', 'tas', 'vo', 'qui', 'zer', 'dan', 'pel', 'sor', 'ti')
+
+# Lines per PDF page (12pt leading on a Letter page)
+LINES_PER_PAGE = 45
+
+
+# ============================================================================
+# SYNTHETIC CORPUS
+# ============================================================================
+
+def make_vocabulary(rng, size=4000):
+    """
+    Topic words plus pseudo-words, so postings lists have realistic lengths.
+    """
+    words = set(TOPIC_WORDS)
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_pages(page_count, rng):
+    """
+    Synthetic page texts: one sentence of 8-14 words per line.
+
+    Returns:
+        list: Lines of every page
+    """
+    vocabulary = make_vocabulary(rng)
+    pages = []
+    for _ in range(page_count):
+        lines = []
+        for _ in range(LINES_PER_PAGE):
+            words = [rng.choice(TOPIC_WORDS) if rng.random() < 0.2 else rng.choice(vocabulary)
+                     for _ in range(rng.randint(8, 14))]
+            lines.append(' '.join(words).capitalize() + '.')
+        pages.append(lines)
+    return pages
+
+
+def make_pdf(pages):
+    """
+    Minimal PDF with one Helvetica text line per entry of every page.
+
+    Args:
+        pages (list): Lines of every page
+
+    Returns:
+        bytes: PDF file
+    """
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        ('<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            ' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages))), len(pages))).encode(),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    for i, lines in enumerate(pages):
+        objects.append((
+            '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>'
+        ).encode())
+        operators = ['BT /F1 10 Tf 40 760 Td 12 TL']
+        for line in lines:
+            escaped = line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+            operators.append(f'({escaped}) Tj T*')
+        operators.append('ET')
+        stream = '\n'.join(operators).encode('latin-1')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+
+    xref_offset = len(output)
+    output += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    for offset in offsets:
+        output += f'{offset:010d} 00000 n \n'.encode()
+    output += (f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n'
+               f'startxref\n{xref_offset}\n%%EOF\n').encode()
+    return bytes(output)
+
+
+def make_questions(count, rng):
+    """
+    Questions about topic words, with about one in ten matching nothing.
+    """
+    questions = []
+    for _ in range(count):
+        if rng.random() < 0.1:
+            questions.append(f"What is {''.join(rng.choice('xyzw') for _ in range(8))}?")
+        else:
+            topic = ' '.join(rng.sample(TOPIC_WORDS, rng.randint(1, 3)))
+            questions.append(rng.choice(('What is {}?', 'How does {} work?', 'Explain {}', '{}')).format(topic))
+    return questions
+
+
+# ============================================================================
+# LOCAL STAND-INS FOR AWS
+# ============================================================================
+
+class LocalS3:
+    """
+    In-memory stand-in for the boto3 S3 client calls the pipeline makes.
+    """
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.etags = {key: '"%08x"' % zlib.crc32(data) for key, data in objects.items()}
+        self.requests = 0
+
+    def _object(self, key, operation):
+        from botocore.exceptions import ClientError
+        self.requests += 1
+        if key not in self.objects:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, operation)
+        return self.objects[key]
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        data = self._object(Key, 'GetObject')
+        if Range:
+            first, last = Range.split('=', 1)[1].split('-')
+            data = data[int(first):int(last) + 1]
+        return {'Body': io.BytesIO(data), 'ETag': self.etags[Key], 'ContentLength': len(data)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        data = self._object(Key, 'HeadObject')
+        return {'ETag': self.etags[Key], 'ContentLength': len(data)}
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        data = self._object(Key, 'GetObject')
+        with open(Filename, 'wb') as handle:
+            handle.write(data)
+
+    def get_paginator(self, operation_name):
+        return LocalListPaginator(self)
+
+
+class LocalListPaginator:
+    """
+    Single-page stand-in for the list_objects_v2 paginator.
+    """
+
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, Bucket, Prefix='', **kwargs):
+        self.s3.requests += 1
+        yield {'Contents': [
+            {'Key': key, 'ETag': self.s3.etags[key], 'Size': len(data)}
+            for key, data in sorted(self.s3.objects.items()) if key.startswith(Prefix)
+        ]}
+
+
+class LocalTable:
+    """
+    In-memory stand-in for the DynamoDB session table.
+
+    Items are stored as JSON, like a round trip through DynamoDB, so the
+    handler never shares objects with the store. Only this process writes,
+    so version-guarded writes always succeed.
+    """
+
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key):
+        item = self.items.get(Key['session_id'])
+        return {'Item': json.loads(item)} if item is not None else {}
+
+    def put_item(self, Item, **kwargs):
+        self.items[Item['session_id']] = json.dumps(Item)
+        return {}
+
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def latency_summary(seconds):
+    """
+    Latency percentiles (nearest rank) in milliseconds.
+
+    Args:
+        seconds (list): Per-call durations in seconds
+
+    Returns:
+        dict: count, mean, p50, p95, p99 and max in ms, plus calls per second
+    """
+    ordered = sorted(seconds)
+    count = len(ordered)
+
+    def percentile(pct):
+        return ordered[max(0, -(-pct * count // 100) - 1)] * 1000.0
+
+    total = sum(ordered)
+    return {
+        'count': count,
+        'mean_ms': round(total / count * 1000.0, 4),
+        'p50_ms': round(percentile(50), 4),
+        'p95_ms': round(percentile(95), 4),
+        'p99_ms': round(percentile(99), 4),
+        'max_ms': round(ordered[-1] * 1000.0, 4),
+        'throughput_per_s': round(count / total, 1) if total else None
+    }
+
+
+def timed_calls(func, arguments):
+    """
+    Call func(*args) for every args tuple, timing each call.
+
+    Returns:
+        list: Durations in seconds
+    """
+    durations = []
+    for args in arguments:
+        started = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def lex_event(question, session_id):
+    """
+    Lex V2 FallbackIntent event for a question.
+    """
+    return {
+        'sessionId': session_id,
+        'inputTranscript': question,
+        'sessionState': {'intent': {'name': 'FallbackIntent'}, 'sessionAttributes': {}}
+    }
+
+
+def run_corpus(page_count, query_count, seed):
+    """
+    Benchmark one corpus size in this process.
+
+    Returns:
+        dict: Results for the corpus
+    """
+    rng = random.Random(seed)
+    pages = make_pages(page_count, rng)
+    pdf_bytes = make_pdf(pages)
+    questions = make_questions(query_count, rng)
+
+    os.environ['PDF_S3_BUCKET'] = BENCH_BUCKET
+    os.environ['PDF_S3_KEY'] = BENCH_KEY
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('PDF_INDEX_LOCAL_DIR', tempfile.mkdtemp(prefix='kb_bench_'))
+    sys.path.insert(0, SRC_DIR)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        import app
+
+        s3 = LocalS3({BENCH_KEY: pdf_bytes})
+        app.s3_client = s3
+        app.table = LocalTable()
+
+        started = time.perf_counter()
+        knowledge_base = app.load_knowledge_base()
+        cold_load = time.perf_counter() - started
+        rss_after_load = peak_rss_mb()
+        s3_requests_at_load = s3.requests
+
+        search = timed_calls(app.search_pdf_for_answer, [(question, knowledge_base) for question in questions])
+
+        handler = timed_calls(app.lambda_handler, [
+            (lex_event(question, f'bench-{position % 20}'), None) for position, question in enumerate(questions)
+        ])
+
+        # Heap the knowledge base keeps, and the heap peak while loading it,
+        # from a second (traced, so untimed) cold load
+        app.KNOWLEDGE_BASE = None
+        knowledge_base = None
+        gc.collect()
+        tracemalloc.start()
+        knowledge_base = app.load_knowledge_base()
+        load_heap_peak = tracemalloc.get_traced_memory()[1]
+        gc.collect()  # PyPDF2 leaves reference cycles behind
+        kb_heap = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+    return {
+        'pages': page_count,
+        'pdf_bytes': len(pdf_bytes),
+        'passages': sum(len(document.passages or ()) for document in knowledge_base.documents.values()),
+        'cold_load_s': round(cold_load, 4),
+        's3_requests_at_load': s3_requests_at_load,
+        'search_pdf_for_answer': latency_summary(search),
+        'lambda_handler': latency_summary(handler),
+        'answer_cache': app.ANSWER_CACHE.stats(),
+        'session_cache': app.session_cache_stats(),
+        'kb_heap_mb': round(kb_heap / (1024 * 1024), 2),
+        'load_heap_peak_mb': round(load_heap_peak / (1024 * 1024), 2),
+        'peak_rss_after_load_mb': rss_after_load,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def git_commit():
+    """
+    Short commit hash of the working tree, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 100, 1000], help='Corpus sizes in pages')
+    parser.add_argument('--queries', type=int, default=200, help='Questions per corpus')
+    parser.add_argument('--seed', type=int, default=7, help='Seed for corpus and questions')
+    parser.add_argument('--output', help='Write results to this JSON file instead of stdout')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        print(json.dumps(run_corpus(args.child, args.queries, args.seed)))
+        return 0
+
+    corpora = []
+    for page_count in args.pages:
+        print(f"→ Benchmarking {page_count}-page corpus", file=sys.stderr)
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', str(page_count),
+             '--queries', str(args.queries), '--seed', str(args.seed)],
+            capture_output=True, text=True
+        )
+        if child.returncode != 0:
+            print(f"✗ {page_count}-page corpus failed:\n{child.stderr}", file=sys.stderr)
+            return 1
+        corpora.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    results = {
+        'benchmark': 'fallback_pipeline',
+        'git_commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'queries': args.queries,
+        'seed': args.seed,
+        'settings': {
+            name: os.environ[name] for name in sorted(os.environ)
+            if name.startswith(('PDF_', 'ANSWER_CACHE_', 'KB_'))
+        },
+        'corpora': corpora
+    }
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(report + '\n')
+        print(f"✓ Wrote {args.output}", file=sys.stderr)
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Micro-benchmark: session item size and write cost per history encoding
+
+Builds a session item holding SESSION_HISTORY_LIMIT knowledge-base style
+turns under every SESSION_HISTORY_ENCODING and reports its DynamoDB item
+size, the write capacity units one write of it consumes (PutItem and
+UpdateItem are both billed on the full item size, in 1 KB units) and the
+CPU cost of encoding a turn.
+
+Usage:
+    python benchmarks/bench_session_size.py [--turns 10] [--answer-chars 1000] [--json]
+
+Runtime: Python 3.10
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from session_history import ENCODINGS, encode_turn  # noqa: E402
+
+WORDS = (
+    'the', 'a', 'of', 'to', 'and', 'is', 'in', 'when', 'your', 'function', 'lambda',
+    'cold', 'start', 'container', 'memory', 'timeout', 'table', 'partition', 'key',
+    'capacity', 'request', 'bucket', 'object', 'api', 'gateway', 'latency', 'each',
+    'new', 'runtime', 'configured', 'provisioned', 'concurrency', 'region', 'read', 'write'
+)
+
+
+def make_turn(rng, answer_chars, page):
+    """
+    A fallback turn whose answer looks like a knowledge base passage.
+    """
+    sentences = []
+    size = 0
+    while size < answer_chars:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 18))).capitalize() + '.'
+        sentences.append(sentence)
+        size += len(sentence) + 1
+    answer = ' '.join(sentences)[:answer_chars]
+    return {
+        'intent': 'FallbackIntent',
+        'user_input': f"How does {rng.choice(WORDS[10:])} {rng.choice(WORDS[10:])} work?",
+        'bot_response': f"{answer}\n\n(Source: Page {page} of aws_knowledge_base.pdf)"
+    }
+
+
+def attribute_size(value):
+    """
+    DynamoDB storage size of an attribute value in bytes.
+    """
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float, Decimal)):
+        digits = len(str(abs(value)).replace('.', '').lstrip('0')) or 1
+        return 1 + math.ceil(digits / 2)
+    if isinstance(value, dict):
+        return 3 + sum(1 + len(key.encode('utf-8')) + attribute_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 3 + sum(1 + attribute_size(item) for item in value)
+    raise TypeError(f"Unsupported attribute type {type(value).__name__}")
+
+
+def item_size(item):
+    """
+    DynamoDB item size: attribute names plus values.
+    """
+    return sum(len(name.encode('utf-8')) + attribute_size(value) for name, value in item.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--turns', type=int, default=10, help='Turns kept in the history')
+    parser.add_argument('--answer-chars', type=int, default=1000, help='Length of each answer')
+    parser.add_argument('--repeat', type=int, default=2000, help='Iterations for the CPU measurement')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(7)
+    turns = [make_turn(rng, args.answer_chars, page) for page in range(1, args.turns + 1)]
+
+    results = {'turns': args.turns, 'answer_chars': args.answer_chars, 'encodings': {}}
+    for encoding in ENCODINGS:
+        item = {
+            'session_id': 'c1a5f3e2-6d0b-4f4e-9c1a-2b7d8e9f0a11',
+            'conversation_history': [encode_turn(turn, encoding) for turn in turns],
+            'intent_count': {'FallbackIntent': args.turns},
+            'expires_at': int(time.time()) + 86400
+        }
+        size = item_size(item)
+
+        started = time.process_time()
+        for position in range(args.repeat):
+            encode_turn(turns[position % len(turns)], encoding)
+        encode_us = (time.process_time() - started) / args.repeat * 1e6
+
+        results['encodings'][encoding] = {
+            'item_bytes': size,
+            'wcu_per_write': math.ceil(size / 1024),
+            'encode_us_per_turn': round(encode_us, 2)
+        }
+
+    full = results['encodings']['full']['item_bytes']
+    for stats in results['encodings'].values():
+        stats['size_vs_full'] = round(stats['item_bytes'] / full, 3)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{args.turns} turns of ~{args.answer_chars}-char answers")
+    print(f"  {'encoding':12s} {'item bytes':>10s} {'WCU':>5s} {'vs full':>8s} {'encode µs':>10s}")
+    for encoding, stats in results['encodings'].items():
+        print(f"  {encoding:12s} {stats['item_bytes']:10d} {stats['wcu_per_write']:5d} "
+              f"{stats['size_vs_full']:8.3f} {stats['encode_us_per_turn']:10.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
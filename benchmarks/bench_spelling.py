@@ -0,0 +1,150 @@
+"""
+Micro-benchmark: typo-tolerant term lookup against vocabulary size
+
+Times SpellingIndex.correct() on misspelled and unknown terms for
+vocabularies of 1,000 to 100,000 terms, next to a linear scan that checks
+the bounded edit distance to every term of similar length (what a lookup
+without an index has to do). Also reports the index build time and the
+share of misspellings corrected back to the original term (the rest map to
+another term at least as close, or to nothing).
+
+Usage:
+    python benchmarks/bench_spelling.py [--sizes 1000 10000 100000] [--queries 500] [--json]
+
+Runtime: Python 3.10
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from kb_spelling import SpellingIndex, edit_distance, max_edits  # noqa: E402
+
+ONSETS = ('b', 'c', 'd', 'f', 'g', 'l', 'm', 'n', 'p', 'r', 's', 't', 'v', 'st', 'tr', 'pl', 'cr', 'sh')
+VOWELS = ('a', 'e', 'i', 'o', 'u', 'ea', 'io')
+CODAS = ('', '', 'n', 'r', 's', 't', 'm', 'nd')
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+class VocabularyIndex:
+    """
+    Stand-in for an InvertedIndex: just a vocabulary and document frequencies.
+    """
+
+    def __init__(self, doc_freqs):
+        self.vocabulary = {term: term_id for term_id, term in enumerate(doc_freqs)}
+        self.doc_freqs = doc_freqs
+
+    def doc_freq(self, term):
+        return self.doc_freqs[term]
+
+
+def make_vocabulary(size, rng):
+    """
+    Pronounceable pseudo-words of 1-5 syllables with Zipf-like document frequencies.
+    """
+    terms = set()
+    while len(terms) < size:
+        terms.add(''.join(rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS)
+                          for _ in range(rng.randint(1, 5))))
+    return {term: max(1, int(1000 / rank)) for rank, term in enumerate(sorted(terms, key=lambda _: rng.random()), 1)}
+
+
+def misspell(term, rng):
+    """
+    One random insertion, deletion, substitution or transposition.
+    """
+    i = rng.randrange(len(term))
+    edit = rng.choice(('insert', 'delete', 'substitute', 'transpose'))
+    if edit == 'insert':
+        return term[:i] + rng.choice(LETTERS) + term[i:]
+    if edit == 'delete' and len(term) > 1:
+        return term[:i] + term[i + 1:]
+    if edit == 'transpose' and i < len(term) - 1:
+        return term[:i] + term[i + 1] + term[i] + term[i + 2:]
+    return term[:i] + rng.choice(LETTERS) + term[i + 1:]
+
+
+def linear_correct(terms, doc_freqs, term):
+    """
+    Closest term by scanning the whole vocabulary.
+    """
+    limit = max_edits(term)
+    best = None
+    for candidate in terms:
+        if abs(len(candidate) - len(term)) <= limit:
+            distance = edit_distance(term, candidate, limit)
+            if distance <= limit:
+                key = (distance, -doc_freqs[candidate], candidate)
+                best = key if best is None or key < best else best
+    return best[2] if best else term
+
+
+def cpu_per_lookup(func, queries):
+    """
+    Mean CPU time of func(query) over queries, in microseconds.
+    """
+    started = time.process_time()
+    for query in queries:
+        func(query)
+    return (time.process_time() - started) / len(queries) * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Vocabulary sizes')
+    parser.add_argument('--queries', type=int, default=500, help='Lookups per measurement')
+    parser.add_argument('--linear-queries', type=int, default=50, help='Lookups for the linear scan')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    results = []
+    for size in args.sizes:
+        doc_freqs = make_vocabulary(size, rng)
+        terms = sorted(doc_freqs)
+
+        started = time.process_time()
+        spelling = SpellingIndex.build([VocabularyIndex(doc_freqs)])
+        build_s = time.process_time() - started
+
+        pairs = [(term, misspell(term, rng)) for term in rng.sample(terms, args.queries)]
+        pairs = [(term, typo) for term, typo in pairs if len(typo) >= 4 and typo not in spelling]
+        misspelled = [typo for _, typo in pairs]
+        unknown = [''.join(rng.choice(LETTERS) for _ in range(rng.randint(4, 12))) for _ in range(args.queries)]
+
+        recovered = sum(spelling.correct(typo) == term for term, typo in pairs) / len(pairs)
+        for term in misspelled[:args.linear_queries]:
+            assert spelling.correct(term) == linear_correct(terms, doc_freqs, term), term
+
+        results.append({
+            'vocabulary': size,
+            'build_s': round(build_s, 3),
+            'bigram_keys': len(spelling.postings),
+            'recovered_share': round(recovered, 3),
+            'misspelled_us': round(cpu_per_lookup(spelling.correct, misspelled), 1),
+            'unknown_us': round(cpu_per_lookup(spelling.correct, unknown), 1),
+            'linear_scan_us': round(cpu_per_lookup(
+                lambda term: linear_correct(terms, doc_freqs, term), misspelled[:args.linear_queries]), 1),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"  {'vocabulary':>10s} {'build s':>8s} {'bigrams':>8s} {'recovered':>10s}"
+          f" {'typo µs':>9s} {'unknown µs':>11s} {'linear µs':>10s}")
+    for row in results:
+        print(f"  {row['vocabulary']:10d} {row['build_s']:8.3f} {row['bigram_keys']:8d} {row['recovered_share']:10.1%}"
+              f" {row['misspelled_us']:9.1f} {row['unknown_us']:11.1f} {row['linear_scan_us']:10.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
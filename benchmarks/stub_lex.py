@@ -0,0 +1,132 @@
+"""
+Local stub of the Lex V2 RecognizeText endpoint
+
+Answers RecognizeText requests with an echo reply, with configurable
+latency and a share of throttled (429), failed (500) or hanging requests.
+This exercises the proxy's timeouts, retries and circuit breaker without
+AWS:
+
+    python benchmarks/stub_lex.py --port 8099 --throttle-rate 0.5 &
+    cd src_proxy
+    AWS_ACCESS_KEY_ID=stub AWS_SECRET_ACCESS_KEY=stub AWS_DEFAULT_REGION=us-east-1 \\
+        LEX_ENDPOINT_URL=http://127.0.0.1:8099 python -c \\
+        "import app; print(app.lambda_handler({'body': '{\\"message\\": \\"hi\\", \\"user_id\\": \\"u1\\"}'}, None))"
+
+Usage:
+    python benchmarks/stub_lex.py [--port 8099] [--latency-ms 20] [--throttle-rate 0]
+                                  [--error-rate 0] [--hang-rate 0] [--hang-seconds 60]
+
+Runtime: Python 3.10
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RECOGNIZE_TEXT_PATH = re.compile(
+    r'^/bots/(?P<bot>[^/]+)/botAliases/(?P<alias>[^/]+)/botLocales/(?P<locale>[^/]+)'
+    r'/sessions/(?P<session>[^/]+)/text$'
+)
+
+
+class StubLexHandler(BaseHTTPRequestHandler):
+    """
+    RecognizeText handler; behaviour comes from the server's settings.
+    """
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real endpoint
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        match = RECOGNIZE_TEXT_PATH.match(self.path)
+        if match is None:
+            self.send_json(404, {'message': f"Unknown path {self.path}"}, 'ResourceNotFoundException')
+            return
+
+        settings = self.server.settings
+        stats = self.server.stats
+        roll = random.random()
+        with self.server.lock:
+            stats['requests'] += 1
+
+        if roll < settings.hang_rate:
+            with self.server.lock:
+                stats['hung'] += 1
+            time.sleep(settings.hang_seconds)
+            return
+        roll -= settings.hang_rate
+
+        time.sleep(settings.latency_ms / 1000.0)
+
+        if roll < settings.throttle_rate:
+            with self.server.lock:
+                stats['throttled'] += 1
+            self.send_json(429, {'message': 'Rate exceeded'}, 'ThrottlingException')
+            return
+        roll -= settings.throttle_rate
+
+        if roll < settings.error_rate:
+            with self.server.lock:
+                stats['failed'] += 1
+            self.send_json(500, {'message': 'Internal failure'}, 'InternalFailureException')
+            return
+
+        text = json.loads(body or b'{}').get('text', '')
+        self.send_json(200, {
+            'messages': [{'contentType': 'PlainText', 'content': f"stub reply to: {text}"}],
+            'sessionState': {
+                'dialogAction': {'type': 'Close'},
+                'intent': {'name': 'FallbackIntent', 'state': 'Fulfilled'}
+            },
+            'sessionId': match.group('session')
+        })
+
+    def send_json(self, status, payload, error_type=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if error_type:
+            self.send_header('x-amzn-ErrorType', error_type)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency-ms', type=float, default=20, help='Delay before every answer')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='Share of requests answered 429')
+    parser.add_argument('--error-rate', type=float, default=0, help='Share of requests answered 500')
+    parser.add_argument('--hang-rate', type=float, default=0, help='Share of requests never answered')
+    parser.add_argument('--hang-seconds', type=float, default=60, help='How long a hanging request hangs')
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer((args.host, args.port), StubLexHandler)
+    server.daemon_threads = True
+    server.settings = args
+    server.stats = {'requests': 0, 'throttled': 0, 'failed': 0, 'hung': 0}
+    server.lock = threading.Lock()
+
+    print(f"Stub Lex listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,20 +10,33 @@ NO IF/ELSE STATEMENTS - Uses intelligent PDF search!
 Runtime: Python 3.10
 """
 
-import json
+import copy
+import gc
 import os
 import boto3
 from botocore.exceptions import ClientError
 import re
-from io import BytesIO
+import threading
+import time
 
-# Import PDF reader
-try:
-    from PyPDF2 import PdfReader
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
-    print("PyPDF2 not available")
+from kb_artifact import ArtifactError, artifact_key_for, load_artifact, load_artifact_index, matches_source
+from kb_dense import NUMPY_AVAILABLE, RETRIEVAL_MODES
+from kb_index import tokenize
+from kb_pages import PageStore
+from kb_passages import build_passage_index
+from kb_text import clean_pdf_text
+from knowledge_base import KbDocument, KnowledgeBase
+from lazy_pdf import LazyPdfPages, S3RangeReader
+from metrics import annotate, span, start_invocation, timed
+from session_history import ENCODINGS, encode_turn
+from structured_log import log
+from ttl_cache import MISSING, TTLCache
+from pdf_extract import (
+    PDF_AVAILABLE,
+    extract_pdf_pages,
+    extract_pdf_pages_parallel,
+    resolve_worker_count
+)
 
 # Initialize AWS clients
 dynamodb = boto3.resource('dynamodb')
@@ -36,10 +49,78 @@ AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
 # PDF Knowledge Base Configuration
 PDF_S3_BUCKET = os.environ.get('PDF_S3_BUCKET', '')  # S3 bucket with PDF
 PDF_S3_KEY = os.environ.get('PDF_S3_KEY', 'aws_knowledge_base.pdf')  # PDF file name
+PDF_S3_PREFIX = os.environ.get('PDF_S3_PREFIX', '')  # Index every PDF under this prefix instead
+KB_REFRESH_SECONDS = int(os.environ.get('KB_REFRESH_SECONDS', '300'))  # How often to look for changed PDFs
 USE_PDF_KB = os.environ.get('USE_PDF_KB', 'true').lower() == 'true'
 
-# Cache for PDF content (loaded once per Lambda container)
-PDF_CONTENT_CACHE = None
+# Prebuilt artifact (python -m kb_artifact) stored next to the PDF
+PDF_INDEX_S3_KEY = os.environ.get('PDF_INDEX_S3_KEY', artifact_key_for(PDF_S3_KEY))
+PDF_INDEX_LOCAL_DIR = os.environ.get('PDF_INDEX_LOCAL_DIR', '/tmp/kb_artifacts')
+
+# Worker processes for PyPDF2 extraction ('1' = sequential, 'auto' = one per vCPU)
+PDF_EXTRACT_WORKERS = resolve_worker_count(os.environ.get('PDF_EXTRACT_WORKERS', '1'))
+
+# Lazy mode for very large PDFs: ranged S3 reads, pages extracted on demand
+PDF_LAZY_LOAD = os.environ.get('PDF_LAZY_LOAD', 'false').lower() == 'true'
+PDF_LAZY_BLOCK_SIZE = int(os.environ.get('PDF_LAZY_BLOCK_SIZE', str(256 * 1024)))  # bytes per ranged GET
+PDF_LAZY_MAX_BLOCKS = int(os.environ.get('PDF_LAZY_MAX_BLOCKS', '64'))  # cached S3 blocks
+PDF_LAZY_MAX_PAGES = int(os.environ.get('PDF_LAZY_MAX_PAGES', '64'))  # cached extracted pages
+
+# Cache for the indexed PDFs (loaded once per Lambda container, refreshed incrementally)
+KNOWLEDGE_BASE = None
+KNOWLEDGE_BASE_LOCK = threading.Lock()  # one load or refresh at a time
+
+# Knowledge base loading during the init phase:
+#   'off'        - the first FallbackIntent request loads it
+#   'background' - a thread starts loading at import; requests that need it wait for it
+#   'init'       - import blocks until it is loaded (provisioned concurrency, SnapStart)
+#   'auto'       - 'init' for provisioned concurrency / SnapStart environments, else 'background'
+KB_EAGER_LOAD = os.environ.get('KB_EAGER_LOAD', 'off').lower()
+KB_WARMUP_THREAD = None
+
+# Passage ranking: 'keyword' (BM25), 'dense' (hashed n-gram embeddings) or 'hybrid' (both blended)
+KB_RETRIEVAL_MODE = os.environ.get('KB_RETRIEVAL_MODE', 'keyword').lower()
+KB_DENSE_WEIGHT = float(os.environ.get('KB_DENSE_WEIGHT', '0.3'))  # share of the dense score in hybrid mode
+
+# Answers quote the best passage; above 1, up to this many non-overlapping
+# passages (from any page or document) are joined within ANSWER_MAX_CHARS
+ANSWER_SNIPPETS = max(1, int(os.environ.get('ANSWER_SNIPPETS', '1')))
+ANSWER_MAX_CHARS = int(os.environ.get('ANSWER_MAX_CHARS', '2000'))  # the best passage is always kept
+ANSWER_CANDIDATES = 3 * ANSWER_SNIPPETS if ANSWER_SNIPPETS > 1 else 1  # passages ranked per answer
+
+# Answers keyed by normalized keyword set + knowledge base version
+ANSWER_CACHE_SIZE = int(os.environ.get('ANSWER_CACHE_SIZE', '512'))  # 0 disables the cache
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get('ANSWER_CACHE_TTL_SECONDS', '600'))
+ANSWER_CACHE = TTLCache(max_entries=ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_CACHE_TTL_SECONDS)
+
+# Session store: 'put' reads and rewrites the whole item every turn,
+# 'update' appends the turn with a single UpdateItem and never reads
+SESSION_STORE_MODE = os.environ.get('SESSION_STORE_MODE', 'put').lower()
+SESSION_HISTORY_LIMIT = int(os.environ.get('SESSION_HISTORY_LIMIT', '10'))  # turns kept per session
+SESSION_HISTORY_ENCODING = os.environ.get('SESSION_HISTORY_ENCODING', 'full').lower()  # full, compressed or digest
+SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', '0'))  # expires_at = last turn + this; 0 disables
+
+# Sessions this container wrote, keyed by session_id, so the next turn's read
+# is served locally; every write is guarded by the item's version number
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '256'))  # 0 disables the cache
+SESSION_CACHE_TTL_SECONDS = int(os.environ.get('SESSION_CACHE_TTL_SECONDS', '300'))
+SESSION_CACHE = TTLCache(max_entries=SESSION_CACHE_SIZE, ttl_seconds=SESSION_CACHE_TTL_SECONDS)
+SESSION_CONFLICT_RETRIES = int(os.environ.get('SESSION_CONFLICT_RETRIES', '2'))
+SESSION_WRITE_STATS = {'conflicts': 0, 'conflicts_unresolved': 0}
+
+if SESSION_HISTORY_ENCODING not in ENCODINGS:
+    log.warning("✗ Unknown SESSION_HISTORY_ENCODING '%s', storing full history", SESSION_HISTORY_ENCODING)
+    SESSION_HISTORY_ENCODING = 'full'
+
+if KB_RETRIEVAL_MODE not in RETRIEVAL_MODES:
+    log.warning("✗ Unknown KB_RETRIEVAL_MODE '%s', using keyword retrieval", KB_RETRIEVAL_MODE)
+    KB_RETRIEVAL_MODE = 'keyword'
+elif KB_RETRIEVAL_MODE != 'keyword' and not NUMPY_AVAILABLE:
+    log.warning("✗ KB_RETRIEVAL_MODE '%s' needs NumPy, using keyword retrieval", KB_RETRIEVAL_MODE)
+    KB_RETRIEVAL_MODE = 'keyword'
+
+NOT_FOUND_MESSAGE = ("I couldn't find information about '{question}' in the knowledge base. "
+                     "Could you rephrase your question?")
 
 # Initialize DynamoDB table
 table = dynamodb.Table(TABLE_NAME)
@@ -49,261 +130,636 @@ table = dynamodb.Table(TABLE_NAME)
 # PDF KNOWLEDGE BASE - NO IF/ELSE STATEMENTS!
 # ============================================================================
 
-def load_pdf_from_s3():
+def load_knowledge_base():
     """
-    Load PDF from S3 and cache it in memory.
-    Only loads once per Lambda container for performance.
-    Optimized for large PDFs.
+    Load the knowledge base from S3, or incrementally refresh a cached one.
+    
+    Loads once per Lambda container, then re-lists S3 at most every
+    KB_REFRESH_SECONDS: only PDFs whose ETag changed are re-indexed, new ones
+    are added and deleted ones dropped. Unchanged documents keep their
+    in-memory index.
+    
+    Returns:
+        KnowledgeBase: The cached knowledge base
     """
-    global PDF_CONTENT_CACHE
+    if KNOWLEDGE_BASE is not None and time.time() - KNOWLEDGE_BASE.refreshed_at < KB_REFRESH_SECONDS:
+        log.debug("✓ Using cached knowledge base")
+        return KNOWLEDGE_BASE
     
-    if PDF_CONTENT_CACHE is not None:
-        print("✓ Using cached PDF content")
-        return PDF_CONTENT_CACHE
+    # A warm-up thread (or another request thread) may be loading already
+    if not KNOWLEDGE_BASE_LOCK.acquire(blocking=False):
+        log.info("→ Waiting for the knowledge base load in progress")
+        started = time.perf_counter()
+        KNOWLEDGE_BASE_LOCK.acquire()
+        annotate(kb_wait_ms=round((time.perf_counter() - started) * 1000.0, 1))
+    
+    try:
+        if KNOWLEDGE_BASE is not None and time.time() - KNOWLEDGE_BASE.refreshed_at < KB_REFRESH_SECONDS:
+            return KNOWLEDGE_BASE
+        return sync_knowledge_base()
+    finally:
+        KNOWLEDGE_BASE_LOCK.release()
+
+
+def sync_knowledge_base():
+    """
+    Load or refresh KNOWLEDGE_BASE from S3. Call with KNOWLEDGE_BASE_LOCK held.
+    
+    Returns:
+        KnowledgeBase: The loaded knowledge base
+    """
+    global KNOWLEDGE_BASE
     
     if not PDF_S3_BUCKET:
         raise Exception("PDF_S3_BUCKET not configured")
     
+    knowledge_base = KNOWLEDGE_BASE or KnowledgeBase(KB_RETRIEVAL_MODE, KB_DENSE_WEIGHT)
+    action = 'refreshed' if KNOWLEDGE_BASE is not None else 'loaded'
+    
     try:
-        print(f"→ Loading PDF from S3: s3://{PDF_S3_BUCKET}/{PDF_S3_KEY}")
-        
-        # Download PDF from S3
-        response = s3_client.get_object(Bucket=PDF_S3_BUCKET, Key=PDF_S3_KEY)
-        pdf_bytes = response['Body'].read()
-        
-        print(f"→ PDF downloaded: {len(pdf_bytes)} bytes")
+        started = time.perf_counter()
         
-        # Read PDF
-        pdf_reader = PdfReader(BytesIO(pdf_bytes))
-        total_pages = len(pdf_reader.pages)
+        listing = list_knowledge_base_pdfs()
+        loaded, removed, failed = knowledge_base.sync(listing, load_pdf_from_s3)
+        if failed and not len(knowledge_base):
+            raise Exception(f"no PDF could be loaded ({len(failed)} failed)")
         
-        print(f"→ Extracting text from {total_pages} pages...")
+        # Cached answers may come from documents that just changed
+        if loaded or removed:
+            ANSWER_CACHE.clear()
         
-        # Extract all text from all pages (with progress logging)
-        all_text = []
-        for page_num, page in enumerate(pdf_reader.pages):
-            if page_num % 10 == 0:  # Log progress every 10 pages
-                print(f"→ Processing page {page_num + 1}/{total_pages}")
-            
-            text = page.extract_text()
-            if text and text.strip():  # Only add pages with actual content
-                all_text.append({
-                    'page': page_num + 1,
-                    'content': text
-                })
+        if (loaded or removed) and knowledge_base.dense is not None:
+            log.info("→ Dense index (%s): %d passages, %.1f MB%s", knowledge_base.retrieval_mode,
+                     len(knowledge_base.dense.vectors), knowledge_base.dense.nbytes / 1e6,
+                     ", IVF partitioned" if knowledge_base.dense.centroids is not None else "")
         
-        PDF_CONTENT_CACHE = all_text
-        print(f"✓ PDF loaded successfully: {len(all_text)} pages with content (from {total_pages} total)")
-        return all_text
+        KNOWLEDGE_BASE = knowledge_base
+        log.info("✓ Knowledge base %s in %.2fs: %d loaded, %d removed, %d failed, %d unchanged (version %d)",
+                 action, time.perf_counter() - started, len(loaded), len(removed), len(failed),
+                 len(set(knowledge_base.documents) - set(loaded) - set(failed)), knowledge_base.version)
+        return knowledge_base
         
     except Exception as e:
-        print(f"✗ Error loading PDF: {str(e)}")
+        log.error("✗ Error loading knowledge base: %s", e)
+        
+        # A warm container keeps answering from what it already has
+        if KNOWLEDGE_BASE is not None:
+            KNOWLEDGE_BASE.refreshed_at = time.time()
+            return KNOWLEDGE_BASE
         raise
 
 
-def search_pdf_for_answer(question, pdf_content):
+def warm_up_knowledge_base():
     """
-    Intelligently search PDF for answer to question.
-    NO IF/ELSE STATEMENTS - uses keyword matching and scoring!
+    Load the knowledge base ahead of the first request that needs it.
+    
+    A failure is only logged: the first FallbackIntent request loads again.
+    """
+    try:
+        with span('kb_warmup'):
+            load_knowledge_base()
+    except Exception as e:
+        log.warning("✗ Knowledge base warm-up failed, loading on first use instead: %s", e)
+
+
+def start_knowledge_base_warmup(mode=KB_EAGER_LOAD):
+    """
+    Start loading the knowledge base during the init phase, per KB_EAGER_LOAD.
+    
+    'init' loads before import returns, so provisioned concurrency and
+    SnapStart environments are ready (and snapshotted) with the corpus in
+    memory. 'background' overlaps the load with the first invocation:
+    greetings never wait for it, and a FallbackIntent request only waits
+    for whatever is left of it (see load_knowledge_base).
     
     Args:
-        question (str): User's question
-        pdf_content (list): PDF pages with content
+        mode (str): 'off', 'background', 'init' or 'auto'
+    """
+    global KB_WARMUP_THREAD
+    
+    if mode == 'auto':
+        initialization_type = os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE', 'on-demand')
+        mode = 'init' if initialization_type in ('provisioned-concurrency', 'snap-start') else 'background'
+    
+    if mode not in ('background', 'init'):
+        if mode != 'off':
+            log.warning("✗ Unknown KB_EAGER_LOAD '%s', loading on first use", mode)
+        return
+    
+    if not (USE_PDF_KB and PDF_S3_BUCKET):
+        return
+    
+    log.info("→ Knowledge base warm-up (%s)", mode)
+    if mode == 'init':
+        warm_up_knowledge_base()
+        return
+    
+    KB_WARMUP_THREAD = threading.Thread(target=warm_up_knowledge_base, name='kb-warmup', daemon=True)
+    KB_WARMUP_THREAD.start()
+
+
+def list_knowledge_base_pdfs():
+    """
+    List the PDFs that make up the knowledge base with their ETags.
+    
+    Returns:
+        dict: S3 key -> ETag, for every PDF under PDF_S3_PREFIX, or just
+              PDF_S3_KEY when no prefix is configured
+    """
+    if not PDF_S3_PREFIX:
+        response = s3_client.head_object(Bucket=PDF_S3_BUCKET, Key=PDF_S3_KEY)
+        return {PDF_S3_KEY: response['ETag'].strip('"')}
+    
+    listing = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=PDF_S3_BUCKET, Prefix=PDF_S3_PREFIX):
+        for item in page.get('Contents', []):
+            if item['Key'].lower().endswith('.pdf'):
+                listing[item['Key']] = item['ETag'].strip('"')
+    
+    log.info("→ Found %d PDFs under s3://%s/%s", len(listing), PDF_S3_BUCKET, PDF_S3_PREFIX)
+    return listing
+
+
+@timed('load_pdf_from_s3')
+def load_pdf_from_s3(key, etag):
+    """
+    Load one PDF of the knowledge base from S3.
+    
+    Uses the prebuilt artifact (see kb_artifact.py) when one exists next to
+    the PDF and falls back to PyPDF2 extraction otherwise. Either way the
+    document carries the inverted index used by search_pdf_for_answer().
+    
+    In lazy mode (PDF_LAZY_LOAD) nothing is extracted up front: the pages are
+    a LazyPdfPages sequence read through S3 ranged GETs.
+    
+    Args:
+        key (str): S3 key of the PDF
+        etag (str): Current ETag of the PDF
         
     Returns:
-        str: Best matching answer from PDF
+        KbDocument: The loaded document
     """
+    started = time.perf_counter()
     
-    # Extract keywords from question (simple but effective)
-    keywords = extract_keywords(question)
+    if PDF_LAZY_LOAD:
+        # Lazy path: ranged reads, pages extracted on demand
+        pages, passages, pdf_index = load_lazy_pdf_from_s3(key, etag)
+        load_path = 'lazy'
+    else:
+        # Fast path: memory-map the prebuilt artifact, else extract with PyPDF2
+        loaded = load_kb_artifact_from_s3(key, etag)
+        load_path = 'artifact' if loaded is not None else 'pypdf2'
+        pages, passages, pdf_index = loaded if loaded is not None else extract_pdf_from_s3(key)
     
-    print(f"→ Searching PDF for keywords: {keywords}")
+    annotate(load_path=load_path, pages=len(pages))
+    indexed = f", {len(passages)} passages, {len(pdf_index.vocabulary)} terms" if pdf_index is not None else ""
+    log.info("✓ Loaded s3://%s/%s via %s in %.2fs (%d pages%s)",
+             PDF_S3_BUCKET, key, load_path, time.perf_counter() - started, len(pages), indexed)
+    return KbDocument(key, etag, pages, passages, pdf_index)
+
+
+def extract_pdf_from_s3(key):
+    """
+    Download a PDF, extract and clean every page with PyPDF2 and index its passages.
     
-    # Score each page based on keyword matches
-    page_scores = []
-    for page_data in pdf_content:
-        page_text = page_data['content'].lower()
-        score = 0
+    Args:
+        key (str): S3 key of the PDF
         
-        # Count keyword occurrences
-        for keyword in keywords:
-            score += page_text.count(keyword.lower())
+    Returns:
+        tuple: (pages, passages, index)
         
-        if score > 0:
-            page_scores.append({
-                'page': page_data['page'],
-                'score': score,
-                'content': page_data['content']
-            })
+    Raises:
+        Exception: If PyPDF2 is not installed
+    """
+    if not PDF_AVAILABLE:
+        raise Exception(f"PyPDF2 is not installed and s3://{PDF_S3_BUCKET}/{key} has no prebuilt artifact")
     
-    # Sort by score (highest first)
-    page_scores.sort(key=lambda x: x['score'], reverse=True)
+    log.debug("→ Loading PDF from S3: s3://%s/%s", PDF_S3_BUCKET, key)
     
-    if not page_scores:
-        return f"I couldn't find information about '{question}' in the knowledge base. Could you rephrase your question?"
+    with span('s3_download', key=key):
+        response = s3_client.get_object(Bucket=PDF_S3_BUCKET, Key=key)
+        pdf_bytes = response['Body'].read()
     
-    # Get the best matching page
-    best_match = page_scores[0]
+    log.debug("→ PDF downloaded: %d bytes", len(pdf_bytes))
     
-    # Extract relevant section (around the keywords)
-    answer = extract_relevant_section(best_match['content'], keywords)
+    # Pages are cleaned once here so answers never need per-request cleanup
+    # Opt-in: spread extraction across vCPUs (PDF_EXTRACT_WORKERS)
+    with span('pdf_extract', workers=PDF_EXTRACT_WORKERS):
+        if PDF_EXTRACT_WORKERS > 1:
+            all_text = extract_pdf_pages_parallel(pdf_bytes, PDF_EXTRACT_WORKERS, clean=clean_pdf_text)
+        else:
+            all_text = extract_pdf_pages(pdf_bytes, clean=clean_pdf_text)
     
-    # Add helpful context
-    answer_with_context = f"{answer}\n\n(Source: Page {best_match['page']} of knowledge base)"
+    # PyPDF2's reader is a web of reference cycles: free it before indexing
+    del pdf_bytes, response
+    gc.collect()
     
-    print(f"✓ Found answer on page {best_match['page']} (score: {best_match['score']})")
+    # Chunk and index passages once so queries only touch postings of their own terms
+    with span('build_passage_index'):
+        passages, pdf_index = build_passage_index(all_text)
     
-    return answer_with_context
+    # Keep the text as one UTF-8 buffer, not a dict and a str per page
+    return PageStore.from_pages(all_text), passages, pdf_index
 
 
-def extract_keywords(text):
+def load_kb_artifact_from_s3(key, etag, index_only=False):
     """
-    Extract important keywords from question.
-    Removes common words, keeps important terms.
+    Download and memory-map the prebuilt artifact of a PDF.
+    
+    Args:
+        key (str): S3 key of the PDF
+        etag (str): Current ETag of the PDF, to reject stale artifacts
+        index_only (bool): Skip page texts and return page numbers instead
+        
+    Returns:
+        tuple: (pages, passages, index) - or (page_numbers, passages, index,
+               page_refs) when index_only - or None when no usable artifact exists
     """
-    # Common words to ignore
-    stop_words = {'what', 'is', 'are', 'the', 'a', 'an', 'how', 'do', 'does', 
-                  'can', 'tell', 'me', 'about', 'explain', 'describe', 'in', 'to',
-                  'for', 'of', 'and', 'or', 'it', 'this', 'that', 'i', 'you'}
+    artifact_key = PDF_INDEX_S3_KEY if key == PDF_S3_KEY else artifact_key_for(key)
+    local_path = os.path.join(PDF_INDEX_LOCAL_DIR, re.sub(r'[^A-Za-z0-9._-]', '_', artifact_key))
     
-    # Split into words and clean
-    words = re.findall(r'\b[a-z0-9]+\b', text.lower())
+    try:
+        os.makedirs(PDF_INDEX_LOCAL_DIR, exist_ok=True)
+        s3_client.download_file(PDF_S3_BUCKET, artifact_key, local_path)
+    except ClientError as e:
+        log.info("→ No prebuilt artifact at s3://%s/%s (%s), extracting from the PDF",
+                 PDF_S3_BUCKET, artifact_key, e.response['Error'].get('Code', 'Unknown'))
+        return None
     
-    # Keep important words
-    keywords = [w for w in words if w not in stop_words and len(w) > 2]
+    try:
+        if index_only:
+            pages, passages, pdf_index, metadata, page_refs = load_artifact_index(local_path)
+        else:
+            pages, passages, pdf_index, metadata = load_artifact(local_path)
+    except ArtifactError as e:
+        log.warning("✗ Ignoring prebuilt artifact: %s", e)
+        return None
     
-    return keywords if keywords else [text.lower()]
+    # A stale artifact would answer from an older PDF - check it was built from this one
+    matches = matches_source(metadata, etag)
+    if matches is False:
+        log.warning("✗ Ignoring stale artifact (built from ETag %s, PDF is %s)",
+                    metadata.get('etag') or metadata.get('etags'), etag)
+        return None
+    if matches is None and etag:
+        log.warning("✗ Ignoring artifact s3://%s/%s: it records no source ETag to check against %s; "
+                    "rebuild it", PDF_S3_BUCKET, artifact_key, etag)
+        return None
+    
+    if not pdf_index.positional:
+        log.warning("✗ Artifact s3://%s/%s has no token positions; rebuild it to enable phrase scoring",
+                    PDF_S3_BUCKET, artifact_key)
+    
+    log.info("✓ Memory-mapped prebuilt artifact s3://%s/%s", PDF_S3_BUCKET, artifact_key)
+    if index_only:
+        if page_refs is None:
+            log.warning("✗ Artifact s3://%s/%s has no page references; rebuild it so lazy mode "
+                        "reads single pages", PDF_S3_BUCKET, artifact_key)
+        return pages, passages, pdf_index, page_refs
+    return pages, passages, pdf_index
 
 
-def extract_relevant_section(page_content, keywords, context_chars=1200):
+def load_lazy_pdf_from_s3(key, etag):
     """
-    Extract the most relevant section from page based on keywords.
-    Returns clean, readable text with proper formatting.
+    Open a PDF for on-demand page extraction through S3 ranged GETs.
+    
+    The artifact's index (if any) decides which pages get extracted, and its
+    page references let each of them be read on its own; page text itself
+    always comes from the PDF and is kept in a bounded LRU. It is cleaned the
+    same way the artifact builder cleans it, so passage offsets from the
+    artifact line up.
+    
+    Args:
+        key (str): S3 key of the PDF
+        etag (str): Current ETag of the PDF
+        
+    Returns:
+        tuple: (LazyPdfPages, passages or None, index or None)
+        
+    Raises:
+        Exception: If PyPDF2 is not installed (page text comes from the PDF)
     """
-    page_lower = page_content.lower()
+    if not PDF_AVAILABLE:
+        raise Exception("PyPDF2 is not installed, which lazy mode (PDF_LAZY_LOAD) needs to read pages")
     
-    # Find first occurrence of any keyword
-    earliest_pos = len(page_content)
-    best_keyword = None
-    for keyword in keywords:
-        pos = page_lower.find(keyword.lower())
-        if pos != -1 and pos < earliest_pos:
-            earliest_pos = pos
-            best_keyword = keyword
+    loaded = load_kb_artifact_from_s3(key, etag, index_only=True)
     
-    # If no keywords found, return beginning
-    if earliest_pos == len(page_content):
-        section = page_content[:context_chars]
-        start = 0
+    log.debug("→ Opening PDF lazily: s3://%s/%s", PDF_S3_BUCKET, key)
+    stream = S3RangeReader(
+        s3_client,
+        PDF_S3_BUCKET,
+        key,
+        block_size=PDF_LAZY_BLOCK_SIZE,
+        max_blocks=PDF_LAZY_MAX_BLOCKS
+    )
+    
+    if loaded is not None:
+        page_numbers, passages, pdf_index, page_refs = loaded
     else:
-        # Find start of sentence before keyword (look backwards for sentence start)
-        start = earliest_pos
-        # Look backwards for sentence boundaries
-        for i in range(max(0, earliest_pos - 200), earliest_pos):
-            if page_content[i:i+2] in ['. ', '.\n', '? ', '! '] or i == 0:
-                start = i + 2 if i > 0 else 0
-                break
+        page_numbers, passages, pdf_index, page_refs = None, None, None, None
+    
+    pages = LazyPdfPages(stream, page_numbers, max_pages=PDF_LAZY_MAX_PAGES, clean=clean_pdf_text,
+                         page_refs=page_refs)
+    log.info("→ PDF opened: %d bytes, %d ranged reads (%d bytes) so far",
+             stream.size, stream.range_requests, stream.bytes_fetched)
+    return pages, passages, pdf_index
+
+
+def select_lazy_pages(keywords, knowledge_base):
+    """
+    Pick the pages of lazy, unindexed documents worth extracting.
+    
+    Outline (bookmark) titles that mention a query keyword point at their
+    sections, which are indexed just for this query. If none match, every
+    page of the document is indexed once - streaming through the page LRU -
+    and that index is kept for the rest of the container.
+    
+    Args:
+        keywords (list): Keywords from extract_keywords()
+        knowledge_base (KnowledgeBase): The knowledge base
         
-        # Extract to end position
-        end = min(len(page_content), start + context_chars)
-        section = page_content[start:end]
+    Returns:
+        list: KbDocuments to search, or None when every document is indexed
+    """
+    if all(document.index is not None for document in knowledge_base.documents.values()):
+        return None
     
-    # Clean up the text for better readability
-    section = clean_pdf_text(section)
+    documents = []
+    for document in knowledge_base.documents.values():
+        if document.index is None:
+            hinted = document.pages.hinted(keywords)
+            if hinted:
+                log.debug("→ Outline hints selected pages %s of %s",
+                          [page_data['page'] for page_data in hinted], document.title)
+                passages, hinted_index = build_passage_index(hinted)
+                document = KbDocument(document.source, document.etag, PageStore.from_pages(hinted),
+                                      passages, hinted_index)
+            else:
+                log.info("→ No outline hints matched; indexing every page of %s once "
+                         "(build an --index-only artifact to avoid this)", document.title)
+                document.passages, document.index = build_passage_index(document.pages)
+        documents.append(document)
     
-    # Try to end at sentence boundary
-    section = trim_to_sentence(section)
+    return documents
+
+
+@timed('search_pdf_for_answer')
+def search_pdf_for_answer(question, knowledge_base, documents=None):
+    """
+    Intelligently search PDF for answer to question.
+    NO IF/ELSE STATEMENTS - uses BM25 ranking over an inverted index!
     
-    # Ensure it starts with capital letter (proper sentence start)
-    if section and section[0].islower():
-        # Find first capital letter or sentence start
-        for i, char in enumerate(section):
-            if char.isupper() or (i > 0 and section[i-2:i] in ['. ', '.\n']):
-                section = section[i:]
-                break
+    Args:
+        question (str): User's question
+        knowledge_base (KnowledgeBase): Indexed PDFs to search
+        documents (list): Subset of documents to search (default: all)
+        
+    Returns:
+        str: Best matching answer from PDF
+    """
+    
+    # Extract keywords from question (simple but effective)
+    keywords = extract_keywords(question)
     
-    return section.strip()
+    answer = find_answer(keywords, knowledge_base, documents)
+    
+    if answer is None:
+        return NOT_FOUND_MESSAGE.format(question=question)
+    
+    return answer
 
 
-def clean_pdf_text(text):
+def find_answer(keywords, knowledge_base, documents=None):
     """
-    Clean up PDF-extracted text for better readability.
-    Fixes formatting issues, bullets, and line breaks.
+    Find the best answer for a set of query keywords.
+    
+    Args:
+        keywords (list): Keywords from extract_keywords()
+        knowledge_base (KnowledgeBase): Indexed PDFs to search
+        documents (list): Subset of documents to search (default: all)
+        
+    Returns:
+        str: Answer with its source(s), or None when nothing matches
     """
-    # Remove multiple spaces
-    text = re.sub(r' +', ' ', text)
+    log.debug("→ Searching PDF for keywords: %s", keywords)
     
-    # Fix bullets - convert weird bullet characters to proper bullets
-    text = re.sub(r'[•▪▫◦⚫⚬○●]', '• ', text)
+    # Rank passages with BM25, then re-rank the best by phrase and term
+    # proximity - only postings of the query terms are visited
+    terms = query_terms(keywords)
+    if not terms:
+        log.debug("→ No content terms in keywords %s", keywords)
+        return None
     
-    # Fix line breaks around bullets
-    text = re.sub(r'\n+•', '\n• ', text)
+    # Misspelled terms match no postings: map them to the closest corpus term
+    with span('correct_terms'):
+        corrected = knowledge_base.correct_terms(terms)
+    if corrected != terms:
+        log.info("→ Corrected query terms %s to %s", terms, corrected)
+        annotate(corrected_terms=sum(term != fixed for term, fixed in zip(terms, corrected)))
+        terms = corrected
     
-    # Remove extra line breaks (more than 2)
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    with span('score_passages'):
+        results = knowledge_base.search(terms, limit=ANSWER_CANDIDATES, documents=documents)
     
-    # Fix common PDF artifacts
-    text = text.replace('ﬁ', 'fi')  # Fix ligature
-    text = text.replace('ﬂ', 'fl')  # Fix ligature
-    text = text.replace('—', '-')   # Fix em-dash
+    if not results:
+        return None
     
-    # Clean up spaces around punctuation
-    text = re.sub(r'\s+([,.;:!?])', r'\1', text)
+    document, passage_id, score = results[0]
+    with span('format_answer'):
+        page_number, answer_with_context, snippets = compose_answer(results)
     
-    # Ensure proper spacing after periods
-    text = re.sub(r'\.([A-Z])', r'. \1', text)
+    log.info("✓ Found answer on page %d of %s (score: %.2f)", page_number, document.title, score)
+    if snippets > 1:
+        log.info("→ Answer joins %d passages (%d chars)", snippets, len(answer_with_context))
+        annotate(answer_snippets=snippets)
     
-    return text.strip()
+    return answer_with_context
 
 
-def trim_to_sentence(text, max_length=1000):
+def compose_answer(ranked, max_snippets=ANSWER_SNIPPETS, max_chars=ANSWER_MAX_CHARS):
+    """
+    Answer text from the best ranked passages, each with its source.
+    
+    The best passage is always used, exactly as format_answer() returns it,
+    so max_snippets=1 is the single-passage answer. Further passages follow
+    in rank order, skipping any that overlaps a passage already used
+    (neighbouring passages share about half their text), until max_snippets
+    are used or the next one would take the answer past max_chars. Only
+    the pages of the passages used are decoded.
+    
+    Args:
+        ranked (list): (document, passage_id, score) tuples, best first
+        max_snippets (int): Maximum number of passages to use
+        max_chars (int): Character budget for the whole answer
+        
+    Returns:
+        tuple: (page number of the best passage, answer with sources, passages used)
     """
-    Trim text to end at a complete sentence.
-    Avoids cutting off mid-sentence.
+    used = []
+    parts = []
+    length = 0
+    for document, passage_id, _ in ranked:
+        if len(parts) == max_snippets:
+            break
+        
+        page_position, start, end = document.passages.span(passage_id)
+        if any(other is document and other_page == page_position and start < other_end and other_start < end
+               for other, other_page, other_start, other_end in used):
+            continue
+        
+        page_number, answer = format_answer(document, passage_id)
+        if parts and length + len(answer) + 2 > max_chars:
+            break
+        
+        if not parts:
+            best_page = page_number
+        used.append((document, page_position, start, end))
+        parts.append(answer)
+        length += len(answer) + (2 if len(parts) > 1 else 0)
+    
+    return best_page, "\n\n".join(parts), len(parts)
+
+
+def format_answer(document, passage_id):
     """
-    if len(text) <= max_length:
-        return text
+    Answer text for a ranked passage, with its source.
     
-    # Truncate to max length
-    text = text[:max_length]
+    The passage text was cleaned and its sentence-aligned offsets computed
+    at load, so this decodes one page and slices it.
     
-    # Find last sentence ending
-    last_period = max(
-        text.rfind('. '),
-        text.rfind('.\n'),
-        text.rfind('? '),
-        text.rfind('! ')
-    )
+    Args:
+        document (KbDocument): Document the passage belongs to
+        passage_id (int): Passage id within the document
+        
+    Returns:
+        tuple: (page number, answer with its source)
+    """
+    page_number, answer = document.passages.snippet(document.pages, passage_id)
+    
+    # Add helpful context
+    return page_number, f"{answer}\n\n(Source: Page {page_number} of {document.title})"
+
+
+def search_many(questions):
+    """
+    Answer a batch of questions with one matrix operation.
+    
+    Meant for offline evaluation and bulk replay of logged questions: all
+    questions are scored together against the sparse term-passage matrix
+    instead of going through lambda_handler one at a time. Lazy documents
+    without an index are indexed in full first, and the answer cache is
+    neither read nor filled.
+    
+    Args:
+        questions (list): User questions
+        
+    Returns:
+        list: Answers in question order, as search_pdf_for_answer() returns them
+    """
+    knowledge_base = load_knowledge_base()
+    
+    for document in knowledge_base.documents.values():
+        if document.index is None:
+            log.info("→ Indexing every page of %s for batch search", document.title)
+            document.passages, document.index = build_passage_index(document.pages)
     
-    if last_period > max_length * 0.5:  # Only if we're not cutting too much
-        text = text[:last_period + 1]
+    term_lists = [
+        knowledge_base.correct_terms(query_terms(extract_keywords(question)))
+        for question in questions
+    ]
     
-    return text.strip()
+    started = time.perf_counter()
+    results = knowledge_base.search_many(term_lists, limit=ANSWER_CANDIDATES)
+    log.info("✓ Scored %d questions in %.3fs", len(questions), time.perf_counter() - started)
+    
+    return [
+        compose_answer(ranked)[1] if ranked and terms else NOT_FOUND_MESSAGE.format(question=question)
+        for question, terms, ranked in zip(questions, term_lists, results)
+    ]
+
 
+# Common words to ignore
+STOP_WORDS = {'what', 'is', 'are', 'the', 'a', 'an', 'how', 'do', 'does', 
+              'can', 'tell', 'me', 'about', 'explain', 'describe', 'in', 'to',
+              'for', 'of', 'and', 'or', 'it', 'this', 'that', 'i', 'you'}
 
+
+def extract_keywords(text):
+    """
+    Extract important keywords from question.
+    Removes common words, keeps important terms.
+    """
+    # Split into words and clean
+    words = re.findall(r'\b[a-z0-9]+\b', text.lower())
+    
+    # Keep important words
+    keywords = [w for w in words if w not in STOP_WORDS and len(w) > 2]
+    
+    return keywords if keywords else [text.lower()]
+
+
+def query_terms(keywords):
+    """
+    Index terms of query keywords.
+    
+    The whole-question fallback of extract_keywords() is tokenized like any
+    keyword, so stop words are dropped here: they occur in nearly every
+    passage and would rank an arbitrary one. Short terms such as "s3" in
+    the fallback are kept.
+    
+    Args:
+        keywords (list): Keywords from extract_keywords()
+        
+    Returns:
+        list: Terms to score, empty when the question has no content words
+    """
+    return [term for keyword in keywords for term in tokenize(keyword) if term not in STOP_WORDS]
+
+
+@timed('query_pdf_knowledge_base')
 def query_pdf_knowledge_base(question):
     """
     Main function to query PDF knowledge base.
     Replaces ALL if/else statements with intelligent search!
     """
-    if not PDF_AVAILABLE:
-        return "PDF reader is not available. Please contact administrator."
-    
     if not USE_PDF_KB:
         return "PDF knowledge base is disabled."
     
     try:
-        # Load PDF (cached after first load)
-        pdf_content = load_pdf_from_s3()
+        # Load knowledge base (cached after first load, refreshed incrementally)
+        knowledge_base = load_knowledge_base()
+        
+        # Same keywords against the same corpus version give the same answer.
+        # Repeats stay in the key: BM25 weighs a term by its query frequency
+        keywords = extract_keywords(question)
+        cache_key = (tuple(sorted(keywords)), knowledge_base.version)
+        
+        answer = ANSWER_CACHE.get(cache_key)
+        annotate(cache_hit=answer is not MISSING)
+        if answer is MISSING:
+            # Lazy documents without a prebuilt index: extract only hinted pages
+            # (nothing to extract for a question of stop words only)
+            documents = select_lazy_pages(keywords, knowledge_base) if query_terms(keywords) else None
+            
+            # Search for answer
+            answer = find_answer(keywords, knowledge_base, documents)
+            ANSWER_CACHE.put(cache_key, answer)
+        else:
+            log.debug("✓ Answer cache hit for %s: %s", list(cache_key[0]), ANSWER_CACHE.stats())
         
-        # Search for answer
-        answer = search_pdf_for_answer(question, pdf_content)
+        if answer is None:
+            return NOT_FOUND_MESSAGE.format(question=question)
         
         return answer
         
     except Exception as e:
         error_msg = str(e)
-        print(f"✗ PDF search failed: {error_msg}")
+        log.error("✗ PDF search failed: %s", error_msg)
+        # The user gets a reply, but the stage still counts as failed
+        annotate(error=True, exception=type(e).__name__)
+        if not PDF_AVAILABLE:
+            return "PDF reader is not available. Please contact administrator."
         return f"I encountered an error searching the knowledge base. Please try rephrasing your question."
 
 
@@ -318,7 +774,7 @@ def query_llm(text):
     """
     
     # Use PDF Knowledge Base (FREE and works!)
-    print("→ Using PDF Knowledge Base (NO IF/ELSE!)")
+    log.debug("→ Using PDF Knowledge Base (NO IF/ELSE!)")
     return query_pdf_knowledge_base(text)
 
 
@@ -336,55 +792,297 @@ def query_local_kb(text):
 # AWS SERVICE FUNCTIONS
 # ============================================================================
 
-def get_session(session_id):
+class SessionConflict(Exception):
+    """
+    Raised by save_session() when the stored item's version is not the
+    expected one, i.e. another container wrote the session in the meantime.
+    """
+
+
+@timed('get_session')
+def get_session(session_id, use_cache=True):
     """
     Retrieve session data from DynamoDB table by session_id.
     
+    A session this container wrote recently is served from SESSION_CACHE
+    without a DynamoDB read.
+    
     Args:
         session_id (str): The unique session identifier
+        use_cache (bool): False to always read from DynamoDB
         
     Returns:
         dict: Session data or empty dict if not found or error occurs
     """
+    if use_cache:
+        cached = SESSION_CACHE.get(session_id)
+        annotate(cache_hit=cached is not MISSING)
+        if cached is not MISSING:
+            log.debug("✓ Session cache hit for %s: %s", session_id, session_cache_stats())
+            return copy.deepcopy(cached)
+    
     try:
         response = table.get_item(Key={'session_id': session_id})
         session_data = response.get('Item', {})
-        print(f"Retrieved session data for {session_id}: {session_data}")
+        log.payload('DEBUG', 'Retrieved session data', session_data, session_id=session_id)
         return session_data
     except ClientError as e:
-        print(f"Error retrieving session {session_id}: {e.response['Error']['Message']}")
+        log.error("Error retrieving session %s: %s", session_id, e.response['Error']['Message'])
         return {}
     except Exception as e:
-        print(f"Unexpected error retrieving session {session_id}: {str(e)}")
+        log.error("Unexpected error retrieving session %s: %s", session_id, e)
         return {}
 
 
-def save_session(session_id, session_data):
+@timed('save_session')
+def save_session(session_id, session_data, expected_version=MISSING):
     """
     Save session data to DynamoDB table.
     
+    With expected_version, the write only succeeds if the stored item still
+    has that version (None: no version attribute yet) and the saved copy is
+    kept in SESSION_CACHE.
+    
     Args:
         session_id (str): The unique session identifier
         session_data (dict): The session data to save
+        expected_version (int): Version the data was read at (default: unconditional write)
         
     Returns:
         bool: True if save was successful, False otherwise
+        
+    Raises:
+        SessionConflict: The stored item changed since it was read
     """
     try:
         # Ensure session_id is included in the data
         session_data['session_id'] = session_id
         
-        table.put_item(Item=session_data)
-        print(f"Session {session_id} saved successfully")
+        if expected_version is MISSING:
+            table.put_item(Item=session_data)
+        elif expected_version is None:
+            table.put_item(
+                Item=session_data,
+                ConditionExpression='attribute_not_exists(#version)',
+                ExpressionAttributeNames={'#version': 'version'}
+            )
+        else:
+            table.put_item(
+                Item=session_data,
+                ConditionExpression='#version = :expected',
+                ExpressionAttributeNames={'#version': 'version'},
+                ExpressionAttributeValues={':expected': expected_version}
+            )
+        
+        if expected_version is not MISSING:
+            SESSION_CACHE.put(session_id, copy.deepcopy(session_data))
+        log.debug("Session %s saved successfully", session_id)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            raise SessionConflict(session_id)
+        log.error("Error saving session %s: %s", session_id, e.response['Error']['Message'])
+        return False
+    except Exception as e:
+        log.error("Unexpected error saving session %s: %s", session_id, e)
+        return False
+
+
+def rewrite_session(session_id, intent_name, turn):
+    """
+    Record one conversation turn by reading the session and writing it back.
+    
+    The write is conditional on the version that was read. If another
+    container wrote the session in between (or the cached copy is stale),
+    the session is re-read from DynamoDB and the turn applied again, up to
+    SESSION_CONFLICT_RETRIES times.
+    
+    Args:
+        session_id (str): The unique session identifier
+        intent_name (str): Intent of the turn
+        turn (dict): intent, user_input and bot_response of the turn
+        
+    Returns:
+        bool: True if save was successful, False otherwise
+    """
+    for attempt in range(SESSION_CONFLICT_RETRIES + 1):
+        # Load existing session data (from the container cache on the first attempt)
+        session_data = get_session(session_id, use_cache=(attempt == 0))
+        version = session_data.get('version')
+        version = int(version) if version is not None else None
+        
+        # Initialize session data if it doesn't exist
+        if not session_data:
+            session_data = {
+                'session_id': session_id,
+                'conversation_history': [],
+                'intent_count': {}
+            }
+        
+        # Update conversation history
+        if 'conversation_history' not in session_data:
+            session_data['conversation_history'] = []
+        
+        # Track intent usage
+        if 'intent_count' not in session_data:
+            session_data['intent_count'] = {}
+        
+        session_data['intent_count'][intent_name] = session_data['intent_count'].get(intent_name, 0) + 1
+        
+        # Add current interaction to conversation history
+        session_data['conversation_history'].append(encode_turn(turn, SESSION_HISTORY_ENCODING))
+        
+        # Limit conversation history to the last SESSION_HISTORY_LIMIT interactions
+        if len(session_data['conversation_history']) > SESSION_HISTORY_LIMIT:
+            session_data['conversation_history'] = session_data['conversation_history'][-SESSION_HISTORY_LIMIT:]
+        
+        # Keep update mode's counter in step for items written in both modes
+        session_data['history_length'] = len(session_data['conversation_history'])
+        
+        # Let the table's TTL expire the session once it has been idle long enough
+        if SESSION_TTL_SECONDS > 0:
+            session_data['expires_at'] = int(time.time()) + SESSION_TTL_SECONDS
+        
+        session_data['version'] = (version or 0) + 1
+        
+        # Save updated session data to DynamoDB, unless someone else wrote it first
+        try:
+            return save_session(session_id, session_data, expected_version=version)
+        except SessionConflict:
+            SESSION_WRITE_STATS['conflicts'] += 1
+            log.warning("→ Session %s changed since version %s, re-reading (attempt %d): %s",
+                        session_id, version, attempt + 1, session_cache_stats())
+    
+    SESSION_WRITE_STATS['conflicts_unresolved'] += 1
+    log.error("✗ Session %s not saved after %d conflict retries", session_id, SESSION_CONFLICT_RETRIES)
+    return False
+
+
+def session_cache_stats():
+    """
+    Session cache and write guard counters for monitoring.
+    
+    Returns:
+        dict: TTLCache stats plus conflicts and conflicts_unresolved
+    """
+    return dict(SESSION_CACHE.stats(), **SESSION_WRITE_STATS)
+
+
+@timed('update_session')
+def update_session(session_id, intent_name, turn):
+    """
+    Record one conversation turn with a single DynamoDB UpdateItem.
+    
+    The turn is appended with list_append and the intent counter bumped with
+    ADD, so the item is never read or rewritten as a whole. Once the history
+    returned by the append holds twice SESSION_HISTORY_LIMIT turns the
+    oldest turns are removed in one extra request, so the history stays
+    bounded at one trim every SESSION_HISTORY_LIMIT turns. history_length
+    mirrors the number of stored turns for readers of the item. The item's
+    version is bumped too, so containers holding a cached copy of the
+    session (put mode) notice the change.
+    
+    Args:
+        session_id (str): The unique session identifier
+        intent_name (str): Intent of the turn
+        turn (dict): intent, user_input and bot_response of the turn
+        
+    Returns:
+        bool: True if the turn was saved, False otherwise
+    """
+    append = 'SET #history = list_append(if_not_exists(#history, :empty), :turn)'
+    names = {
+        '#history': 'conversation_history',
+        '#counts': 'intent_count',
+        '#length': 'history_length',
+        '#version': 'version'
+    }
+    values = {':turn': [encode_turn(turn, SESSION_HISTORY_ENCODING)], ':empty': [], ':one': 1}
+    
+    # Let the table's TTL expire the session once it has been idle long enough
+    if SESSION_TTL_SECONDS > 0:
+        append += ', #expires = :expires'
+        names['#expires'] = 'expires_at'
+        values[':expires'] = int(time.time()) + SESSION_TTL_SECONDS
+    
+    # Existing session: bump the counter inside intent_count
+    existing = {
+        'UpdateExpression': f'{append} ADD #counts.#intent :one, #length :one, #version :one',
+        'ConditionExpression': 'attribute_exists(#counts)',
+        'ExpressionAttributeNames': dict(names, **{'#intent': intent_name}),
+        'ExpressionAttributeValues': values
+    }
+    # First turn of a session: create intent_count
+    new = {
+        'UpdateExpression': f'{append}, #counts = :counts ADD #length :one, #version :one',
+        'ConditionExpression': 'attribute_not_exists(#counts)',
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': dict(values, **{':counts': {intent_name: 1}})
+    }
+    
+    try:
+        # A session created concurrently between the two attempts takes a third
+        for attempt, request in enumerate((existing, new, existing)):
+            try:
+                response = table.update_item(
+                    Key={'session_id': session_id},
+                    ReturnValues='UPDATED_NEW',
+                    **request
+                )
+                break
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException' or attempt == 2:
+                    raise
+        
+        # UPDATED_NEW returns the whole list set by the append
+        history_length = len(response['Attributes'].get('conversation_history', []))
+        log.debug("Session %s updated (%d turns in history)", session_id, history_length)
+        
+        if history_length >= 2 * SESSION_HISTORY_LIMIT:
+            trim_session_history(session_id, history_length)
         return True
     except ClientError as e:
-        print(f"Error saving session {session_id}: {e.response['Error']['Message']}")
+        log.error("Error updating session %s: %s", session_id, e.response['Error']['Message'])
         return False
     except Exception as e:
-        print(f"Unexpected error saving session {session_id}: {str(e)}")
+        log.error("Unexpected error updating session %s: %s", session_id, e)
         return False
 
 
+def trim_session_history(session_id, history_length):
+    """
+    Drop the oldest turns so SESSION_HISTORY_LIMIT remain.
+    
+    Conditional on the stored list still holding history_length turns, so a
+    concurrent append or trim makes this a no-op and the next turn trims
+    instead. history_length is reset to the number of turns kept.
+    
+    Args:
+        session_id (str): The unique session identifier
+        history_length (int): Turns in the history returned by the last append
+    """
+    excess = history_length - SESSION_HISTORY_LIMIT
+    removals = ', '.join(f'#history[{position}]' for position in range(excess))
+    
+    try:
+        table.update_item(
+            Key={'session_id': session_id},
+            UpdateExpression=f'REMOVE {removals} SET #length = :kept ADD #version :one',
+            ConditionExpression='size(#history) = :length',
+            ExpressionAttributeNames={
+                '#history': 'conversation_history',
+                '#length': 'history_length',
+                '#version': 'version'
+            },
+            ExpressionAttributeValues={':kept': SESSION_HISTORY_LIMIT, ':length': history_length, ':one': 1}
+        )
+        log.debug("Session %s history trimmed by %d turns", session_id, excess)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        log.debug("Session %s changed during trim, leaving it for the next turn", session_id)
+
+
 def close(session_attributes, fulfillment_state, message_content):
     """
     Format the JSON response to send back to Amazon Lex V2.
@@ -421,6 +1119,7 @@ def close(session_attributes, fulfillment_state, message_content):
 # MAIN LAMBDA HANDLER
 # ============================================================================
 
+@timed('lambda_handler')
 def lambda_handler(event, context):
     """
     AWS Lambda handler for Amazon Lex V2 fulfillment hook.
@@ -435,9 +1134,12 @@ def lambda_handler(event, context):
     Returns:
         dict: Lex V2 response format with session state and messages
     """
+    start_invocation()
+    log.start_request(context)
+    
     try:
-        # Log the incoming event for debugging
-        print(f"Received Lex V2 event: {json.dumps(event)}")
+        # Log the incoming event for debugging (serialized only when DEBUG is on)
+        log.payload('DEBUG', 'Received Lex V2 event', event)
         
         # Extract key information from the Lex V2 event
         session_id = event.get('sessionId', 'unknown-session')
@@ -445,24 +1147,11 @@ def lambda_handler(event, context):
         input_transcript = event.get('inputTranscript', '').strip()
         session_attributes = event.get('sessionState', {}).get('sessionAttributes', {})
         
-        print(f"Processing - SessionID: {session_id}, Intent: {intent_name}, Input: {input_transcript}")
-        
-        # Load existing session data from DynamoDB
-        session_data = get_session(session_id)
-        
-        # Initialize session data if it doesn't exist
-        if not session_data:
-            session_data = {
-                'session_id': session_id,
-                'conversation_history': [],
-                'intent_count': {}
-            }
-        
-        # Update conversation history
-        if 'conversation_history' not in session_data:
-            session_data['conversation_history'] = []
+        log.info("Processing - SessionID: %s, Intent: %s, Input: %s", session_id, intent_name, input_transcript)
+        annotate(intent=intent_name)
         
-        # Intent-based response logic
+        # Intent-based response logic (the fixed replies are mirrored by
+        # FAST_PATH_REPLIES in src_proxy/fast_path.py)
         if intent_name == 'GreetingIntent':
             message = "Hello! How can I help you with your AWS questions?"
             
@@ -473,40 +1162,33 @@ def lambda_handler(event, context):
             # FallbackIntent or any other unrecognized intent
             if input_transcript:
                 # Query PDF Knowledge Base (NO IF/ELSE!)
-                print(f"Fallback triggered - querying PDF Knowledge Base with: {input_transcript}")
+                log.debug("Fallback triggered - querying PDF Knowledge Base with: %s", input_transcript)
                 message = query_llm(input_transcript)
             else:
                 # No input text available
                 message = "I'm not sure how to help with that. Could you please rephrase your question?"
         
-        # Track intent usage
-        if 'intent_count' not in session_data:
-            session_data['intent_count'] = {}
-        
-        session_data['intent_count'][intent_name] = session_data['intent_count'].get(intent_name, 0) + 1
-        
-        # Add current interaction to conversation history
-        session_data['conversation_history'].append({
+        turn = {
             'intent': intent_name,
             'user_input': input_transcript,
             'bot_response': message
-        })
-        
-        # Limit conversation history to last 10 interactions
-        if len(session_data['conversation_history']) > 10:
-            session_data['conversation_history'] = session_data['conversation_history'][-10:]
+        }
         
-        # Save updated session data to DynamoDB
-        save_session(session_id, session_data)
+        # Save the turn to DynamoDB
+        if SESSION_STORE_MODE == 'update':
+            # No intent needs the prior history, so nothing is read
+            update_session(session_id, intent_name, turn)
+        else:
+            rewrite_session(session_id, intent_name, turn)
         
         # Format and return Lex V2 response
         response = close(session_attributes, 'Fulfilled', message)
         
-        print(f"Returning response: {json.dumps(response)}")
+        log.payload('DEBUG', 'Returning response', response)
         return response
         
     except Exception as e:
-        print(f"Error in lambda_handler: {str(e)}")
+        log.error("Error in lambda_handler: %s", e)
         
         # Return error response to Lex
         error_response = close(
@@ -517,3 +1199,6 @@ def lambda_handler(event, context):
         
         return error_response
 
+
+# Runs during the Lambda init phase, after everything above is defined
+start_knowledge_base_warmup()
@@ -0,0 +1,495 @@
+"""
+Prebuilt Knowledge Base Artifact (builder CLI + memory-mapped loader)
+
+Extracting text from a large PDF with PyPDF2 dominates cold starts of the
+fulfillment function. This module moves that work offline: the builder
+extracts, cleans and indexes the PDF once and writes a compact binary
+artifact which the handler memory-maps instead of touching PyPDF2.
+
+Build and upload next to the PDF (defaults come from PDF_S3_BUCKET/PDF_S3_KEY):
+    cd src && python -m kb_artifact --bucket my-bucket --key manual.pdf --upload
+
+Build from a local PDF (the copy uploaded to S3; its possible S3 ETags are
+recorded, so the handler still rejects the artifact once the object changes):
+    cd src && python -m kb_artifact --pdf manual.pdf --output manual.pdf.kbidx
+
+Build artifacts for every new or changed PDF under a prefix (PDF_S3_PREFIX):
+    cd src && python -m kb_artifact --bucket my-bucket --prefix manuals/
+
+Build an index-only artifact for lazy mode (PDF_LAZY_LOAD), where page text
+is extracted on demand from the PDF itself:
+    cd src && python -m kb_artifact --bucket my-bucket --key manual.pdf --index-only --upload
+
+File layout (little-endian):
+    header    MAGIC, format version (u32), section count (u32)
+    table     (offset u64, length u64) per section, in SECTIONS order
+    sections  each aligned to 8 bytes
+
+An artifact is typically about 3x the size of its PDF. Sections are used in
+place from the mapping, so nothing is compressed: the page text is stored
+as plain UTF-8 where the PDF holds it Flate-compressed, each posting costs
+12 bytes (doc id, frequency, position offset) and each token position 2.
+Downloading the extra bytes takes a fraction of what extracting the PDF
+does; the builder prints the size of every section.
+
+Runtime: Python 3.10
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+
+from kb_index import InvertedIndex
+from kb_pages import PageStore
+from kb_passages import Passages, build_passage_index
+from kb_text import clean_pdf_text
+from pdf_extract import extract_pdf_pages_parallel, pdf_page_refs, resolve_worker_count
+
+MAGIC = b'KBARTIFX'
+FORMAT_VERSION = 4
+
+# Default artifact name is the PDF key plus this suffix
+ARTIFACT_SUFFIX = '.kbidx'
+
+# Section order in the file; every u32 array is stored raw
+SECTIONS = (
+    'meta',              # JSON metadata (source, etag, counts)
+    'page_numbers',      # u32[pages]
+    'text_offsets',      # u32[pages + 1] byte offsets into text
+    'text',              # UTF-8 page texts, concatenated
+    'passage_pages',     # u32[passages] page position of each passage
+    'passage_starts',    # u32[passages] character offset in the page text
+    'passage_ends',      # u32[passages]
+    'terms',             # '\n'-joined sorted vocabulary (ASCII)
+    'posting_offsets',   # u32[terms + 1]
+    'doc_ids',           # u32[postings] passage ids
+    'freqs',             # u32[postings]
+    'doc_lengths',       # u32[passages]
+    'position_offsets',  # u32[postings + 1] (since version 3)
+    'positions',         # u16[total tf] token positions in the passage (since version 3)
+    'page_refs',         # u32[pages * 2] PDF object number and generation of each page (since version 4)
+)
+
+# Section count of each readable version; every version appends sections,
+# so an older artifact (version 2: no positions, 3: no page refs) is a prefix of SECTIONS
+SECTION_COUNTS = {2: len(SECTIONS) - 3, 3: len(SECTIONS) - 1, FORMAT_VERSION: len(SECTIONS)}
+
+# Part sizes (MiB) S3 upload tools commonly use; a multipart upload's ETag
+# depends on it (boto3 and the AWS CLI default to 8)
+MULTIPART_PART_SIZES_MB = (8, 16, 5, 64)
+
+_HEADER = struct.Struct('<8sII')
+_TABLE_ENTRY = struct.Struct('<QQ')
+_ALIGNMENT = 8
+
+
+class ArtifactError(Exception):
+    """Raised when an artifact is malformed or of an unsupported version."""
+
+
+def artifact_key_for(pdf_key):
+    """
+    S3 key of the artifact stored next to a PDF.
+    """
+    return pdf_key + ARTIFACT_SUFFIX
+
+
+def source_etags(pdf_bytes):
+    """
+    The ETags S3 can give an object with these bytes: the MD5 of a single
+    PUT, and the multipart ETag for each of MULTIPART_PART_SIZES_MB.
+    (SSE-KMS encrypted objects have other ETags; build those from S3.)
+
+    Args:
+        pdf_bytes (bytes): Raw PDF
+
+    Returns:
+        list: ETags without quotes
+    """
+    etags = [hashlib.md5(pdf_bytes).hexdigest()]
+    for part_mb in MULTIPART_PART_SIZES_MB:
+        part_size = part_mb * 1024 * 1024
+        if len(pdf_bytes) <= part_size:
+            continue
+        digests = b''.join(hashlib.md5(pdf_bytes[start:start + part_size]).digest()
+                           for start in range(0, len(pdf_bytes), part_size))
+        etags.append(f"{hashlib.md5(digests).hexdigest()}-{-(-len(pdf_bytes) // part_size)}")
+    return etags
+
+
+def matches_source(metadata, etag):
+    """
+    Check an artifact against the current ETag of its PDF.
+
+    Args:
+        metadata (dict): Artifact metadata ('etag' of an S3 build, 'etags'
+                         of a local build)
+        etag (str): Current ETag of the PDF (None: unknown)
+
+    Returns:
+        bool: Whether the artifact was built from that object - None if
+              either side has no ETag to compare
+    """
+    built_from = metadata.get('etags') or ([metadata['etag']] if metadata.get('etag') else [])
+    if not built_from or not etag:
+        return None
+    return etag.strip('"') in built_from
+
+
+def write_artifact(path, pages, passages, index, metadata=None, include_text=True, page_refs=None):
+    """
+    Serialize pages, their passages and the passage index to an artifact file.
+
+    Args:
+        path (str): Output file path
+        pages: PDF pages as {'page', 'content'} dicts (a list or a PageStore)
+        passages (Passages): Passage table over pages
+        index (InvertedIndex): Index built over passages (same order)
+        metadata (dict): Extra metadata stored in the header section
+        include_text (bool): Store page texts (False for an index-only artifact)
+        page_refs (list): (object number, generation) of each page in pages, for lazy mode
+
+    Returns:
+        int: Size of the written artifact in bytes
+    """
+    text_offsets = array('I', [0])
+    encoded_pages = []
+    for page_data in pages:
+        encoded = page_data['content'].encode('utf-8') if include_text else b''
+        encoded_pages.append(encoded)
+        text_offsets.append(text_offsets[-1] + len(encoded))
+
+    terms = sorted(index.vocabulary, key=index.vocabulary.get)
+
+    meta = dict(metadata or {})
+    meta.update({
+        'page_count': len(pages),
+        'term_count': len(terms),
+        'index_only': not include_text,
+        'created': int(time.time())
+    })
+
+    payloads = {
+        'meta': json.dumps(meta).encode('utf-8'),
+        'page_numbers': array('I', (page_data['page'] for page_data in pages)).tobytes(),
+        'text_offsets': text_offsets.tobytes(),
+        'text': b''.join(encoded_pages),
+        'passage_pages': array('I', passages.page_positions).tobytes(),
+        'passage_starts': array('I', passages.starts).tobytes(),
+        'passage_ends': array('I', passages.ends).tobytes(),
+        'terms': '\n'.join(terms).encode('ascii'),
+        'posting_offsets': array('I', index.offsets).tobytes(),
+        'doc_ids': array('I', index.doc_ids).tobytes(),
+        'freqs': array('I', index.freqs).tobytes(),
+        'doc_lengths': array('I', index.doc_lengths).tobytes(),
+        'position_offsets': array('I', index.position_offsets or ()).tobytes(),
+        'positions': array('H', index.positions or ()).tobytes(),
+        'page_refs': array('I', (number for ref in page_refs or () for number in ref)).tobytes(),
+    }
+
+    # Lay sections out after the header and table, each 8-byte aligned
+    position = _HEADER.size + _TABLE_ENTRY.size * len(SECTIONS)
+    table = []
+    for name in SECTIONS:
+        position += -position % _ALIGNMENT
+        table.append((position, len(payloads[name])))
+        position += len(payloads[name])
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(SECTIONS)))
+        for offset, length in table:
+            f.write(_TABLE_ENTRY.pack(offset, length))
+        for name, (offset, length) in zip(SECTIONS, table):
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(payloads[name])
+        return f.tell()
+
+
+def _map_sections(path):
+    """
+    Memory-map an artifact and return a view of each section by name.
+    """
+    if sys.byteorder != 'little':
+        raise ArtifactError("Artifacts can only be memory-mapped on little-endian hosts")
+
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mapping)
+    if len(view) < _HEADER.size:
+        raise ArtifactError("Artifact is truncated")
+
+    magic, version, section_count = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ArtifactError("Not a knowledge base artifact")
+    if SECTION_COUNTS.get(version) != section_count:
+        raise ArtifactError(f"Unsupported artifact version {version} (expected {FORMAT_VERSION})")
+
+    sections = {}
+    for i, name in enumerate(SECTIONS[:section_count]):
+        offset, length = _TABLE_ENTRY.unpack_from(view, _HEADER.size + i * _TABLE_ENTRY.size)
+        if offset + length > len(view):
+            raise ArtifactError(f"Artifact section '{name}' is truncated")
+        sections[name] = view[offset:offset + length]
+
+    return sections
+
+
+def section_sizes(path):
+    """
+    Bytes taken by each section of an artifact.
+
+    Args:
+        path (str): Artifact file path
+
+    Returns:
+        dict: Section name -> length, in file order
+    """
+    return {name: len(view) for name, view in _map_sections(path).items()}
+
+
+def load_artifact_index(path):
+    """
+    Memory-map an artifact and rebuild only its index, not the page texts.
+
+    Posting and length arrays are zero-copy views over the mapping, so only
+    the vocabulary dict is materialized.
+
+    Args:
+        path (str): Artifact file path
+
+    Returns:
+        tuple: (page_numbers, passages, index, metadata, page_refs) - passage
+               page positions are positions in page_numbers, and page_refs
+               holds the object number and generation of each of those pages
+               (None for artifacts built before version 4)
+
+    Raises:
+        ArtifactError: If the file is not a supported artifact
+    """
+    sections = _map_sections(path)
+    page_refs = sections['page_refs'].cast('I') if len(sections.get('page_refs', b'')) else None
+    return _read_index(sections) + (page_refs,)
+
+
+def _read_index(sections):
+    """
+    Build (page_numbers, passages, index, metadata) from mapped sections.
+    """
+    def u32(name):
+        return sections[name].cast('I')
+
+    metadata = json.loads(bytes(sections['meta']).decode('utf-8'))
+
+    terms = str(sections['terms'], 'ascii').split('\n') if len(sections['terms']) else []
+    vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+
+    # Version 2 artifacts have no positions: no proximity scoring until rebuilt
+    positional = 'positions' in sections and len(sections['position_offsets'])
+
+    index = InvertedIndex(
+        vocabulary,
+        u32('posting_offsets'),
+        u32('doc_ids'),
+        u32('freqs'),
+        u32('doc_lengths'),
+        u32('position_offsets') if positional else None,
+        sections['positions'].cast('H') if positional else None
+    )
+
+    passages = Passages(u32('passage_pages'), u32('passage_starts'), u32('passage_ends'))
+
+    return u32('page_numbers'), passages, index, metadata
+
+
+def load_artifact(path):
+    """
+    Memory-map an artifact and rebuild pages, passages and index from it.
+
+    Posting, passage and length arrays and the page text are zero-copy
+    views over the mapping, so only the vocabulary dict is materialized.
+
+    Args:
+        path (str): Artifact file path
+
+    Returns:
+        tuple: (PageStore, passages, index, metadata)
+
+    Raises:
+        ArtifactError: If the file is not a supported artifact or is index-only
+    """
+    sections = _map_sections(path)
+    page_numbers, passages, index, metadata = _read_index(sections)
+
+    if metadata.get('index_only'):
+        raise ArtifactError("Artifact is index-only (built with --index-only)")
+
+    # The text section is laid out exactly as a PageStore
+    pages = PageStore(sections['text'], sections['text_offsets'].cast('I'), page_numbers)
+
+    return pages, passages, index, metadata
+
+
+# ============================================================================
+# BUILDER CLI
+# ============================================================================
+
+def build_artifact(pdf_bytes, output_path, metadata=None, workers=1, include_text=True):
+    """
+    Extract, clean, chunk and index a PDF and write it as an artifact.
+
+    Args:
+        pdf_bytes (bytes): Raw PDF
+        output_path (str): Artifact file path
+        metadata (dict): Source information recorded in the artifact
+        workers (int): Extraction worker processes
+        include_text (bool): Store page texts (False for an index-only artifact)
+
+    Returns:
+        int: Size of the written artifact in bytes
+    """
+    refs = pdf_page_refs(pdf_bytes)
+    pages = extract_pdf_pages_parallel(pdf_bytes, workers, clean=clean_pdf_text, total_pages=len(refs))
+    passages, index = build_passage_index(pages)
+
+    page_refs = [refs[page_data['page'] - 1] for page_data in pages]
+
+    return write_artifact(output_path, pages, passages, index, metadata, include_text, page_refs)
+
+
+def build_s3_artifact(s3_client, bucket, key, output_path, workers=1, include_text=True, upload=False):
+    """
+    Build the artifact of a PDF stored in S3, optionally uploading it next to the PDF.
+
+    Args:
+        s3_client: boto3 S3 client
+        bucket (str): S3 bucket holding the PDF
+        key (str): S3 key of the PDF
+        output_path (str): Local artifact path
+        workers (int): Extraction worker processes
+        include_text (bool): Store page texts (False for an index-only artifact)
+        upload (bool): Upload to artifact_key_for(key)
+
+    Returns:
+        int: Size of the written artifact in bytes
+    """
+    print(f"→ Downloading s3://{bucket}/{key}")
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    pdf_bytes = response['Body'].read()
+    etag = response.get('ETag', '').strip('"')
+
+    metadata = {'source': f"s3://{bucket}/{key}", 'etag': etag}
+    size = build_artifact(pdf_bytes, output_path, metadata, workers, include_text)
+
+    if upload:
+        artifact_key = artifact_key_for(key)
+        # The source ETag in the object metadata lets --prefix skip unchanged PDFs
+        s3_client.upload_file(output_path, bucket, artifact_key,
+                              ExtraArgs={'Metadata': {'source-etag': etag}})
+        print(f"✓ Uploaded to s3://{bucket}/{artifact_key}")
+
+    return size
+
+
+def print_section_sizes(path):
+    """
+    Print the share of the artifact each non-empty section takes.
+    """
+    sizes = section_sizes(path)
+    total = sum(sizes.values()) or 1
+    for name, length in sizes.items():
+        if length:
+            print(f"  {name:<17} {length:>12,} bytes  {length / total:6.1%}")
+
+
+def main(argv=None):
+    """
+    Command line entry point: python -m kb_artifact
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m kb_artifact',
+        description='Build a prebuilt knowledge base artifact from a PDF'
+    )
+    parser.add_argument('--bucket', default=os.environ.get('PDF_S3_BUCKET', ''),
+                        help='S3 bucket holding the PDF (default: $PDF_S3_BUCKET)')
+    parser.add_argument('--key', default=os.environ.get('PDF_S3_KEY', 'aws_knowledge_base.pdf'),
+                        help='S3 key of the PDF (default: $PDF_S3_KEY)')
+    parser.add_argument('--prefix', default=None,
+                        help='Build and upload artifacts for every changed PDF under this S3 prefix')
+    parser.add_argument('--pdf', help='Build from a local PDF file instead of S3')
+    parser.add_argument('--output', help='Local artifact path (default: <pdf name>.kbidx)')
+    parser.add_argument('--workers', default='1',
+                        help="Extraction worker processes, or 'auto' for one per CPU (default: 1)")
+    parser.add_argument('--index-only', action='store_true',
+                        help='Omit page texts; for lazy mode (PDF_LAZY_LOAD) only')
+    parser.add_argument('--upload', action='store_true',
+                        help='Upload the artifact next to the PDF in S3')
+    args = parser.parse_args(argv)
+
+    import boto3
+    from botocore.exceptions import ClientError
+    s3_client = boto3.client('s3')
+    workers = resolve_worker_count(args.workers)
+
+    started = time.perf_counter()
+
+    if args.pdf:
+        with open(args.pdf, 'rb') as f:
+            pdf_bytes = f.read()
+        output_path = args.output or os.path.basename(artifact_key_for(args.pdf))
+        metadata = {'source': os.path.basename(args.pdf), 'etags': source_etags(pdf_bytes)}
+        size = build_artifact(pdf_bytes, output_path, metadata, workers, include_text=not args.index_only)
+        print(f"✓ Wrote {output_path} ({size} bytes, PDF {len(pdf_bytes)} bytes) "
+              f"in {time.perf_counter() - started:.2f}s")
+        print_section_sizes(output_path)
+        return 0
+
+    if not args.bucket:
+        parser.error('--bucket (or PDF_S3_BUCKET) is required when --pdf is not given')
+
+    if args.prefix is None:
+        output_path = args.output or os.path.basename(artifact_key_for(args.key))
+        size = build_s3_artifact(s3_client, args.bucket, args.key, output_path, workers,
+                                 include_text=not args.index_only, upload=args.upload)
+        print(f"✓ Wrote {output_path} ({size} bytes) in {time.perf_counter() - started:.2f}s")
+        print_section_sizes(output_path)
+        return 0
+
+    # Prefix mode: rebuild only PDFs whose artifact is missing or was built from another ETag
+    built = 0
+    skipped = 0
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=args.bucket, Prefix=args.prefix):
+        for item in page.get('Contents', []):
+            key = item['Key']
+            if not key.lower().endswith('.pdf'):
+                continue
+
+            try:
+                head = s3_client.head_object(Bucket=args.bucket, Key=artifact_key_for(key))
+                artifact_etag = head.get('Metadata', {}).get('source-etag')
+            except ClientError:
+                artifact_etag = None
+
+            if artifact_etag == item['ETag'].strip('"'):
+                skipped += 1
+                continue
+
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                build_s3_artifact(s3_client, args.bucket, key, os.path.join(tmp_dir, 'artifact.kbidx'),
+                                  workers, include_text=not args.index_only, upload=True)
+            built += 1
+
+    print(f"✓ Built {built} artifacts ({skipped} unchanged) in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,449 @@
+"""
+Dense-Vector Retrieval for the PDF Knowledge Base
+
+An optional retrieval mode (KB_RETRIEVAL_MODE=dense or hybrid) that needs no
+model download and no network access. Every term is encoded by feature
+hashing: the word itself plus its character trigrams ('<la', 'lam', ...,
+'da>') are each hashed, with a sign, into HASH_PROBES of DENSE_DIMENSIONS
+dimensions - a sparse random projection of the term's n-gram features. A
+passage vector is the sum of its terms' vectors weighted by BM25 tf-idf
+(the weights of the TermMatrix), L2-normalized, and stored as one float32
+(passages x dimensions) matrix built at load. A refresh embeds only the
+passages of new or changed documents (see REWEIGHT_SHARE).
+
+A query is encoded the same way and scored against every passage with one
+float32 matrix-vector product (a batch with one matrix-matrix product).
+Sharing trigrams, related word forms ("scaling" / "scales") and compounds
+land near each other even when BM25 sees no common term; true synonyms
+with no spelling in common do not. For large corpora a coarse IVF
+partition (spherical k-means) limits each query to the passages of the
+IVF_PROBE_LISTS nearest clusters.
+
+Runtime: Python 3.10
+"""
+
+import math
+import zlib
+from collections import Counter
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Embedding size (bytes per passage = 4 x this)
+DENSE_DIMENSIONS = 256
+
+# Dimensions every hashed feature is added to (with independent signs)
+HASH_PROBES = 2
+
+# Passages whose vectors are accumulated at once while building (bounds the
+# temporary (posting, feature) arrays to a few tens of MB)
+BUILD_CHUNK_PASSAGES = 512
+
+# After a refresh, unchanged documents keep their vectors (weighted with the
+# collection statistics of the build that embedded them); once this share of
+# the passages has changed since every vector was last weighted, all are
+# embedded again
+REWEIGHT_SHARE = 0.2
+
+# Corpora with at least this many passages get an IVF partition (0 disables)
+IVF_MIN_PASSAGES = 20000
+
+# IVF clusters searched per query, and k-means iterations when building
+IVF_PROBE_LISTS = 8
+IVF_ITERATIONS = 8
+
+# Passages below this cosine similarity are not returned by dense search
+# (unrelated character strings mostly score under it against 256 dimensions)
+DENSE_MIN_SIMILARITY = 0.15
+
+# 'keyword' is BM25 only; 'dense' ranks by similarity only; 'hybrid' blends
+# both, with DENSE_WEIGHT as the share of the dense similarity
+RETRIEVAL_MODES = ('keyword', 'dense', 'hybrid')
+DENSE_WEIGHT = 0.3
+
+
+def term_features(term):
+    """
+    Hashed features of a term: the word and its character trigrams.
+
+    The word carries as much weight as all its trigrams together, so an
+    exact match counts more than a shared spelling.
+
+    Args:
+        term (str): Term
+
+    Returns:
+        list: (feature, weight) tuples
+    """
+    padded = f"<{term}>"
+    trigrams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+    return [(term, math.sqrt(len(trigrams)))] + [(trigram, 1.0) for trigram in trigrams]
+
+
+def hash_feature(feature, probe):
+    """
+    Stable (dimension, sign) of one probe of a feature - the same in every container.
+    """
+    digest = zlib.crc32(f"{probe}:{feature}".encode('utf-8'))
+    return digest % DENSE_DIMENSIONS, 1.0 if digest & 0x80000000 else -1.0
+
+
+def encode_terms(terms):
+    """
+    Sparse hashed vectors of terms, as CSR arrays.
+
+    Args:
+        terms (list): Terms
+
+    Returns:
+        tuple: (indptr, dimensions, values) - term i's entries are
+               dimensions/values[indptr[i]:indptr[i + 1]]; each vector has unit norm
+    """
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    dimensions, values = [], []
+    for position, term in enumerate(terms):
+        entries = Counter()
+        for feature, weight in term_features(term):
+            for probe in range(HASH_PROBES):
+                dimension, sign = hash_feature(feature, probe)
+                entries[dimension] += sign * weight
+        norm = math.sqrt(sum(value * value for value in entries.values())) or 1.0
+        dimensions.extend(entries)
+        values.extend(value / norm for value in entries.values())
+        indptr[position + 1] = len(dimensions)
+    return indptr, np.asarray(dimensions, dtype=np.int64), np.asarray(values, dtype=np.float64)
+
+
+def embed_columns(matrix, vectors, ranges):
+    """
+    Compute the unit-norm vectors of the passages in column ranges of a TermMatrix.
+
+    Only the postings in those columns are read and only their terms are
+    hashed, so the cost follows the passages embedded, not the corpus.
+
+    Args:
+        matrix (TermMatrix): BM25 term-passage matrix
+        vectors (numpy.ndarray): (passages x dimensions) float32 output
+        ranges (list): (first column, end column) pairs
+    """
+    ranges = [(int(start), int(end)) for start, end in ranges if end > start]
+    if not ranges:
+        return
+
+    selected = np.zeros(len(matrix.indices), dtype=bool)
+    for start, end in ranges:
+        selected |= (matrix.indices >= start) & (matrix.indices < end)
+    positions = np.flatnonzero(selected)
+
+    # Postings in passage order, weighted by BM25 tf x idf
+    positions = positions[np.argsort(matrix.indices[positions], kind='stable')]
+    rows = np.searchsorted(matrix.indptr, positions, side='right') - 1
+    columns = matrix.indices[positions]
+    weights = matrix.data[positions] * matrix.idf[rows]
+
+    # Hash only the terms of these passages
+    used_rows, rows = np.unique(rows, return_inverse=True)
+    terms = np.empty(len(matrix.vocabulary), dtype=object)
+    terms[np.fromiter(matrix.vocabulary.values(), dtype=np.int64, count=len(matrix.vocabulary))] = \
+        list(matrix.vocabulary)
+    feature_ptr, feature_dims, feature_values = encode_terms(terms[used_rows].tolist())
+    feature_counts = np.diff(feature_ptr)
+
+    for range_start, range_end in ranges:
+        for first_column in range(range_start, range_end, BUILD_CHUNK_PASSAGES):
+            last_column = min(first_column + BUILD_CHUNK_PASSAGES, range_end)
+            start, end = np.searchsorted(columns, (first_column, last_column))
+            if start == end:
+                continue
+            chunk_rows = rows[start:end]
+            lengths = feature_counts[chunk_rows]
+
+            # One entry per (posting, hashed feature dimension) pair
+            posting_of_entry = np.repeat(np.arange(end - start), lengths)
+            first_entry = np.cumsum(lengths) - lengths
+            entries = feature_ptr[chunk_rows][posting_of_entry] + np.arange(len(posting_of_entry)) \
+                - first_entry[posting_of_entry]
+
+            cells = (columns[start:end][posting_of_entry] - first_column) * DENSE_DIMENSIONS + feature_dims[entries]
+            sums = np.bincount(cells, weights=weights[start:end][posting_of_entry] * feature_values[entries],
+                               minlength=BUILD_CHUNK_PASSAGES * DENSE_DIMENSIONS)
+            chunk = sums.reshape(BUILD_CHUNK_PASSAGES, DENSE_DIMENSIONS)
+            vectors[first_column:last_column] = normalize_rows(chunk[:last_column - first_column]).astype(np.float32)
+
+
+def normalize_rows(vectors):
+    """
+    L2-normalize the rows of a matrix in place (zero rows stay zero).
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class DenseIndex:
+    """
+    float32 passage vectors over every document of a knowledge base.
+
+    Row c of vectors is the passage in column c of the TermMatrix it was
+    built from (documents and doc_offsets are shared with it). With an IVF
+    partition, the passages of cluster k are members[list_offsets[k]:list_offsets[k + 1]].
+    changed_passages counts the passages embedded or removed since every
+    vector was last weighted (see REWEIGHT_SHARE).
+    """
+
+    def __init__(self, matrix, vectors, centroids=None, list_offsets=None, members=None, changed_passages=0):
+        self.matrix = matrix
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.members = members
+        self.changed_passages = changed_passages
+        self.unknown_idf = math.log(1.0 + (matrix.column_count + 0.5) / 0.5)
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the passage vectors and the IVF partition.
+        """
+        extra = 0 if self.centroids is None else self.centroids.nbytes + self.members.nbytes
+        return self.vectors.nbytes + extra
+
+    @classmethod
+    def build(cls, matrix, previous=None, ivf_min_passages=IVF_MIN_PASSAGES):
+        """
+        Embed every passage of a TermMatrix.
+
+        With the index of the previous version, documents it already embedded
+        keep their vectors (and IVF clusters) and only new or changed ones are
+        embedded - until REWEIGHT_SHARE of the passages has changed.
+
+        Args:
+            matrix (TermMatrix): BM25 term-passage matrix of the knowledge base
+            previous (DenseIndex): Index of an earlier version to reuse, or None
+            ivf_min_passages (int): Build an IVF partition from this many passages (0: never)
+
+        Returns:
+            DenseIndex: The index
+        """
+        vectors = np.zeros((matrix.column_count, DENSE_DIMENSIONS), dtype=np.float32)
+        reused = []  # (column range here, column range in previous)
+        missing = []
+        if previous is not None:
+            earlier = {
+                id(document.index): (document.index, previous.matrix.doc_offsets[position],
+                                     previous.matrix.doc_offsets[position + 1])
+                for position, document in enumerate(previous.matrix.documents)
+            }
+            for position, document in enumerate(matrix.documents):
+                start, end = matrix.doc_offsets[position], matrix.doc_offsets[position + 1]
+                entry = earlier.get(id(document.index))
+                if entry is not None and entry[0] is document.index:
+                    reused.append(((start, end), entry[1:]))
+                else:
+                    missing.append((start, end))
+
+            kept = sum(end - start for (start, end), _ in reused)
+            changed = previous.changed_passages + (matrix.column_count - kept) + (previous.matrix.column_count - kept)
+            if changed > REWEIGHT_SHARE * max(1, matrix.column_count):
+                reused, missing, changed = [], [], 0
+        if not reused:
+            missing, changed = [(0, matrix.column_count)], 0
+
+        for (start, end), (previous_start, previous_end) in reused:
+            vectors[start:end] = previous.vectors[previous_start:previous_end]
+        embed_columns(matrix, vectors, missing)
+
+        index = cls(matrix, vectors, changed_passages=changed)
+        if reused and previous.centroids is not None:
+            index.extend_ivf(previous, reused, missing)
+        elif ivf_min_passages and matrix.column_count >= ivf_min_passages:
+            index.build_ivf()
+        return index
+
+    def build_ivf(self, list_count=None, iterations=IVF_ITERATIONS, seed=0):
+        """
+        Partition the passages into clusters with spherical k-means.
+
+        Args:
+            list_count (int): Number of clusters (default: about sqrt(passages))
+            iterations (int): k-means iterations
+            seed (int): Seed for the initial centroids (builds are reproducible)
+        """
+        count = len(self.vectors)
+        list_count = list_count or max(1, int(math.sqrt(count)))
+        rng = np.random.default_rng(seed)
+        centroids = self.vectors[rng.choice(count, size=list_count, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = self.nearest_centroids(centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, self.vectors)
+            filled = np.bincount(assignment, minlength=list_count) > 0
+            centroids[filled] = normalize_rows(sums[filled])
+
+        self.set_clusters(centroids, self.nearest_centroids(centroids))
+
+    def extend_ivf(self, previous, reused, missing):
+        """
+        Keep the clusters of a previous index: reused passages stay in their
+        cluster, newly embedded ones join the nearest centroid.
+        """
+        earlier = np.empty(len(previous.vectors), dtype=np.int64)
+        earlier[previous.members] = np.repeat(np.arange(len(previous.centroids)), np.diff(previous.list_offsets))
+
+        assignment = np.empty(len(self.vectors), dtype=np.int64)
+        for (start, end), (previous_start, previous_end) in reused:
+            assignment[start:end] = earlier[previous_start:previous_end]
+        for start, end in missing:
+            assignment[start:end] = self.nearest_centroids(previous.centroids, self.vectors[start:end])
+        self.set_clusters(previous.centroids, assignment)
+
+    def set_clusters(self, centroids, assignment):
+        """
+        Store the IVF partition for a cluster assignment of every passage.
+        """
+        self.members = np.argsort(assignment, kind='stable').astype(np.int64)
+        self.list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=len(centroids)), out=self.list_offsets[1:])
+        self.centroids = centroids
+
+    def nearest_centroids(self, centroids, vectors=None):
+        """
+        Cluster of every passage vector, or of vectors (computed in chunks to bound memory).
+        """
+        vectors = self.vectors if vectors is None else vectors
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for first in range(0, len(vectors), BUILD_CHUNK_PASSAGES):
+            block = vectors[first:first + BUILD_CHUNK_PASSAGES]
+            assignment[first:first + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignment
+
+    def encode_query(self, terms):
+        """
+        Unit-norm float32 vector of query terms, weighted by query tf x idf.
+
+        Terms outside the vocabulary still contribute their trigrams, with
+        the IDF of a term that occurs nowhere.
+        """
+        vector = np.zeros(DENSE_DIMENSIONS, dtype=np.float64)
+        for term, query_tf in Counter(terms).items():
+            row = self.matrix.vocabulary.get(term)
+            idf = self.matrix.idf[row] if row is not None else self.unknown_idf
+            indptr, dimensions, values = encode_terms([term])
+            np.add.at(vector, dimensions, values * idf * query_tf)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).astype(np.float32)
+
+    def similarities(self, query_vector, columns):
+        """
+        Cosine similarity of a query vector to the passages in columns.
+        """
+        return self.vectors[columns] @ query_vector
+
+    def search(self, terms, limit=None):
+        """
+        Rank passages by cosine similarity to the query.
+
+        Args:
+            terms (list): Query terms
+            limit (int): Maximum number of results (None for all)
+
+        Returns:
+            list: (document, passage_id, similarity) tuples, best first
+        """
+        return self.search_vectors(self.encode_query(terms)[None, :], limit)[0]
+
+    def search_many(self, term_lists, limit=None):
+        """
+        Rank passages for a batch of queries with one matrix product.
+
+        Returns:
+            list: Per query, (document, passage_id, similarity) tuples, best first
+        """
+        if not term_lists:
+            return []
+        return self.search_vectors(np.stack([self.encode_query(terms) for terms in term_lists]), limit)
+
+    def search_vectors(self, query_vectors, limit=None):
+        """
+        Rank passages for a (queries x dimensions) batch of query vectors.
+        """
+        if self.centroids is None:
+            scores = query_vectors @ self.vectors.T
+            return [self.rank(row, None, limit) for row in scores]
+
+        # IVF: score only the passages of the nearest clusters
+        probes = min(IVF_PROBE_LISTS, len(self.centroids))
+        nearest = np.argpartition(-(query_vectors @ self.centroids.T), probes - 1, axis=1)[:, :probes]
+        results = []
+        for query_vector, lists in zip(query_vectors, nearest):
+            columns = np.concatenate([self.members[self.list_offsets[k]:self.list_offsets[k + 1]] for k in lists])
+            results.append(self.rank(self.vectors[columns] @ query_vector, columns, limit))
+        return results
+
+    def rank(self, scores, columns=None, limit=None):
+        """
+        Turn similarities (of all passages, or of columns) into ranked results.
+        """
+        matched = np.flatnonzero(scores >= DENSE_MIN_SIMILARITY)
+        if limit and len(matched) > limit:
+            matched = matched[np.argpartition(scores[matched], -limit)[-limit:]]
+        matched = matched[np.argsort(-scores[matched], kind='stable')]
+
+        positions = matched if columns is None else columns[matched]
+        matrix = self.matrix
+        owners = np.searchsorted(matrix.doc_offsets, positions, side='right') - 1
+        return [
+            (matrix.documents[owner], int(column - matrix.doc_offsets[owner]), float(score))
+            for owner, column, score in zip(owners, positions, scores[matched])
+        ]
+
+
+def blend(keyword_ranked, dense_ranked, dense_index, terms, dense_weight, limit=None):
+    """
+    Combine keyword (BM25) and dense rankings into one.
+
+    BM25 scores are scaled by the best one so both parts lie in [0, 1]:
+    score = (1 - dense_weight) x bm25 / best bm25 + dense_weight x similarity.
+    Keyword candidates missing from the dense ranking get their similarity
+    computed; dense candidates outside the keyword ranking count 0 for BM25.
+
+    Args:
+        keyword_ranked (list): (document, passage_id, score) from BM25
+        dense_ranked (list): (document, passage_id, similarity) from dense search
+        dense_index (DenseIndex): Index the dense ranking came from
+        terms (list): Query terms
+        dense_weight (float): Share of the dense similarity in the blend (0..1)
+        limit (int): Maximum number of results (None for all)
+
+    Returns:
+        list: (document, passage_id, score) tuples, best first
+    """
+    best = keyword_ranked[0][2] if keyword_ranked else 0.0
+    similarity = {(id(document), passage_id): score for document, passage_id, score in dense_ranked}
+
+    missing = [(document, passage_id) for document, passage_id, _ in keyword_ranked
+               if (id(document), passage_id) not in similarity]
+    if missing:
+        offsets = {id(document): dense_index.matrix.doc_offsets[position]
+                   for position, document in enumerate(dense_index.matrix.documents)}
+        columns = np.asarray([offsets[id(document)] + passage_id for document, passage_id in missing], dtype=np.int64)
+        scores = dense_index.similarities(dense_index.encode_query(terms), columns)
+        for (document, passage_id), score in zip(missing, scores):
+            similarity[(id(document), passage_id)] = max(0.0, float(score))
+
+    blended = {}
+    for document, passage_id, score in keyword_ranked:
+        key = (id(document), passage_id)
+        keyword_part = score / best if best else 0.0
+        blended[key] = (document, passage_id, (1.0 - dense_weight) * keyword_part + dense_weight * similarity[key])
+    for document, passage_id, score in dense_ranked:
+        key = (id(document), passage_id)
+        if key not in blended:
+            blended[key] = (document, passage_id, dense_weight * score)
+
+    ranked = sorted(blended.values(), key=lambda item: item[2], reverse=True)
+    return ranked[:limit] if limit else ranked
@@ -0,0 +1,263 @@
+"""
+Inverted Index with BM25 Ranking for the PDF Knowledge Base
+
+Built once per Lambda container by load_pdf_from_s3() so that a fallback
+query only walks the postings of its own terms instead of rescanning every
+page of the PDF. The index is positional: every posting also records where
+in the passage the term occurs, for phrase and proximity scoring (see
+kb_proximity.py).
+
+Runtime: Python 3.10
+"""
+
+import heapq
+import math
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import accumulate
+
+# Same token rule as extract_keywords() so query terms line up with postings
+TOKEN_PATTERN = re.compile(r'\b[a-z0-9]+\b')
+
+# Standard Okapi BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Token positions are stored as u16; later tokens of a longer document all
+# share the last position (passages hold a few hundred tokens)
+MAX_POSITION = 0xFFFF
+
+
+def tokenize(text):
+    """
+    Split text into lowercase alphanumeric terms.
+
+    Args:
+        text (str): Raw text
+
+    Returns:
+        list: Terms in document order
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def rank_key(item):
+    """
+    Sort key of a (doc_id, score) result: best score first, then lowest doc id.
+    """
+    return -item[1], item[0]
+
+
+class InvertedIndex:
+    """
+    Term -> postings index over a list of documents (PDF pages).
+
+    Postings are stored CSR-style in flat arrays: the postings of term id t
+    live in doc_ids[offsets[t]:offsets[t + 1]], with the matching term
+    frequencies at the same positions in freqs. The token positions of
+    posting i are positions[position_offsets[i]:position_offsets[i + 1]],
+    in ascending order (both are None for an index without positions).
+    """
+
+    def __init__(self, vocabulary, offsets, doc_ids, freqs, doc_lengths,
+                 position_offsets=None, positions=None, k1=BM25_K1, b=BM25_B):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.freqs = freqs
+        self.doc_lengths = doc_lengths
+        self.position_offsets = position_offsets
+        self.positions = positions
+        self.k1 = k1
+        self.b = b
+        self.doc_count = len(doc_lengths)
+        self.avg_doc_length = (sum(doc_lengths) / self.doc_count) if self.doc_count else 0.0
+
+    @classmethod
+    def build(cls, documents):
+        """
+        Build an index from document texts.
+
+        Args:
+            documents (iterable): Document texts; a document's id is its position
+
+        Returns:
+            InvertedIndex: The populated index
+        """
+        # Postings are collected per term as interleaved (doc_id, tf) pairs
+        # in one array and positions in another: a tuple per posting would
+        # dominate the load peak
+        term_postings = {}
+        doc_lengths = array('I')
+
+        for doc_id, text in enumerate(documents):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+
+            # A stable sort by term groups the positions of each term in
+            # ascending order, in the same order as the sorted distinct terms
+            order = sorted(range(len(tokens)), key=tokens.__getitem__)
+            if len(tokens) > MAX_POSITION:
+                order = [min(position, MAX_POSITION) for position in order]
+
+            first = 0
+            counts = Counter(tokens)
+            for term in sorted(counts):
+                tf = counts[term]
+                collected = term_postings.get(term)
+                if collected is None:
+                    collected = term_postings[term] = (array('I'), array('H'))
+                collected[0].append(doc_id)
+                collected[0].append(tf)
+                collected[1].extend(order[first:first + tf])
+                first += tf
+
+        vocabulary = {}
+        offsets = array('I', [0])
+        doc_ids = array('I')
+        freqs = array('I')
+        positions = array('H')
+
+        for term_id, term in enumerate(sorted(term_postings)):
+            vocabulary[term] = term_id
+            postings, term_positions = term_postings.pop(term)
+            doc_ids.extend(postings[0::2])
+            freqs.extend(postings[1::2])
+            offsets.append(len(doc_ids))
+            positions.extend(term_positions)
+
+        # Posting i has freqs[i] positions, so its offset is a running sum of tf
+        position_offsets = array('I', accumulate(freqs, initial=0))
+
+        return cls(vocabulary, offsets, doc_ids, freqs, doc_lengths, position_offsets, positions)
+
+    @property
+    def positional(self):
+        """
+        True if the index records token positions.
+        """
+        return self.positions is not None
+
+    def term_positions(self, term, doc_id):
+        """
+        Positions of a term in one document.
+
+        Binary-searches the term's postings (doc ids ascend within a term),
+        so the cost is logarithmic in its document frequency.
+
+        Args:
+            term (str): Term
+            doc_id (int): Document id
+
+        Returns:
+            Sequence of ascending token positions (empty if the term does
+            not occur in the document or the index has no positions)
+        """
+        term_id = self.vocabulary.get(term)
+        if term_id is None or self.positions is None:
+            return ()
+        first, last = self.offsets[term_id], self.offsets[term_id + 1]
+        i = bisect_left(self.doc_ids, doc_id, first, last)
+        if i == last or self.doc_ids[i] != doc_id:
+            return ()
+        return self.positions[self.position_offsets[i]:self.position_offsets[i + 1]]
+
+    def doc_freq(self, term):
+        """
+        Number of documents containing term.
+        """
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return 0
+        return self.offsets[term_id + 1] - self.offsets[term_id]
+
+    def idf(self, term):
+        """
+        BM25 inverse document frequency (always non-negative).
+        """
+        df = self.doc_freq(term)
+        return math.log(1.0 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def score(self, terms, stats=None):
+        """
+        Score documents against query terms with BM25.
+
+        Only the postings of the query terms are visited, so cost grows with
+        the number of matching postings rather than with corpus size.
+
+        Args:
+            terms (list): Query terms (repeated terms weigh more)
+            stats (CorpusStats): Collection-wide statistics when this index is
+                                 one of several being searched together
+
+        Returns:
+            dict: doc_id -> BM25 score for every document matching any term
+        """
+        stats = stats or self
+        scores = {}
+        k1 = self.k1
+        norm_base = k1 * (1.0 - self.b)
+        norm_scale = (k1 * self.b / stats.avg_doc_length) if stats.avg_doc_length else 0.0
+
+        for term, query_tf in Counter(terms).items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+
+            weight = stats.idf(term) * query_tf
+            for i in range(self.offsets[term_id], self.offsets[term_id + 1]):
+                doc_id = self.doc_ids[i]
+                tf = self.freqs[i]
+                norm = norm_base + norm_scale * self.doc_lengths[doc_id]
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * tf * (k1 + 1.0) / (tf + norm)
+
+        return scores
+
+    def search(self, terms, limit=None):
+        """
+        Rank documents for query terms.
+
+        Args:
+            terms (list): Query terms
+            limit (int): Maximum number of results (None for all)
+
+        Returns:
+            list: (doc_id, score) tuples, best first (ties by doc id)
+        """
+        # Best score first, equal scores by doc id
+        scores = self.score(terms)
+        if limit:
+            # Bounded heap: O(n log limit), no sorted copy of every match
+            return heapq.nsmallest(limit, scores.items(), key=rank_key)
+        return sorted(scores.items(), key=rank_key)
+
+
+class CorpusStats:
+    """
+    BM25 collection statistics across several indexes.
+
+    Lets per-PDF indexes be scored as one corpus: document counts, average
+    length and document frequencies are summed over all of them, so scores
+    from different indexes are directly comparable.
+    """
+
+    def __init__(self, indexes):
+        self.indexes = list(indexes)
+        self.doc_count = sum(index.doc_count for index in self.indexes)
+        total_length = sum(index.avg_doc_length * index.doc_count for index in self.indexes)
+        self.avg_doc_length = (total_length / self.doc_count) if self.doc_count else 0.0
+
+    def doc_freq(self, term):
+        """
+        Number of documents containing term, across all indexes.
+        """
+        return sum(index.doc_freq(term) for index in self.indexes)
+
+    def idf(self, term):
+        """
+        BM25 inverse document frequency over the whole collection.
+        """
+        df = self.doc_freq(term)
+        return math.log(1.0 + (self.doc_count - df + 0.5) / (df + 0.5))
@@ -0,0 +1,225 @@
+"""
+Sparse Term-Passage Matrix for Vectorized BM25 Scoring
+
+Built once per knowledge base version from the per-document inverted
+indexes; after a refresh only the changed documents' terms are looked up
+again, the merge itself is NumPy array work. Every stored weight is the BM25 term-frequency part of a posting,
+tf * (k1 + 1) / (tf + norm), so scoring a query is a sparse vector-matrix
+product: the query's IDF-weighted term vector times the term rows of the
+matrix. A batch of queries is scored with a single scatter-add into a
+(queries x passages) score matrix.
+
+Scores are identical to InvertedIndex.score() with collection-wide
+CorpusStats. NumPy is optional: without it the knowledge base keeps using the
+pure-Python scorer.
+
+Runtime: Python 3.10
+"""
+
+from collections import Counter
+
+from structured_log import log
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    log.warning("NumPy not available - using pure-Python BM25 scoring")
+
+# Upper bound on query x passage cells scored at once (8 bytes each)
+MAX_BATCH_CELLS = 4 * 1024 * 1024
+
+# Rows of terms no document contains any more are kept across refreshes
+# until they outnumber the live ones, then the vocabulary is rebuilt
+MAX_DEAD_ROW_SHARE = 0.5
+
+
+class TermMatrix:
+    """
+    CSR term x passage matrix over every document of a knowledge base.
+
+    The postings of term row t are columns indices[indptr[t]:indptr[t + 1]]
+    with BM25 tf weights at the same positions in data. Column c belongs to
+    documents[d] with local passage id c - doc_offsets[d].
+
+    term_rows[d] holds the row of every posting of documents[d], in its
+    index's own posting order. It is what a rebuild after a refresh reuses
+    for unchanged documents: their terms keep their rows, as the vocabulary
+    only grows (see MAX_DEAD_ROW_SHARE).
+    """
+
+    def __init__(self, vocabulary, indptr, indices, data, idf, documents, doc_offsets, term_rows):
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.idf = idf
+        self.documents = documents
+        self.doc_offsets = doc_offsets
+        self.term_rows = term_rows
+        self.column_count = int(doc_offsets[-1])
+
+    @classmethod
+    def build(cls, documents, previous=None):
+        """
+        Merge the inverted indexes of documents into one matrix.
+
+        With the matrix of the previous version, only documents that are new
+        since then have their terms looked up; the rest of the merge - BM25
+        weights with the new collection statistics, and the (row, column)
+        ordering - is whole-array NumPy work.
+
+        Args:
+            documents (list): KbDocuments, all with an index
+            previous (TermMatrix): Matrix of the previous version to reuse, or None
+
+        Returns:
+            TermMatrix: The matrix
+        """
+        documents = list(documents)
+        indexes = [document.index for document in documents]
+
+        vocabulary = dict(previous.vocabulary) if previous is not None else {}
+        reusable = {} if previous is None else {
+            id(document.index): (document.index, rows)
+            for document, rows in zip(previous.documents, previous.term_rows)
+        }
+
+        term_rows = []
+        for index in indexes:
+            entry = reusable.get(id(index))
+            if entry is not None and entry[0] is index:
+                term_rows.append(entry[1])
+                continue
+            # Local term id -> global row, in the index's own term id order
+            local_terms = sorted(index.vocabulary, key=index.vocabulary.get)
+            for term in local_terms:
+                vocabulary.setdefault(term, len(vocabulary))
+            local_rows = np.fromiter((vocabulary[term] for term in local_terms),
+                                     dtype=np.int32, count=len(local_terms))
+            offsets = np.frombuffer(index.offsets, dtype=np.uint32)
+            term_rows.append(np.repeat(local_rows, np.diff(offsets)))
+
+        doc_offsets = np.zeros(len(indexes) + 1, dtype=np.int64)
+        for position, index in enumerate(indexes):
+            doc_offsets[position + 1] = doc_offsets[position] + index.doc_count
+
+        total_length = sum(index.avg_doc_length * index.doc_count for index in indexes)
+        avg_doc_length = (total_length / doc_offsets[-1]) if doc_offsets[-1] else 0.0
+
+        rows, columns, weights = [], [], []
+        for position, index in enumerate(indexes):
+            doc_ids = np.frombuffer(index.doc_ids, dtype=np.uint32).astype(np.int64)
+            freqs = np.frombuffer(index.freqs, dtype=np.uint32).astype(np.float64)
+            doc_lengths = np.frombuffer(index.doc_lengths, dtype=np.uint32).astype(np.float64)
+
+            k1 = index.k1
+            norm_scale = (k1 * index.b / avg_doc_length) if avg_doc_length else 0.0
+            norm = k1 * (1.0 - index.b) + norm_scale * doc_lengths[doc_ids]
+
+            rows.append(term_rows[position])
+            columns.append(doc_ids + doc_offsets[position])
+            weights.append(freqs * (k1 + 1.0) / (freqs + norm))
+
+        rows = np.concatenate(rows).astype(np.int64) if rows else np.zeros(0, dtype=np.int64)
+        columns = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+        weights = np.concatenate(weights) if weights else np.zeros(0, dtype=np.float64)
+
+        row_counts = np.bincount(rows, minlength=len(vocabulary))
+        if previous is not None and np.count_nonzero(row_counts == 0) > MAX_DEAD_ROW_SHARE * len(vocabulary):
+            return cls.build(documents)
+
+        # Blocks are in column order and each lists a term's passages in
+        # ascending order, so a stable sort by row alone orders by (row, column)
+        order = np.argsort(rows, kind='stable')
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(row_counts, out=indptr[1:])
+
+        # A posting is one passage containing the term, so row length is df
+        doc_count = float(doc_offsets[-1])
+        idf = np.log(1.0 + (doc_count - row_counts + 0.5) / (row_counts + 0.5))
+
+        return cls(vocabulary, indptr, columns[order], weights[order], idf, documents, doc_offsets, term_rows)
+
+    def search_many(self, term_lists, limit=None):
+        """
+        Rank passages for a batch of queries.
+
+        Args:
+            term_lists (list): One list of query terms per query
+            limit (int): Maximum number of results per query (None for all)
+
+        Returns:
+            list: Per query, (document, passage_id, score) tuples, best first
+        """
+        chunk = max(1, MAX_BATCH_CELLS // max(1, self.column_count))
+        results = []
+        for first in range(0, len(term_lists), chunk):
+            scores = self.score_many(term_lists[first:first + chunk])
+            results.extend(self.rank(row, limit) for row in scores)
+        return results
+
+    def score_many(self, term_lists):
+        """
+        Score a batch of queries against every passage in one operation.
+
+        Args:
+            term_lists (list): One list of query terms per query
+
+        Returns:
+            numpy.ndarray: (queries x passages) BM25 scores
+        """
+        query_ids, term_rows, query_weights = [], [], []
+        for query_id, terms in enumerate(term_lists):
+            for term, query_tf in Counter(terms).items():
+                row = self.vocabulary.get(term)
+                if row is not None:
+                    query_ids.append(query_id)
+                    term_rows.append(row)
+                    query_weights.append(self.idf[row] * query_tf)
+
+        if not term_rows:
+            return np.zeros((len(term_lists), self.column_count))
+
+        term_rows = np.asarray(term_rows, dtype=np.int64)
+        starts = self.indptr[term_rows]
+        lengths = self.indptr[term_rows + 1] - starts
+
+        # Positions of every posting of every (query, term) pair
+        pair_of_posting = np.repeat(np.arange(len(term_rows)), lengths)
+        first_posting = np.cumsum(lengths) - lengths
+        positions = starts[pair_of_posting] + np.arange(len(pair_of_posting)) - first_posting[pair_of_posting]
+
+        flat_cells = np.asarray(query_ids, dtype=np.int64)[pair_of_posting] * self.column_count
+        flat_cells += self.indices[positions]
+        contributions = np.asarray(query_weights)[pair_of_posting] * self.data[positions]
+
+        scores = np.bincount(flat_cells, weights=contributions, minlength=len(term_lists) * self.column_count)
+        return scores.reshape(len(term_lists), self.column_count)
+
+    def rank(self, scores, limit=None):
+        """
+        Turn one row of scores into ranked results.
+
+        Equal scores are ordered by column - document key, then passage id -
+        as the pure-Python path orders them, so both return the same passages.
+
+        Returns:
+            list: (document, passage_id, score) tuples, best first
+        """
+        matched = np.flatnonzero(scores > 0.0)
+        if limit and len(matched) > limit:
+            # Everything above the limit-th best score, then the lowest
+            # columns among the passages tied with it (matched is ascending)
+            cutoff = np.partition(scores[matched], -limit)[-limit]
+            above = matched[scores[matched] > cutoff]
+            tied = matched[scores[matched] == cutoff]
+            matched = np.concatenate((above, tied[:limit - len(above)]))
+        matched = matched[np.lexsort((matched, -scores[matched]))]
+
+        owners = np.searchsorted(self.doc_offsets, matched, side='right') - 1
+        return [
+            (self.documents[owner], int(column - self.doc_offsets[owner]), float(scores[column]))
+            for owner, column in zip(owners, matched)
+        ]
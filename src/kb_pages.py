@@ -0,0 +1,90 @@
+"""
+Compact Page Storage for the PDF Knowledge Base
+
+A document's pages are kept as one contiguous UTF-8 buffer plus array-backed
+offsets and page numbers, instead of a list of {'page', 'content'} dicts
+holding one str each. That removes the per-page object overhead, stores
+mostly-ASCII text at one byte per character (a str holding a single '•' is
+stored at two bytes per character), and lets a prebuilt artifact serve its
+text section straight from the memory map, without copying it onto the heap.
+
+PageStore behaves like the page list produced by extract_pdf_pages() (a
+sequence of {'page', 'content'} dicts, built on access like LazyPdfPages),
+so indexing and the artifact builder take either. Answers read one passage
+with passage_text(), which decodes only that page.
+
+Runtime: Python 3.10
+"""
+
+from array import array
+
+
+class PageStore:
+    """
+    Sequence of {'page', 'content'} dicts over a single UTF-8 text buffer.
+
+    Page i is text[offsets[i]:offsets[i + 1]] (byte offsets).
+    """
+
+    __slots__ = ('text', 'offsets', 'page_numbers')
+
+    def __init__(self, text, offsets, page_numbers):
+        """
+        Args:
+            text: UTF-8 bytes (or a memoryview of them, e.g. an artifact mapping)
+            offsets: len(page_numbers) + 1 byte offsets into text
+            page_numbers: 1-based page number of each stored page
+        """
+        self.text = text
+        self.offsets = offsets
+        self.page_numbers = page_numbers
+
+    @classmethod
+    def from_pages(cls, pages):
+        """
+        Pack {'page', 'content'} dicts into a PageStore.
+
+        Args:
+            pages (iterable): {'page', 'content'} dicts
+
+        Returns:
+            PageStore: The packed pages
+        """
+        encoded = []
+        offsets = array('I', [0])
+        page_numbers = array('I')
+        for page_data in pages:
+            data = page_data['content'].encode('utf-8')
+            encoded.append(data)
+            offsets.append(offsets[-1] + len(data))
+            page_numbers.append(page_data['page'])
+        return cls(b''.join(encoded), offsets, page_numbers)
+
+    def __len__(self):
+        return len(self.page_numbers)
+
+    def __getitem__(self, position):
+        return {'page': self.page_numbers[position], 'content': self.page_text(position)}
+
+    def __iter__(self):
+        return (self[position] for position in range(len(self)))
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the text buffer and the two arrays.
+        """
+        return (memoryview(self.text).nbytes + memoryview(self.offsets).nbytes
+                + memoryview(self.page_numbers).nbytes)
+
+    def page_text(self, position):
+        """
+        Text of the page at a position (decoded on every call).
+        """
+        return str(self.text[self.offsets[position]:self.offsets[position + 1]], 'utf-8')
+
+    def passage_text(self, position, start, end):
+        """
+        Characters start:end of the page at a position.
+        """
+        return self.page_text(position)[start:end]
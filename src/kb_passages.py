@@ -0,0 +1,150 @@
+"""
+Passage-Level Chunking for the PDF Knowledge Base
+
+Pages are split at load time into overlapping passages that start and end
+on sentence boundaries. The inverted index is built over passages instead
+of whole pages, so retrieval ranks passages directly and the answer snippet
+is just a slice of the page - no per-request scanning for keywords or
+sentence boundaries.
+
+Runtime: Python 3.10
+"""
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+
+from kb_index import InvertedIndex
+
+# Passages are at most this long, in characters
+PASSAGE_CHARS = 1000
+
+# A new passage starts roughly every PASSAGE_STRIDE characters, so
+# consecutive passages overlap by about half
+PASSAGE_STRIDE = 500
+
+# A sentence ends at . ? or ! followed by whitespace, or at a blank line
+SENTENCE_BREAK = re.compile(r'[.?!]\s+|\n\s*\n')
+
+
+def sentence_starts(text):
+    """
+    Offsets at which sentences start, plus len(text) as a final boundary.
+
+    Args:
+        text (str): Page text
+
+    Returns:
+        list: Sorted character offsets, starting with 0 and ending with len(text)
+    """
+    boundaries = [0]
+    for match in SENTENCE_BREAK.finditer(text):
+        if match.end() > boundaries[-1]:
+            boundaries.append(match.end())
+    if boundaries[-1] != len(text):
+        boundaries.append(len(text))
+    return boundaries
+
+
+def chunk_text(text, max_chars=PASSAGE_CHARS, stride=PASSAGE_STRIDE):
+    """
+    Split text into overlapping passages aligned to sentence boundaries.
+
+    A passage extends to the last sentence boundary within max_chars (or is
+    cut hard at max_chars if a single sentence is longer). The next passage
+    starts at the first sentence boundary at least stride characters later.
+
+    Args:
+        text (str): Page text
+        max_chars (int): Maximum passage length
+        stride (int): Target distance between passage starts
+
+    Returns:
+        list: (start, end) character offsets
+    """
+    boundaries = sentence_starts(text)
+    length = len(text)
+
+    spans = []
+    start = 0
+    while start < length:
+        last = bisect_right(boundaries, start + max_chars) - 1
+        end = boundaries[last] if boundaries[last] > start else min(length, start + max_chars)
+        spans.append((start, end))
+
+        if end >= length:
+            break
+
+        following = bisect_left(boundaries, start + stride)
+        next_start = boundaries[following] if following < len(boundaries) else end
+        start = next_start if start < next_start < end else end
+
+    return spans
+
+
+class Passages:
+    """
+    Passage table of one document: passage i is characters starts[i]:ends[i]
+    of the page at position page_positions[i].
+    """
+
+    __slots__ = ('page_positions', 'starts', 'ends')
+
+    def __init__(self, page_positions=None, starts=None, ends=None):
+        self.page_positions = page_positions if page_positions is not None else array('I')
+        self.starts = starts if starts is not None else array('I')
+        self.ends = ends if ends is not None else array('I')
+
+    def __len__(self):
+        return len(self.page_positions)
+
+    def append(self, page_position, start, end):
+        self.page_positions.append(page_position)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def span(self, passage_id):
+        """
+        Returns:
+            tuple: (page position, start offset, end offset)
+        """
+        return self.page_positions[passage_id], self.starts[passage_id], self.ends[passage_id]
+
+    def snippet(self, pages, passage_id):
+        """
+        Ready-to-use text of a passage.
+
+        Args:
+            pages: PageStore or LazyPdfPages the passages were built over
+            passage_id (int): Passage id
+
+        Returns:
+            tuple: (page number, passage text)
+        """
+        page_position, start, end = self.span(passage_id)
+        return pages.page_numbers[page_position], pages.passage_text(page_position, start, end).strip()
+
+
+def build_passage_index(pages, max_chars=PASSAGE_CHARS, stride=PASSAGE_STRIDE):
+    """
+    Chunk pages into passages and index them in a single pass over the pages.
+
+    Args:
+        pages (iterable): {'page', 'content'} dicts
+        max_chars (int): Maximum passage length
+        stride (int): Target distance between passage starts
+
+    Returns:
+        tuple: (Passages, InvertedIndex) - index doc ids are passage ids
+    """
+    passages = Passages()
+
+    def passage_texts():
+        for page_position, page_data in enumerate(pages):
+            text = page_data['content']
+            for start, end in chunk_text(text, max_chars, stride):
+                passages.append(page_position, start, end)
+                yield text[start:end]
+
+    index = InvertedIndex.build(passage_texts())
+    return passages, index
@@ -0,0 +1,123 @@
+"""
+Phrase and Proximity Re-Ranking for the PDF Knowledge Base
+
+BM25 scores every query term on its own, so a passage that repeats one
+keyword forty times can outrank the passage where all the keywords appear
+together. The best BM25 candidates are therefore re-scored with a term-pair
+proximity component in the style of BM25TP (Rasolofo & Savoy):
+
+- every pair of occurrences of two distinct query terms at most
+  PROXIMITY_WINDOW tokens apart adds 1 / distance² to that pair's weight,
+  so an exact two-word phrase adds 1 per occurrence and words three tokens
+  apart add 1/9
+- the pair weight is saturated like a BM25 term frequency (same k1 and
+  length normalization) and multiplied by the IDF of the rarer term
+- the sum over all term pairs is added to the passage's BM25 score
+
+Only the positions of the query terms in the candidate passages are read,
+found by binary search in the positional index, so the cost depends on the
+candidate count and query length, not on corpus size. Distances ignore word
+order, so a keyword set keeps a single answer (see ANSWER_CACHE).
+
+Runtime: Python 3.10
+"""
+
+# BM25 results re-scored per query
+PROXIMITY_CANDIDATES = 20
+
+# Occurrences further apart than this many tokens earn nothing
+PROXIMITY_WINDOW = 5
+
+
+def pair_weight(left, right, window=PROXIMITY_WINDOW):
+    """
+    Proximity weight of two terms in one passage.
+
+    Args:
+        left: Ascending token positions of one term
+        right: Ascending token positions of the other term
+        window (int): Largest distance that counts
+
+    Returns:
+        float: Sum of 1 / distance² over occurrence pairs within window
+    """
+    total = 0.0
+    first = 0
+    count = len(right)
+    for position in left:
+        while first < count and right[first] < position - window:
+            first += 1
+        i = first
+        while i < count and right[i] <= position + window:
+            distance = right[i] - position
+            if distance:
+                total += 1.0 / (distance * distance)
+            i += 1
+    return total
+
+
+def proximity_score(index, doc_id, terms, idf, avg_doc_length):
+    """
+    Proximity component of one passage's score.
+
+    Args:
+        index (InvertedIndex): Positional index the passage belongs to
+        doc_id (int): Passage id within index
+        terms (list): Distinct query terms
+        idf (dict): term -> collection-wide IDF
+        avg_doc_length (float): Collection-wide average passage length
+
+    Returns:
+        float: Score to add to the passage's BM25 score
+    """
+    found = []
+    for term in terms:
+        positions = index.term_positions(term, doc_id)
+        if len(positions):
+            found.append((term, positions))
+    if len(found) < 2:
+        return 0.0
+
+    k1 = index.k1
+    norm = k1 * (1.0 - index.b)
+    if avg_doc_length:
+        norm += k1 * index.b * index.doc_lengths[doc_id] / avg_doc_length
+
+    score = 0.0
+    for i, (left_term, left) in enumerate(found):
+        for right_term, right in found[i + 1:]:
+            weight = pair_weight(left, right)
+            if weight:
+                score += min(idf[left_term], idf[right_term]) * weight * (k1 + 1.0) / (weight + norm)
+    return score
+
+
+def rerank(ranked, terms, stats):
+    """
+    Re-score the best BM25 results with term proximity.
+
+    The first PROXIMITY_CANDIDATES results are re-scored and re-sorted; the
+    bonus is never negative, so they stay ahead of the rest, which keep
+    their order and BM25 scores.
+
+    Args:
+        ranked (list): (document, passage_id, score) tuples, best first
+        terms (list): Query terms
+        stats (CorpusStats): Collection-wide statistics of the searched documents
+
+    Returns:
+        list: (document, passage_id, score) tuples, best first
+    """
+    terms = list(dict.fromkeys(terms))
+    if len(terms) < 2 or not ranked:
+        return ranked
+
+    idf = {term: stats.idf(term) for term in terms}
+    candidates = [
+        (document, passage_id, score + proximity_score(document.index, passage_id, terms, idf,
+                                                       stats.avg_doc_length))
+        if document.index.positional else (document, passage_id, score)
+        for document, passage_id, score in ranked[:PROXIMITY_CANDIDATES]
+    ]
+    candidates.sort(key=lambda item: item[2], reverse=True)
+    return candidates + ranked[PROXIMITY_CANDIDATES:]
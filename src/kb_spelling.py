@@ -0,0 +1,320 @@
+"""
+Typo-Tolerant Term Lookup for the PDF Knowledge Base
+
+A misspelled keyword ("lamda", "dynamdb") matches no postings, so the
+question gets the "couldn't find information" reply. The SpellingIndex maps
+query terms that no document contains to the closest corpus term within a
+small edit distance, before scoring.
+
+Every vocabulary term is indexed by its padded character bigrams ('^l',
+'la', ..., 'a$'), bucketed by term length. A single edit destroys at most
+two of a term's bigrams (three for a transposition of adjacent characters),
+so a corpus term within k edits shares at least len(bigrams) - 3k of the
+query term's bigrams and is at most k characters longer or shorter.
+A lookup only counts the postings of the query's bigrams in the nearby
+length buckets and verifies the few terms passing that filter with a
+bounded edit distance - it never scans the whole vocabulary. One edit is
+tried first, with its tighter filter; two edits only when that finds
+nothing.
+
+The knowledge base holds a CorpusSpelling: one SpellingIndex over every
+document at the last full build, plus a small SpellingIndex per document
+loaded since, and the term frequencies of documents replaced or removed
+since. A refresh therefore only indexes the vocabulary of the documents
+that changed; once those make up COMPACT_SHARE of the vocabulary, the next
+refresh merges everything into one index again.
+
+Runtime: Python 3.10
+"""
+
+from array import array
+from collections import Counter
+
+# Shorter terms are too ambiguous to correct ("ec" -> "ecs"? "eks"?)
+MIN_CORRECTION_LENGTH = 4
+
+# Terms of this length or longer may be corrected by two edits, shorter ones by one
+TWO_EDIT_LENGTH = 8
+
+# A CorpusSpelling is rebuilt as one index once the terms of documents
+# changed since its last full build reach this share of it, or once this
+# many documents have their own index
+COMPACT_SHARE = 0.25
+MAX_OVERLAYS = 8
+
+
+def max_edits(term):
+    """
+    Largest edit distance accepted when correcting term.
+    """
+    return 1 if len(term) < TWO_EDIT_LENGTH else 2
+
+
+def bigrams(term):
+    """
+    Distinct character bigrams of term, padded with '^' and '$'.
+    """
+    padded = f"^{term}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def edit_distance(left, right, limit):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent transpositions).
+
+    Args:
+        left (str): First string
+        right (str): Second string
+        limit (int): Stop once the distance is known to exceed this
+
+    Returns:
+        int: The distance, or limit + 1 if it exceeds limit
+    """
+    if abs(len(left) - len(right)) > limit:
+        return limit + 1
+
+    before = None
+    previous = list(range(len(right) + 1))
+    for i, left_char in enumerate(left, 1):
+        current = [i] + [0] * len(right)
+        for j, right_char in enumerate(right, 1):
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (left_char != right_char))
+            if i > 1 and j > 1 and left_char == right[j - 2] and left[i - 2] == right_char:
+                distance = min(distance, before[j - 2] + 1)
+            current[j] = distance
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+
+    return min(previous[-1], limit + 1)
+
+
+class SpellingIndex:
+    """
+    Bigram index over a corpus vocabulary.
+
+    The term ids of every term of length n containing bigram g are
+    postings[(n, g)]; doc_freqs[term_id] breaks ties between equally close
+    candidates in favour of the more common term.
+    """
+
+    def __init__(self, terms, doc_freqs, postings):
+        self.terms = terms
+        self.term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        self.doc_freqs = doc_freqs
+        self.postings = postings
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return term in self.term_ids
+
+    def doc_freq(self, term):
+        """
+        Number of passages containing term (0 for an unknown term).
+        """
+        term_id = self.term_ids.get(term)
+        return 0 if term_id is None else self.doc_freqs[term_id]
+
+    @classmethod
+    def build(cls, indexes):
+        """
+        Index the vocabulary of one or more inverted indexes.
+
+        Args:
+            indexes (iterable): InvertedIndexes whose terms are the corpus vocabulary
+
+        Returns:
+            SpellingIndex: The index
+        """
+        doc_freqs = Counter()
+        for index in indexes:
+            for term in index.vocabulary:
+                doc_freqs[term] += index.doc_freq(term)
+
+        terms = sorted(doc_freqs)
+        postings = {}
+        for term_id, term in enumerate(terms):
+            length = len(term)
+            for gram in bigrams(term):
+                term_ids = postings.get((length, gram))
+                if term_ids is None:
+                    term_ids = postings[(length, gram)] = array('I')
+                term_ids.append(term_id)
+
+        return cls(terms, array('I', (doc_freqs[term] for term in terms)), postings)
+
+    def filtered(self, term, grams, limit):
+        """
+        Terms that pass the bigram count filter for term (not yet verified).
+
+        Args:
+            term (str): Query term
+            grams (set): bigrams(term)
+            limit (int): Maximum edit distance
+
+        Returns:
+            list: Corpus terms that may be within limit edits of term
+        """
+        required = len(grams) - 3 * limit
+
+        shared = Counter()
+        for length in range(max(1, len(term) - limit), len(term) + limit + 1):
+            for gram in grams:
+                shared.update(self.postings.get((length, gram), ()))
+
+        return [self.terms[term_id] for term_id, count in shared.items() if count >= required]
+
+    def candidates(self, term, limit):
+        """
+        Corpus terms within an edit distance of term.
+
+        Args:
+            term (str): Query term (at least MIN_CORRECTION_LENGTH characters)
+            limit (int): Maximum edit distance (1 or 2)
+
+        Returns:
+            list: (distance, term) tuples, closest and then most common first
+        """
+        return verify(self, term, self.filtered(term, bigrams(term), limit), limit)
+
+    def correct(self, term):
+        """
+        The closest corpus term for a query term no document contains.
+
+        Known terms, short terms and terms with digits are returned as is,
+        as are terms without a corpus term within max_edits(term).
+
+        Args:
+            term (str): Query term
+
+        Returns:
+            str: The corrected (or original) term
+        """
+        return correct_term(self, term)
+
+
+class CorpusSpelling:
+    """
+    Typo-tolerant lookup over the vocabulary of a changing set of documents.
+
+    base is a SpellingIndex over base_indexes, the InvertedIndexes of the
+    documents unchanged since the last full build. Every document loaded
+    since has its own SpellingIndex in overlays (keyed by id() of its
+    InvertedIndex, with the index itself), and removed_freqs holds the
+    document frequencies that base still counts for documents replaced or
+    removed since. Frequencies - and so the ranking of candidates and
+    whether a term is known at all - are exactly those of one SpellingIndex
+    over the current documents.
+    """
+
+    def __init__(self, base, base_indexes, overlays, removed_freqs):
+        self.base = base
+        self.base_indexes = base_indexes
+        self.overlays = overlays
+        self.removed_freqs = removed_freqs
+
+    def __contains__(self, term):
+        return self.doc_freq(term) > 0
+
+    @classmethod
+    def build(cls, indexes, previous=None):
+        """
+        Index the vocabulary of the current documents.
+
+        Args:
+            indexes (iterable): InvertedIndexes of every current document
+            previous (CorpusSpelling): Index of an earlier version whose
+                                       unchanged documents can be reused
+
+        Returns:
+            CorpusSpelling: The index
+        """
+        indexes = list(indexes)
+        if previous is None:
+            return cls(SpellingIndex.build(indexes), indexes, {}, Counter())
+
+        current = {id(index): index for index in indexes}
+        base_indexes = []
+        removed_freqs = Counter(previous.removed_freqs)
+        for index in previous.base_indexes:
+            if current.get(id(index)) is index:
+                base_indexes.append(index)
+            else:
+                for term in index.vocabulary:
+                    removed_freqs[term] += index.doc_freq(term)
+
+        in_base = {id(index) for index in base_indexes}
+        overlays = {}
+        for index in indexes:
+            if id(index) not in in_base:
+                entry = previous.overlays.get(id(index))
+                overlays[id(index)] = entry if entry is not None and entry[0] is index \
+                    else (index, SpellingIndex.build([index]))
+
+        pending = len(removed_freqs) + sum(len(overlay) for _, overlay in overlays.values())
+        if len(overlays) > MAX_OVERLAYS or pending > COMPACT_SHARE * len(previous.base):
+            return cls.build(indexes)
+        return cls(previous.base, base_indexes, overlays, removed_freqs)
+
+    def doc_freq(self, term):
+        """
+        Number of passages containing term, over every current document.
+        """
+        freq = self.base.doc_freq(term) - self.removed_freqs.get(term, 0)
+        for _, overlay in self.overlays.values():
+            freq += overlay.doc_freq(term)
+        return freq
+
+    def candidates(self, term, limit):
+        """
+        Corpus terms within an edit distance of term.
+
+        Returns:
+            list: (distance, term) tuples, closest and then most common first
+        """
+        grams = bigrams(term)
+        filtered = set(self.base.filtered(term, grams, limit))
+        for _, overlay in self.overlays.values():
+            filtered.update(overlay.filtered(term, grams, limit))
+        return verify(self, term, filtered, limit)
+
+    def correct(self, term):
+        """
+        The closest corpus term for a query term no document contains (see SpellingIndex.correct).
+        """
+        return correct_term(self, term)
+
+
+def verify(spelling, term, filtered, limit):
+    """
+    The filtered terms really within limit edits of term, ranked.
+
+    Returns:
+        list: (distance, term) tuples, closest and then most common first
+    """
+    found = []
+    for candidate in filtered:
+        distance = edit_distance(term, candidate, limit)
+        if distance <= limit:
+            doc_freq = spelling.doc_freq(candidate)
+            if doc_freq > 0:  # not only in documents removed since
+                found.append((distance, -doc_freq, candidate))
+    found.sort()
+    return [(distance, candidate) for distance, _, candidate in found]
+
+
+def correct_term(spelling, term):
+    """
+    Shared SpellingIndex / CorpusSpelling correct(): known, short and
+    non-alphabetic terms are kept, otherwise the best candidate within one
+    edit, then two (for long terms), replaces term.
+    """
+    if term in spelling or len(term) < MIN_CORRECTION_LENGTH or not term.isalpha():
+        return term
+    for limit in range(1, max_edits(term) + 1):
+        found = spelling.candidates(term, limit)
+        if found:
+            return found[0][1]
+    return term
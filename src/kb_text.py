@@ -0,0 +1,67 @@
+"""
+Text Cleanup for PDF-Extracted Text
+
+clean_pdf_text() runs once per page when the knowledge base is loaded (or
+when the artifact is built), so answer snippets are sliced from text that is
+already clean and queries do no cleanup at all.
+
+All patterns are precompiled. Each one starts with a literal or a small
+character class so the regex engine can skip ahead quickly, and passes for
+characters that do not occur in the text are skipped entirely.
+
+Runtime: Python 3.10
+"""
+
+import re
+
+# Character-level fixes for common PDF artifacts
+LIGATURES = (
+    ('ﬁ', 'fi'),
+    ('ﬂ', 'fl'),
+    ('—', '-'),
+)
+
+ODD_BULLETS = re.compile(r'[▪▫◦⚫⚬○●]')
+LINE_BREAKS_BEFORE_BULLET = re.compile(r'\n+• *')
+BULLET_SPACING = re.compile(r'• *')
+MULTIPLE_SPACES = re.compile(r' {2,}')
+EXTRA_LINE_BREAKS = re.compile(r'\n{3,}')
+SPACE_BEFORE_PUNCTUATION = re.compile(r'\s+([,.;:!?])')
+MISSING_SPACE_AFTER_PERIOD = re.compile(r'\.([A-Z])')
+
+
+def clean_pdf_text(text):
+    """
+    Clean up PDF-extracted text for better readability.
+    Fixes formatting issues, bullets, and line breaks.
+
+    Args:
+        text (str): Raw extracted text
+
+    Returns:
+        str: Cleaned text
+    """
+    # Fix common PDF artifacts (ligatures, em-dashes)
+    for artifact, replacement in LIGATURES:
+        if artifact in text:
+            text = text.replace(artifact, replacement)
+
+    # Remove multiple spaces
+    text = MULTIPLE_SPACES.sub(' ', text)
+
+    # Fix bullets - one bullet glyph, one line break before it, one space after it
+    text = ODD_BULLETS.sub('•', text)
+    if '•' in text:
+        text = LINE_BREAKS_BEFORE_BULLET.sub('\n• ', text)
+        text = BULLET_SPACING.sub('• ', text)
+
+    # Remove extra line breaks (more than 2)
+    text = EXTRA_LINE_BREAKS.sub('\n\n', text)
+
+    # Clean up spaces around punctuation
+    text = SPACE_BEFORE_PUNCTUATION.sub(r'\1', text)
+
+    # Ensure proper spacing after periods
+    text = MISSING_SPACE_AFTER_PERIOD.sub(r'. \1', text)
+
+    return text.strip()
@@ -0,0 +1,300 @@
+"""
+Multi-Document Knowledge Base
+
+Holds every indexed PDF of the knowledge base - a single PDF_S3_KEY or all
+PDFs under PDF_S3_PREFIX - as one searchable corpus. Each document keeps its
+own inverted index and is only re-indexed when its S3 ETag changes, so a
+refresh costs time proportional to what changed.
+
+When NumPy is available, the indexes are also merged into one sparse
+term-passage matrix after every change, and queries - single or batched -
+are scored as sparse vector-matrix products. Either way the best BM25
+candidates are then re-ranked by phrase and term proximity (kb_proximity.py).
+
+The vocabulary of all documents is indexed for typo-tolerant lookup
+(kb_spelling.py), so misspelled query terms can be corrected before scoring.
+
+In the 'dense' and 'hybrid' retrieval modes, every passage is also embedded
+(kb_dense.py) and ranked by vector similarity, alone or blended with BM25.
+
+Runtime: Python 3.10
+"""
+
+import heapq
+import os
+import time
+
+from kb_dense import DENSE_WEIGHT, DenseIndex, blend
+from kb_index import CorpusStats
+from kb_matrix import NUMPY_AVAILABLE, TermMatrix
+from kb_proximity import PROXIMITY_CANDIDATES, rerank
+from kb_spelling import CorpusSpelling
+from structured_log import log
+
+
+def passage_rank_key(item):
+    """
+    Sort key of a (document, passage_id, score) result.
+
+    Best score first; equal scores by S3 key, then passage id - the column
+    order of the term matrix, so both scoring paths break ties alike.
+    """
+    return -item[2], item[0].source, item[1]
+
+
+class KbDocument:
+    """
+    One PDF of the knowledge base.
+
+    Attributes:
+        source (str): S3 key of the PDF
+        etag (str): ETag the document was indexed from
+        pages (PageStore): The page texts (a LazyPdfPages sequence for a lazy PDF)
+        passages (Passages): Passage table over pages, or None if not indexed
+        index (InvertedIndex): Index over passages, or None for a lazy PDF
+                               that has not been indexed yet
+    """
+
+    def __init__(self, source, etag, pages, passages, index):
+        self.source = source
+        self.etag = etag
+        self.pages = pages
+        self.passages = passages
+        self.index = index
+
+    @property
+    def title(self):
+        """
+        Display name used when citing the document in answers.
+        """
+        return os.path.basename(self.source)
+
+
+class KnowledgeBase:
+    """
+    Documents keyed by S3 key, plus a version number that changes whenever
+    any document is added, re-indexed or removed.
+
+    retrieval_mode is one of RETRIEVAL_MODES; dense and hybrid need NumPy
+    and fall back to keyword ranking without it.
+    """
+
+    def __init__(self, retrieval_mode='keyword', dense_weight=DENSE_WEIGHT):
+        self.documents = {}
+        self.version = 0
+        self.refreshed_at = None
+        self.matrix = None
+        self.spelling = None
+        self.dense = None
+        self.retrieval_mode = retrieval_mode
+        self.dense_weight = dense_weight
+
+    def __len__(self):
+        return len(self.documents)
+
+    def sync(self, listing, loader):
+        """
+        Bring the knowledge base in line with an S3 listing.
+
+        Documents whose ETag is unchanged keep their in-memory index; new or
+        changed documents are (re)loaded and missing ones are dropped.
+
+        The new document set and its corpus-wide indexes are built on the
+        side and swapped in together with the version bump, so searches never
+        see documents from one version with indexes of another - nor a
+        half-applied refresh if building them fails. A document whose loader
+        raises is logged and skipped: a changed one keeps its previous copy,
+        a new one stays out. Either is retried on the next sync, since its
+        ETag still differs.
+
+        Args:
+            listing (dict): S3 key -> ETag of every PDF that should be indexed
+            loader (callable): loader(key, etag) -> KbDocument
+
+        Returns:
+            tuple: (loaded keys, removed keys, failed keys)
+        """
+        documents = {}
+        loaded, failed = [], []
+        for key in sorted(listing):
+            current = self.documents.get(key)
+            if current is not None and current.etag == listing[key]:
+                documents[key] = current
+                continue
+            try:
+                documents[key] = loader(key, listing[key])
+                loaded.append(key)
+            except Exception as e:
+                log.error("✗ Failed to load %s, %s: %s", key,
+                          "keeping the previous version" if current is not None else "skipping it", e)
+                failed.append(key)
+                if current is not None:
+                    documents[key] = current
+
+        removed = [key for key in self.documents if key not in listing]
+
+        if loaded or removed:
+            staged = KnowledgeBase(self.retrieval_mode, self.dense_weight)
+            staged.documents = documents
+            staged.term_matrix(previous=self.matrix)
+            staged.spelling_index(previous=self.spelling)
+            staged.dense_index(previous=self.dense)
+
+            self.documents, self.matrix, self.spelling, self.dense = (
+                staged.documents, staged.matrix, staged.spelling, staged.dense)
+            self.version += 1
+        self.refreshed_at = time.time()
+
+        return loaded, removed, failed
+
+    def term_matrix(self, previous=None):
+        """
+        The sparse term-passage matrix of the current version, built on first use.
+
+        Args:
+            previous (TermMatrix): Matrix of an earlier version whose unchanged
+                                   documents can be reused
+
+        Returns:
+            TermMatrix: The matrix, or None without NumPy or while a lazy
+                        document has no index yet
+        """
+        if self.matrix is None and NUMPY_AVAILABLE:
+            documents = [self.documents[key] for key in sorted(self.documents)]
+            if all(document.index is not None for document in documents):
+                self.matrix = TermMatrix.build(documents, previous)
+        return self.matrix
+
+    def dense_index(self, previous=None):
+        """
+        Passage embeddings of the current version, built on first use.
+
+        Args:
+            previous (DenseIndex): Index of an earlier version whose unchanged
+                                   documents keep their vectors
+
+        Returns:
+            DenseIndex: The index, or None in keyword mode or without a term matrix
+        """
+        if self.dense is None and self.retrieval_mode != 'keyword':
+            matrix = self.term_matrix()
+            if matrix is not None:
+                self.dense = DenseIndex.build(matrix, previous)
+        return self.dense
+
+    def spelling_index(self, previous=None):
+        """
+        The typo-tolerant vocabulary index of the current version, built on first use.
+
+        Args:
+            previous (CorpusSpelling): Index of an earlier version; only the
+                                       documents changed since are indexed
+
+        Returns:
+            CorpusSpelling: The index, or None while a lazy document has no
+                            index yet (its terms would be missing)
+        """
+        if self.spelling is None:
+            documents = list(self.documents.values())
+            if all(document.index is not None for document in documents):
+                self.spelling = CorpusSpelling.build((document.index for document in documents), previous)
+        return self.spelling
+
+    def correct_terms(self, terms):
+        """
+        Replace query terms no document contains with their closest corpus term.
+
+        Args:
+            terms (list): Query terms
+
+        Returns:
+            list: Terms in the same order, misspellings corrected where possible
+        """
+        spelling = self.spelling_index()
+        if spelling is None:
+            return terms
+        return [spelling.correct(term) for term in terms]
+
+    def search(self, terms, limit=None, documents=None):
+        """
+        Rank passages of every indexed document with collection-wide BM25,
+        re-ranking the best candidates by term proximity.
+
+        In dense mode passages are ranked by similarity instead; in hybrid
+        mode both rankings are blended. Either needs every document indexed,
+        so a search over a subset of documents is always keyword only.
+
+        Args:
+            terms (list): Query terms
+            limit (int): Maximum number of results (None for all)
+            documents (list): KbDocuments to search instead of all of them
+
+        Returns:
+            list: (document, passage_id, score) tuples, best first
+        """
+        dense = self.dense_index() if documents is None else None
+        if dense is not None and self.retrieval_mode == 'dense':
+            return dense.search(terms, limit)
+
+        # Proximity can promote any of the top BM25 candidates
+        candidates = max(limit, PROXIMITY_CANDIDATES) if limit else None
+
+        matrix = self.term_matrix() if documents is None else None
+        if matrix is not None:
+            ranked = matrix.search_many([terms], candidates)[0]
+            stats = CorpusStats(document.index for document in matrix.documents)
+        else:
+            documents = [
+                document for document in (documents or self.documents.values())
+                if document.index is not None
+            ]
+            stats = CorpusStats(document.index for document in documents)
+
+            scored = (
+                (document, passage_id, score)
+                for document in documents
+                for passage_id, score in document.index.score(terms, stats).items()
+            )
+            # Only the candidates are kept, in a heap of at most that many entries
+            if candidates:
+                ranked = heapq.nsmallest(candidates, scored, key=passage_rank_key)
+            else:
+                ranked = sorted(scored, key=passage_rank_key)
+
+        ranked = rerank(ranked, terms, stats)
+        if dense is not None:
+            return blend(ranked[:candidates] if candidates else ranked, dense.search(terms, candidates),
+                         dense, terms, self.dense_weight, limit)
+        return ranked[:limit] if limit else ranked
+
+    def search_many(self, term_lists, limit=None):
+        """
+        Rank passages for a batch of queries in one matrix operation, then
+        re-rank each query's best candidates by term proximity.
+
+        In dense mode the batch is one matrix product against the passage
+        vectors. Hybrid mode, and keyword mode without NumPy, fall back to
+        one search() per query.
+
+        Args:
+            term_lists (list): One list of query terms per query
+            limit (int): Maximum number of results per query (None for all)
+
+        Returns:
+            list: Per query, (document, passage_id, score) tuples, best first
+        """
+        dense = self.dense_index()
+        if dense is not None and self.retrieval_mode == 'dense':
+            return dense.search_many(term_lists, limit)
+
+        matrix = self.term_matrix()
+        if matrix is None or dense is not None:
+            return [self.search(terms, limit) for terms in term_lists]
+
+        candidates = max(limit, PROXIMITY_CANDIDATES) if limit else None
+        stats = CorpusStats(document.index for document in matrix.documents)
+        results = []
+        for terms, ranked in zip(term_lists, matrix.search_many(term_lists, candidates)):
+            ranked = rerank(ranked, terms, stats)
+            results.append(ranked[:limit] if limit else ranked)
+        return results
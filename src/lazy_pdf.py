@@ -0,0 +1,275 @@
+"""
+Lazy, On-Demand PDF Page Access over S3 Ranged Reads
+
+For PDFs in the hundreds of MB, downloading the whole object and extracting
+every page before the first answer blows both the memory budget and the
+first-request latency. This module lets PyPDF2 read the PDF straight from S3
+through ranged GETs (with a bounded block cache) and extracts a page only
+when an index or page hint points at it, keeping recent pages in an LRU.
+
+PyPDF2 reads every page object of the document on the first page access.
+With the page object references of an index-only artifact, a page is
+resolved directly instead, so a query reads only the objects of the pages
+it extracts.
+
+Runtime: Python 3.10
+"""
+
+import io
+from collections import OrderedDict
+
+try:
+    from PyPDF2 import PageObject, PdfReader
+    from PyPDF2.generic import IndirectObject, NameObject
+except ImportError:
+    PdfReader = None
+
+# Defaults, overridable through the PDF_LAZY_* environment variables in app.py
+DEFAULT_BLOCK_SIZE = 256 * 1024
+DEFAULT_MAX_BLOCKS = 64
+DEFAULT_MAX_PAGES = 64
+
+# Outline-hinted sections are read at most this many pages deep
+HINT_SECTION_PAGES = 5
+
+# Page attributes a page inherits from its ancestors in the page tree
+INHERITABLE_ATTRIBUTES = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Read-only, seekable file-like view of an S3 object.
+
+    Bytes are fetched in fixed-size blocks with ranged GETs and kept in an
+    LRU block cache, so only the parts of the object that are actually read
+    are ever downloaded and memory stays bounded.
+    """
+
+    def __init__(self, s3_client, bucket, key, block_size=DEFAULT_BLOCK_SIZE,
+                 max_blocks=DEFAULT_MAX_BLOCKS):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        self.size = head['ContentLength']
+        self.etag = head.get('ETag', '').strip('"')
+
+        self.position = 0
+        self.blocks = OrderedDict()
+        self.range_requests = 0
+        self.bytes_fetched = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+
+        if position < 0:
+            raise ValueError("Negative seek position")
+
+        self.position = position
+        return position
+
+    def _block(self, block_num):
+        """
+        Return one block, fetching it with a ranged GET on a cache miss.
+        """
+        block = self.blocks.get(block_num)
+        if block is not None:
+            self.blocks.move_to_end(block_num)
+            return block
+
+        start = block_num * self.block_size
+        end = min(self.size, start + self.block_size) - 1
+        response = self.s3_client.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={start}-{end}",
+            IfMatch=f'"{self.etag}"'
+        )
+        block = response['Body'].read()
+
+        self.range_requests += 1
+        self.bytes_fetched += len(block)
+
+        self.blocks[block_num] = block
+        while len(self.blocks) > self.max_blocks:
+            self.blocks.popitem(last=False)
+        return block
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else min(self.size, self.position + size)
+        if self.position >= end:
+            return b''
+
+        chunks = []
+        position = self.position
+        while position < end:
+            block_num, block_offset = divmod(position, self.block_size)
+            block = self._block(block_num)
+            chunk = block[block_offset:block_offset + (end - position)]
+            chunks.append(chunk)
+            position += len(chunk)
+
+        self.position = position
+        return b''.join(chunks)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class LazyPdfPages:
+    """
+    Sequence of {'page', 'content'} dicts whose text is extracted on access.
+
+    Behaves like the page list produced by extract_pdf_pages(), so it can be
+    used with passages whose page positions are positions in page_numbers.
+    page_refs (object number, generation pairs, flattened) locate each of
+    those pages in the PDF. Extracted page texts are passed through clean
+    (if given) and kept in a bounded LRU.
+    """
+
+    def __init__(self, stream, page_numbers=None, max_pages=DEFAULT_MAX_PAGES, clean=None, page_refs=None):
+        self.reader = PdfReader(stream)
+        self.clean = clean
+        self.page_numbers = page_numbers if page_numbers is not None else range(1, len(self.reader.pages) + 1)
+        self.page_refs = {}
+        if page_refs is not None:
+            for position, page_num in enumerate(self.page_numbers):
+                number, generation = page_refs[2 * position], page_refs[2 * position + 1]
+                if number:
+                    self.page_refs[page_num] = (number, generation)
+        self.max_pages = max_pages
+        self.page_cache = OrderedDict()
+        self.extracted_pages = 0
+        self._outline = None
+
+    def __len__(self):
+        return len(self.page_numbers)
+
+    def __getitem__(self, position):
+        page_num = self.page_numbers[position]
+        return {'page': page_num, 'content': self.page_text(page_num)}
+
+    def __iter__(self):
+        return (self[position] for position in range(len(self)))
+
+    def passage_text(self, position, start, end):
+        """
+        Characters start:end of the page at a position (as PageStore.passage_text).
+        """
+        return self.page_text(self.page_numbers[position])[start:end]
+
+    def page_text(self, page_num):
+        """
+        Text of a page (1-based), extracted on first access.
+        """
+        text = self.page_cache.get(page_num)
+        if text is not None:
+            self.page_cache.move_to_end(page_num)
+            return text
+
+        text = self.page(page_num).extract_text() or ''
+        if self.clean is not None:
+            text = self.clean(text)
+        self.extracted_pages += 1
+
+        self.page_cache[page_num] = text
+        while len(self.page_cache) > self.max_pages:
+            self.page_cache.popitem(last=False)
+        return text
+
+    def page(self, page_num):
+        """
+        PageObject of a page (1-based).
+
+        A page with a known object reference is read on its own, together with
+        its ancestors for the attributes it inherits; other pages go through
+        reader.pages, which reads every page object of the document first.
+        """
+        ref = self.page_refs.get(page_num)
+        if ref is None:
+            return self.reader.pages[page_num - 1]
+
+        reference = IndirectObject(ref[0], ref[1], self.reader)
+        page = PageObject(self.reader, reference)
+        page.update(reference.get_object())
+
+        parent = page.get('/Parent')
+        while parent is not None:
+            parent = parent.get_object()
+            for name in INHERITABLE_ATTRIBUTES:
+                if name not in page and name in parent:
+                    page[NameObject(name)] = parent[name]
+            parent = parent.get('/Parent')
+        return page
+
+    def outline(self):
+        """
+        Flattened PDF outline (bookmarks) as (lowercase title, first page) pairs.
+        """
+        if self._outline is None:
+            entries = []
+            pending = list(self.reader.outline or [])
+            while pending:
+                item = pending.pop(0)
+                if isinstance(item, list):
+                    pending[:0] = item
+                    continue
+                try:
+                    page_num = self.reader.get_destination_page_number(item) + 1
+                except Exception:
+                    continue
+                entries.append((str(item.title).lower(), page_num))
+            entries.sort(key=lambda entry: entry[1])
+            self._outline = entries
+        return self._outline
+
+    def hinted(self, keywords, max_pages=None):
+        """
+        Pages whose outline section title mentions any keyword.
+
+        Used when there is no prebuilt index to point at pages. Each matching
+        section contributes up to HINT_SECTION_PAGES pages from its start.
+
+        Args:
+            keywords (list): Lowercase query keywords
+            max_pages (int): Cap on hinted pages (default: the page LRU size)
+
+        Returns:
+            list: {'page', 'content'} dicts (empty when no section matches)
+        """
+        max_pages = max_pages or self.max_pages
+        outline = self.outline()
+        total_pages = len(self.reader.pages)
+
+        hinted = []
+        for i, (title, first_page) in enumerate(outline):
+            if not any(keyword in title for keyword in keywords):
+                continue
+            next_section = outline[i + 1][1] if i + 1 < len(outline) else total_pages + 1
+            last_page = min(next_section, first_page + HINT_SECTION_PAGES)
+            hinted.extend(page_num for page_num in range(first_page, max(last_page, first_page + 1))
+                          if page_num not in hinted)
+
+        return [{'page': page_num, 'content': self.page_text(page_num)} for page_num in hinted[:max_pages]]
@@ -0,0 +1,242 @@
+"""
+PDF Text Extraction for the Knowledge Base
+
+Sequential and parallel PyPDF2 page extraction used by load_pdf_from_s3()
+and the artifact builder.
+
+The parallel mode forks one worker process per page range and collects the
+results over multiprocessing Pipes. ProcessPoolExecutor and multiprocessing
+Pools are not usable on Lambda because they need POSIX semaphores backed by
+/dev/shm, which the Lambda sandbox does not provide; plain Pipes do not.
+It is off by default: its speed-up has not been measured on a multi-core
+host yet (benchmarks/bench_pdf_extract.py).
+
+Runtime: Python 3.10
+"""
+
+import multiprocessing
+import os
+import time
+from io import BytesIO
+
+from structured_log import log
+
+# Import PDF reader
+try:
+    from PyPDF2 import PdfReader
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+    log.warning("PyPDF2 not available")
+
+
+def extract_pdf_pages(pdf_bytes, clean=None):
+    """
+    Extract text from every page of a PDF with PyPDF2.
+
+    Args:
+        pdf_bytes (bytes): Raw PDF
+        clean (callable): Applied to the text of every page with content
+
+    Returns:
+        list: {'page', 'content'} dicts for pages with actual content
+    """
+    pdf_reader = PdfReader(BytesIO(pdf_bytes))
+    total_pages = len(pdf_reader.pages)
+
+    log.info("→ Extracting text from %d pages...", total_pages)
+
+    # Extract all text from all pages (with progress logging)
+    all_text = []
+    for page_num, page in enumerate(pdf_reader.pages):
+        if page_num % 10 == 0:  # Log progress every 10 pages
+            log.debug("→ Processing page %d/%d", page_num + 1, total_pages)
+
+        text = page.extract_text()
+        if text and text.strip():  # Only add pages with actual content
+            all_text.append({
+                'page': page_num + 1,
+                'content': clean(text) if clean else text
+            })
+
+    log.info("✓ Extracted %d pages with content (from %d total)", len(all_text), total_pages)
+    return all_text
+
+
+def extract_page_range(pdf_bytes, first_page, last_page, clean=None):
+    """
+    Extract text from a contiguous range of pages.
+
+    Args:
+        pdf_bytes (bytes): Raw PDF
+        first_page (int): Index of the first page (0-based, inclusive)
+        last_page (int): Index of the last page (0-based, exclusive)
+        clean (callable): Applied to the text of every page with content
+
+    Returns:
+        list: {'page', 'content'} dicts for pages with actual content
+    """
+    pdf_reader = PdfReader(BytesIO(pdf_bytes))
+
+    pages = []
+    for page_num in range(first_page, last_page):
+        text = pdf_reader.pages[page_num].extract_text()
+        if text and text.strip():
+            pages.append({
+                'page': page_num + 1,
+                'content': clean(text) if clean else text
+            })
+    return pages
+
+
+def pdf_page_count(pdf_bytes):
+    """
+    Number of pages of a PDF, read from the /Count of the page tree root.
+
+    len(PdfReader.pages) resolves every page object first; /Count only needs
+    the trailer, the catalog and the root node.
+
+    Args:
+        pdf_bytes (bytes): Raw PDF
+
+    Returns:
+        int: Page count
+    """
+    pdf_reader = PdfReader(BytesIO(pdf_bytes))
+    try:
+        return int(pdf_reader.trailer['/Root']['/Pages']['/Count'])
+    except (KeyError, TypeError, ValueError):
+        return len(pdf_reader.pages)
+
+
+def pdf_page_refs(pdf_bytes):
+    """
+    Object reference of every page of a PDF, so a reader can later resolve
+    one page without walking the whole page tree.
+
+    Args:
+        pdf_bytes (bytes): Raw PDF
+
+    Returns:
+        list: (object number, generation) per page - (0, 0) for a page that
+              is not an indirect object
+    """
+    refs = []
+    for page in PdfReader(BytesIO(pdf_bytes)).pages:
+        reference = page.indirect_reference
+        refs.append((reference.idnum, reference.generation) if reference is not None else (0, 0))
+    return refs
+
+
+def _extract_worker(conn, pdf_bytes, first_page, last_page, clean):
+    """
+    Worker process body: extract a page range and send it back over conn.
+    """
+    try:
+        conn.send(('ok', extract_page_range(pdf_bytes, first_page, last_page, clean)))
+    except Exception as e:
+        conn.send(('error', f"pages {first_page + 1}-{last_page}: {str(e)}"))
+    finally:
+        conn.close()
+
+
+def resolve_worker_count(setting):
+    """
+    Turn a PDF_EXTRACT_WORKERS setting into a worker count.
+
+    Args:
+        setting (str): A positive integer, or 'auto' for one worker per CPU
+
+    Returns:
+        int: Number of workers (1 means sequential extraction)
+    """
+    if str(setting).strip().lower() == 'auto':
+        return os.cpu_count() or 1
+    try:
+        return max(1, int(setting))
+    except (TypeError, ValueError):
+        log.warning("✗ Invalid PDF_EXTRACT_WORKERS value '%s', extracting sequentially", setting)
+        return 1
+
+
+def extract_pdf_pages_parallel(pdf_bytes, workers, clean=None, total_pages=None):
+    """
+    Extract text from every page of a PDF across worker processes.
+
+    The page range is split into one contiguous chunk per worker and the
+    chunks are concatenated back in order, so the result is identical to
+    extract_pdf_pages(). Every worker parses the PDF again, which eats into
+    the gain; on a single CPU, 2 and 4 workers were slower than 1, and no
+    multi-core timing has been taken yet.
+
+    Args:
+        pdf_bytes (bytes): Raw PDF
+        workers (int): Number of worker processes
+        clean (callable): Applied to page text inside the workers (module-level function)
+        total_pages (int): Page count, if the caller has it (default: pdf_page_count())
+
+    Returns:
+        list: {'page', 'content'} dicts for pages with actual content, in page order
+    """
+    if workers <= 1:
+        return extract_pdf_pages(pdf_bytes, clean)
+
+    if total_pages is None:
+        total_pages = pdf_page_count(pdf_bytes)
+    workers = min(workers, total_pages)
+
+    if workers <= 1:
+        return extract_pdf_pages(pdf_bytes, clean)
+
+    started = time.perf_counter()
+    log.info("→ Extracting text from %d pages with %d workers...", total_pages, workers)
+
+    chunk_size, remainder = divmod(total_pages, workers)
+
+    processes = []
+    first_page = 0
+    try:
+        for worker_num in range(workers):
+            last_page = first_page + chunk_size + (1 if worker_num < remainder else 0)
+            parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_extract_worker,
+                args=(child_conn, pdf_bytes, first_page, last_page, clean),
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            processes.append((process, parent_conn))
+            first_page = last_page
+    except OSError as e:
+        log.warning("✗ Could not start extraction workers (%s), extracting sequentially", e)
+        for process, parent_conn in processes:
+            process.terminate()
+            parent_conn.close()
+        return extract_pdf_pages(pdf_bytes, clean)
+
+    # Receive before joining so a worker is never blocked on a full pipe
+    all_text = []
+    errors = []
+    for process, parent_conn in processes:
+        try:
+            status, payload = parent_conn.recv()
+        except EOFError:
+            status, payload = None, None
+        parent_conn.close()
+        process.join()
+
+        if status is None:
+            status, payload = 'error', f"worker exited with code {process.exitcode}"
+
+        if status == 'ok':
+            all_text.extend(payload)
+        else:
+            errors.append(payload)
+
+    if errors:
+        raise Exception(f"Parallel PDF extraction failed: {'; '.join(errors)}")
+
+    log.info("✓ Extracted %d pages with content (from %d total) in %.2fs",
+             len(all_text), total_pages, time.perf_counter() - started)
+    return all_text
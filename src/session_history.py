@@ -0,0 +1,96 @@
+"""
+Compact Encodings for Session Conversation History
+
+Knowledge base answers are long, so storing every bot_response verbatim
+makes session items large and every write expensive. Each turn of
+conversation_history can instead be stored as:
+
+- 'full':       the turn map as is (default)
+- 'compressed': the turn as zlib-compressed JSON in a Binary attribute
+- 'digest':     intent and user input, plus a digest, the length and the
+                page references of the response instead of its text (every
+                source of a multi-snippet answer, best first)
+
+Turns are encoded one at a time, so every encoding works with both the
+get_item + put_item and the list_append session stores, and a history that
+mixes encodings (e.g. after changing the setting) still decodes.
+
+Runtime: Python 3.10
+"""
+
+import hashlib
+import json
+import re
+import zlib
+
+ENCODINGS = ('full', 'compressed', 'digest')
+
+# Compression level for 'compressed' (1 = fastest, 9 = smallest)
+ZLIB_LEVEL = 6
+
+# Page reference that format_answer() ends every snippet of an answer with
+SOURCE_PATTERN = re.compile(r'\(Source: Page (\d+) of ([^)]+)\)\s*$', re.MULTILINE)
+
+
+def encode_turn(turn, encoding):
+    """
+    Encode one conversation turn for storage.
+
+    Args:
+        turn (dict): intent, user_input and bot_response of the turn
+        encoding (str): One of ENCODINGS
+
+    Returns:
+        dict or bytes: Value to store in conversation_history
+    """
+    if encoding == 'compressed':
+        return zlib.compress(json.dumps(turn, separators=(',', ':')).encode('utf-8'), ZLIB_LEVEL)
+
+    if encoding == 'digest':
+        response = turn.get('bot_response', '')
+        digest = {
+            'intent': turn.get('intent'),
+            'user_input': turn.get('user_input'),
+            'response_sha1': hashlib.sha1(response.encode('utf-8')).hexdigest()[:16],
+            'response_chars': len(response)
+        }
+        sources = [{'page': int(page), 'document': document}
+                   for page, document in SOURCE_PATTERN.findall(response)]
+        if sources:
+            digest['sources'] = sources
+        return digest
+
+    return turn
+
+
+def decode_turn(stored):
+    """
+    Decode one stored turn, whatever its encoding.
+
+    Args:
+        stored: A conversation_history element (dict, bytes or boto3 Binary)
+
+    Returns:
+        dict: The turn; digest turns have no bot_response
+    """
+    if isinstance(stored, dict):
+        if 'source_page' in stored:
+            # Digests written before multi-snippet answers kept a single source
+            stored = dict(stored)
+            stored['sources'] = [{'page': int(stored.pop('source_page')),
+                                  'document': stored.pop('source_document', None)}]
+        return stored
+    return json.loads(zlib.decompress(bytes(stored)).decode('utf-8'))
+
+
+def decode_history(history):
+    """
+    Decode a stored conversation_history list.
+
+    Args:
+        history (list): Stored turns
+
+    Returns:
+        list: Decoded turns, oldest first
+    """
+    return [decode_turn(stored) for stored in history or []]
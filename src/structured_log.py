@@ -0,0 +1,130 @@
+"""
+Leveled, Sampled Structured Logging
+
+Replaces bare print() calls on the request path. Messages below LOG_LEVEL
+cost nothing: arguments are %-formatted only when the line is written, and
+payloads (events, session items, responses) are only serialized - and cut
+to LOG_PAYLOAD_MAX_CHARS - when their level is enabled. A LOG_SAMPLE_RATE
+share of requests is logged at DEBUG regardless of LOG_LEVEL, so full
+detail is still available for a sample of production traffic.
+
+In Lambda every line is one JSON object (level, message, request id and
+any extra fields). Elsewhere - the artifact builder, benchmarks, local
+runs - lines are plain text. LOG_FORMAT overrides either default.
+
+This file is kept identical in src/ and src_proxy/ because each function
+packages only its own code directory.
+
+Runtime: Python 3.10
+"""
+
+import json
+import os
+import random
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0'))  # share of requests logged at DEBUG
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get('LOG_PAYLOAD_MAX_CHARS', '2000'))
+LOG_FORMAT = os.environ.get(
+    'LOG_FORMAT', 'json' if 'AWS_LAMBDA_FUNCTION_NAME' in os.environ else 'text'
+).lower()
+
+
+class StructuredLogger:
+    """
+    Logger with a per-request level: the configured level, or DEBUG for a
+    sampled request.
+    """
+
+    def __init__(self, level=LOG_LEVEL, sample_rate=LOG_SAMPLE_RATE,
+                 payload_max_chars=LOG_PAYLOAD_MAX_CHARS, log_format=LOG_FORMAT):
+        self.base_level = LEVELS.get(level, LEVELS['INFO'])
+        self.level = self.base_level
+        self.sample_rate = sample_rate
+        self.payload_max_chars = payload_max_chars
+        self.log_format = log_format
+        self.request_id = None
+        self.sampled = False
+
+    def start_request(self, context=None):
+        """
+        Reset per-request state. Call once at the top of a Lambda handler.
+
+        Args:
+            context: Lambda context object (for the request id)
+        """
+        self.request_id = getattr(context, 'aws_request_id', None)
+        self.sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        self.level = LEVELS['DEBUG'] if self.sampled else self.base_level
+
+    def is_enabled(self, level):
+        """
+        True if a message at level would be written for this request.
+        """
+        return LEVELS[level] >= self.level
+
+    def debug(self, message, *args, **fields):
+        self.log('DEBUG', message, *args, **fields)
+
+    def info(self, message, *args, **fields):
+        self.log('INFO', message, *args, **fields)
+
+    def warning(self, message, *args, **fields):
+        self.log('WARNING', message, *args, **fields)
+
+    def error(self, message, *args, **fields):
+        self.log('ERROR', message, *args, **fields)
+
+    def payload(self, level, message, payload, **fields):
+        """
+        Log a serialized payload, cut to payload_max_chars.
+
+        Nothing is serialized unless level is enabled.
+
+        Args:
+            level (str): Log level
+            message (str): What the payload is
+            payload: JSON-serializable object (non-JSON values use str())
+            fields: Extra structured fields
+        """
+        if not self.is_enabled(level):
+            return
+
+        text = json.dumps(payload, default=str)
+        if len(text) > self.payload_max_chars:
+            text = f"{text[:self.payload_max_chars]}...({len(text) - self.payload_max_chars} more chars)"
+        self.log(level, '%s: %s', message, text, **fields)
+
+    def log(self, level, message, *args, **fields):
+        """
+        Write one log line if level is enabled.
+
+        Args:
+            level (str): Log level
+            message (str): Message, %-formatted with args only if written
+            fields: Extra structured fields
+        """
+        if LEVELS[level] < self.level:
+            return
+
+        if args:
+            message = message % args
+
+        if self.log_format == 'json':
+            record = {'level': level, 'message': message}
+            if self.request_id:
+                record['request_id'] = self.request_id
+            if self.sampled:
+                record['sampled'] = True
+            record.update(fields)
+            print(json.dumps(record, default=str, ensure_ascii=False))
+        elif fields:
+            print(f"{message} {json.dumps(fields, default=str)}")
+        else:
+            print(message)
+
+
+# Shared by every module of the function
+log = StructuredLogger()
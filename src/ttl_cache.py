@@ -0,0 +1,96 @@
+"""
+Bounded LRU Cache with TTL Expiry
+
+Per-container cache used for knowledge base answers. Entries expire after a
+fixed time-to-live and the least recently used entry is evicted once the
+cache is full. Hit/miss counters are kept for monitoring.
+
+Runtime: Python 3.10
+"""
+
+import time
+from collections import OrderedDict
+
+# Returned by get() on a miss, so that None can be cached as a real value
+MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU cache whose entries also expire ttl_seconds after being stored.
+
+    A max_entries of 0 disables the cache (every lookup is a miss).
+    """
+
+    def __init__(self, max_entries=512, ttl_seconds=600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Look up key, refreshing its LRU position on a hit.
+
+        Returns:
+            The cached value, or MISSING if absent or expired
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self.entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return MISSING
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Store value under key, evicting the least recently used entries if full.
+        """
+        if self.max_entries <= 0:
+            return
+
+        self.entries[key] = (self.clock() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every entry (counters are kept).
+        """
+        self.entries.clear()
+
+    def stats(self):
+        """
+        Counters for monitoring.
+
+        Returns:
+            dict: size, hits, misses, hit_ratio, evictions, expirations
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
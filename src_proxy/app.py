@@ -2,32 +2,60 @@
 AWS Lambda Function for API Gateway Proxy to Amazon Lex V2
 
 This function receives user messages via API Gateway and forwards them
-to an Amazon Lex V2 bot using the RecognizeText API.
+to an Amazon Lex V2 bot using the RecognizeText API. A request carries
+either one message or a batch of messages; a batch is sent to Lex
+concurrently, one worker per session, so each user's messages keep their
+order.
 
 Runtime: Python 3.10
 """
 
 import json
-import boto3
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
 from botocore.exceptions import ClientError
 
-# Initialize Lex V2 Runtime client
-lex_client = boto3.client('lexv2-runtime')
+from fast_path import FAST_PATH_REPLIES, load_classifier, normalize
+from lex_runtime import (LEX_BOT_ALIAS_ID, LEX_BOT_ID, LEX_LOCALE_ID, CircuitBreaker, CircuitOpen,
+                         ReplyCache, build_client, expired)
+from metrics import annotate, collect, span, start_invocation, timed
+from structured_log import log
+
+# Initialize Lex V2 Runtime client (timeouts, retries and pool from LEX_* settings;
+# boto3 clients are thread-safe)
+lex_client = build_client()
+
+# Lex Bot Configuration (LEX_BOT_ID, LEX_BOT_ALIAS_ID, LEX_LOCALE_ID)
+BOT_ID = LEX_BOT_ID
+BOT_ALIAS_ID = LEX_BOT_ALIAS_ID
+LOCALE_ID = LEX_LOCALE_ID
+
+# Fails fast while Lex is throttling or down; recent replies serve degraded mode
+LEX_BREAKER = CircuitBreaker()
+REPLY_CACHE = ReplyCache()
+DEGRADED_REPLY = "The assistant is busy right now. Please try again in a moment."
 
-# Lex Bot Configuration
-# These values are specific to the deployed Lex bot and alias
-BOT_ID = "ZUD17UCEC4"
-BOT_ALIAS_ID = "UUORFDMIMY"
-LOCALE_ID = "en_US"
+# Batch Configuration
+BATCH_MAX_MESSAGES = int(os.environ.get('BATCH_MAX_MESSAGES', '25'))  # messages accepted per batch request
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', '8'))  # concurrent Lex calls per batch request
+BATCH_DEADLINE_SECONDS = float(os.environ.get('BATCH_DEADLINE_SECONDS', '25'))  # whole batch, under API Gateway's 30 s
+BATCH_TIMEOUT_REPLY = "The assistant ran out of time for this message. Please send it again."
 
+# Local classifier for trivial turns (None unless FAST_PATH_ENABLED=true)
+FAST_PATH = load_classifier()
 
+
+@timed('lambda_handler')
 def lambda_handler(event, context):
     """
     AWS Lambda handler for API Gateway proxy to Amazon Lex V2.
     
     This function processes incoming HTTP requests from API Gateway,
     extracts user messages, forwards them to Lex V2, and returns
-    the bot's response.
+    the bot's response. A body with a 'messages' list is handled as a
+    batch (see handle_batch).
     
     Args:
         event (dict): API Gateway event containing the HTTP request details
@@ -36,13 +64,16 @@ def lambda_handler(event, context):
     Returns:
         dict: API Gateway proxy response with statusCode, headers, and body
     """
+    start_invocation()
+    log.start_request(context)
+    
     try:
-        # Log the incoming event for debugging
-        print(f"Received API Gateway event: {json.dumps(event)}")
+        # Log the incoming event for debugging (serialized only when DEBUG is on)
+        log.payload('DEBUG', 'Received API Gateway event', event)
         
         # Validate that the request has a body
         if 'body' not in event or not event['body']:
-            print("Error: Request body is missing")
+            log.warning("Error: Request body is missing")
             return create_error_response(
                 status_code=400,
                 error_message="Request body is required"
@@ -51,123 +82,284 @@ def lambda_handler(event, context):
         # Parse the JSON body from API Gateway
         try:
             body = json.loads(event['body'])
-            print(f"Parsed request body: {json.dumps(body)}")
+            log.payload('DEBUG', 'Parsed request body', body)
         except json.JSONDecodeError as e:
-            print(f"JSON decode error: {str(e)}")
+            log.warning("JSON decode error: %s", e)
             return create_error_response(
                 status_code=400,
                 error_message="Invalid JSON in request body"
             )
         
-        # Extract required fields from the request body
-        try:
-            message = body['message']
-            user_id = body['user_id']
-        except KeyError as e:
-            missing_field = str(e).strip("'")
-            print(f"Missing required field: {missing_field}")
-            return create_error_response(
-                status_code=400,
-                error_message=f"Missing required field: {missing_field}"
-            )
+        if isinstance(body, dict) and 'messages' in body:
+            return handle_batch(body['messages'])
         
-        # Validate that message and user_id are not empty
-        if not message or not isinstance(message, str):
-            print("Error: Message field is empty or invalid")
-            return create_error_response(
-                status_code=400,
-                error_message="Message must be a non-empty string"
-            )
+        status_code, payload = process_message(body)
+        return create_response(status_code, payload)
         
-        if not user_id or not isinstance(user_id, str):
-            print("Error: User ID field is empty or invalid")
-            return create_error_response(
-                status_code=400,
-                error_message="User ID must be a non-empty string"
-            )
+    except Exception as e:
+        # Catch-all for any unexpected errors
+        log.error("Unexpected error in lambda_handler: %s", e)
+        return create_error_response(
+            status_code=500,
+            error_message="Internal server error. Please try again later."
+        )
+
+
+def handle_batch(messages):
+    """
+    Send a batch of messages to Lex concurrently.
+    
+    Messages are grouped by user_id (the Lex session). Each group is sent
+    in order by one worker of a pool of at most BATCH_MAX_WORKERS threads,
+    so different sessions run in parallel while the turns of one session
+    never overtake each other. A failed message does not fail the batch.
+    
+    The whole batch gets BATCH_DEADLINE_SECONDS: messages not answered by
+    then fail with 504 and are not sent afterwards. A Lex call still running
+    at the deadline is abandoned: its reply is discarded and neither moves
+    the circuit breaker nor enters the reply cache.
+    
+    Workers do not see the handler's metrics span, so the annotations of
+    each answered message are collected and counted on the batch span.
+    
+    Args:
+        messages (list): Items shaped like a single request body
+                         ({"message": ..., "user_id": ...})
         
-        print(f"Processing message from user '{user_id}': {message}")
+    Returns:
+        dict: API Gateway proxy response; its 'results' list holds one
+              reply or error payload per message, in input order
+    """
+    if not isinstance(messages, list) or not messages:
+        log.warning("Error: Batch messages field is empty or invalid")
+        return create_error_response(
+            status_code=400,
+            error_message="Messages must be a non-empty list"
+        )
+    
+    if len(messages) > BATCH_MAX_MESSAGES:
+        log.warning("Error: Batch of %d messages exceeds %d", len(messages), BATCH_MAX_MESSAGES)
+        return create_error_response(
+            status_code=400,
+            error_message=f"A batch can hold at most {BATCH_MAX_MESSAGES} messages"
+        )
+    
+    # Positions of each session's messages, in input order. Items without a
+    # usable user_id cannot reach Lex, so each gets a group of its own and
+    # fails validation there.
+    sessions = {}
+    for position, item in enumerate(messages):
+        user_id = item.get('user_id') if isinstance(item, dict) else None
+        key = user_id if user_id and isinstance(user_id, str) else (None, position)
+        sessions.setdefault(key, []).append(position)
+    
+    results = [None] * len(messages)
+    annotations = [None] * len(messages)
+    deadline = time.monotonic() + BATCH_DEADLINE_SECONDS
+    
+    def send_session(positions):
+        for position in positions:
+            if expired(deadline):
+                return
+            with collect() as item:
+                status_code, payload = process_message(messages[position], deadline=deadline)
+            payload['status_code'] = status_code
+            annotations[position] = item.properties
+            results[position] = payload
+    
+    workers = min(BATCH_MAX_WORKERS, len(sessions))
+    log.info("Processing batch of %d messages across %d sessions with %d workers",
+             len(messages), len(sessions), workers)
+    
+    with span('batch', messages=len(messages), sessions=len(sessions)):
+        pool = ThreadPoolExecutor(max_workers=workers)
+        futures = [pool.submit(send_session, positions) for positions in sessions.values()]
+        done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+        # Do not wait for calls still running at the deadline
+        pool.shutdown(wait=False, cancel_futures=True)
+        for future in done:
+            future.result()  # re-raises any exception a worker did not handle
         
-        # Call Amazon Lex V2 RecognizeText API
-        try:
-            lex_response = lex_client.recognize_text(
-                botId=BOT_ID,
-                botAliasId=BOT_ALIAS_ID,
-                localeId=LOCALE_ID,
-                sessionId=user_id,  # Use user_id as the session identifier
-                text=message
-            )
-            
-            print(f"Lex response received: {json.dumps(lex_response, default=str)}")
-            
-        except ClientError as e:
-            error_code = e.response['Error']['Code']
-            error_message = e.response['Error']['Message']
-            print(f"Lex ClientError [{error_code}]: {error_message}")
-            
-            # Provide user-friendly error messages based on error type
-            if error_code == 'ResourceNotFoundException':
-                return create_error_response(
-                    status_code=500,
-                    error_message="Lex bot configuration error. Please contact support."
-                )
-            elif error_code == 'AccessDeniedException':
-                return create_error_response(
-                    status_code=500,
-                    error_message="Permission error accessing Lex bot."
-                )
-            else:
-                return create_error_response(
-                    status_code=500,
-                    error_message="Error communicating with the chatbot. Please try again."
-                )
+        # Abandoned calls may still write to results; answer from a snapshot
+        results = list(results)
+        annotations = list(annotations)
         
-        except Exception as e:
-            print(f"Unexpected error calling Lex: {str(e)}")
-            return create_error_response(
-                status_code=500,
-                error_message="An unexpected error occurred. Please try again."
-            )
+        # Messages per annotation, e.g. fast_path=3 (three answered locally)
+        counts = {}
+        for position, result in enumerate(results):
+            if result is not None:
+                for name in annotations[position]:
+                    counts[name] = counts.get(name, 0) + 1
+        annotate(**counts)
+        
+        unanswered = [position for position, result in enumerate(results) if result is None]
+        if unanswered:
+            log.warning("Batch deadline of %g s passed with %d of %d messages unanswered",
+                        BATCH_DEADLINE_SECONDS, len(unanswered), len(messages))
+            annotate(batch_timeouts=len(unanswered))
+            for position in unanswered:
+                results[position] = dict(error_payload(BATCH_TIMEOUT_REPLY), status_code=504)
+    
+    failed = sum(1 for result in results if result['status_code'] != 200)
+    if failed:
+        log.warning("Batch finished with %d of %d messages failed", failed, len(messages))
+    
+    return create_response(200, {'results': results})
+
+
+def process_message(body, deadline=None):
+    """
+    Validate one message and send it to Lex.
+    
+    Args:
+        body (dict): Request body (or batch item) with message and user_id
+        deadline (float): time.monotonic() after which the caller no longer
+                          waits for the reply (None: no deadline); a later
+                          reply updates neither the breaker nor the cache
+        
+    Returns:
+        tuple: (status_code, payload) - the reply payload on success,
+               an error payload otherwise
+    """
+    # Extract required fields from the request body
+    if not isinstance(body, dict):
+        log.warning("Error: Request body is not a JSON object")
+        return 400, error_payload("Request body must be a JSON object")
+    
+    try:
+        message = body['message']
+        user_id = body['user_id']
+    except KeyError as e:
+        missing_field = str(e).strip("'")
+        log.warning("Missing required field: %s", missing_field)
+        return 400, error_payload(f"Missing required field: {missing_field}")
+    
+    # Validate that message and user_id are not empty
+    if not message or not isinstance(message, str):
+        log.warning("Error: Message field is empty or invalid")
+        return 400, error_payload("Message must be a non-empty string")
+    
+    if not user_id or not isinstance(user_id, str):
+        log.warning("Error: User ID field is empty or invalid")
+        return 400, error_payload("User ID must be a non-empty string")
+    
+    log.info("Processing message from user '%s': %s", user_id, message)
+    
+    # Answer trivial turns without Lex (and without the fulfillment Lambda behind it)
+    if FAST_PATH is not None:
+        intent_name = FAST_PATH.classify(message)
+        if intent_name:
+            log.info("Fast path: answered %s locally", intent_name)
+            annotate(fast_path=intent_name)
+            return 200, {
+                'reply': FAST_PATH_REPLIES[intent_name],
+                'intent': intent_name,
+                'intent_state': 'Fulfilled',
+                'session_id': user_id
+            }
+    
+    # Call Amazon Lex V2 RecognizeText API
+    try:
+        lex_response = LEX_BREAKER.call(recognize_text, user_id, message, deadline=deadline)
+        
+        log.payload('DEBUG', 'Lex response received', lex_response)
+        
+    except CircuitOpen:
+        return degraded_response(message, user_id)
         
-        # Extract the bot's reply from the Lex response
-        bot_reply = extract_bot_reply(lex_response)
-        
-        # Extract additional metadata from Lex response for enhanced client experience
-        intent_name = lex_response.get('sessionState', {}).get('intent', {}).get('name', 'Unknown')
-        intent_state = lex_response.get('sessionState', {}).get('intent', {}).get('state', 'Unknown')
-        
-        print(f"Bot reply: {bot_reply}")
-        print(f"Intent: {intent_name}, State: {intent_state}")
-        
-        # Prepare the response payload
-        response_payload = {
-            'reply': bot_reply,
-            'intent': intent_name,
-            'intent_state': intent_state,
-            'session_id': user_id
-        }
-        
-        # Return successful API Gateway response
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',  # Enable CORS
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS'
-            },
-            'body': json.dumps(response_payload)
-        }
+    except ClientError as e:
+        error_code = e.response['Error']['Code']
+        error_message = e.response['Error']['Message']
+        log.error("Lex ClientError [%s]: %s", error_code, error_message)
         
+        # Provide user-friendly error messages based on error type
+        if error_code == 'ResourceNotFoundException':
+            return 500, error_payload("Lex bot configuration error. Please contact support.")
+        elif error_code == 'AccessDeniedException':
+            return 500, error_payload("Permission error accessing Lex bot.")
+        else:
+            return 500, error_payload("Error communicating with the chatbot. Please try again.")
+    
     except Exception as e:
-        # Catch-all for any unexpected errors
-        print(f"Unexpected error in lambda_handler: {str(e)}")
-        return create_error_response(
-            status_code=500,
-            error_message="Internal server error. Please try again later."
+        log.error("Unexpected error calling Lex: %s", e)
+        return 500, error_payload("An unexpected error occurred. Please try again.")
+    
+    # Extract the bot's reply from the Lex response
+    bot_reply = extract_bot_reply(lex_response)
+    
+    # Extract additional metadata from Lex response for enhanced client experience
+    intent_name = lex_response.get('sessionState', {}).get('intent', {}).get('name', 'Unknown')
+    intent_state = lex_response.get('sessionState', {}).get('intent', {}).get('state', 'Unknown')
+    
+    log.debug("Bot reply: %s", bot_reply)
+    log.info("Intent: %s, State: %s", intent_name, intent_state)
+    
+    # Prepare the response payload
+    response_payload = {
+        'reply': bot_reply,
+        'intent': intent_name,
+        'intent_state': intent_state,
+        'session_id': user_id
+    }
+    
+    # Remember fulfilled replies for degraded mode, per session: a reply may
+    # depend on the session's earlier turns, so it is only served back to it.
+    # A reply past the deadline was never delivered and is not kept either.
+    if intent_state == 'Fulfilled' and not expired(deadline):
+        REPLY_CACHE.put((user_id, normalize(message)), {'reply': bot_reply, 'intent': intent_name})
+    
+    return 200, response_payload
+
+
+def recognize_text(user_id, message):
+    """
+    Send one message to Lex (the recognize_text stage).
+    
+    Args:
+        user_id (str): User identifier, used as the Lex session id
+        message (str): User message
+        
+    Returns:
+        dict: RecognizeText response
+    """
+    with span('recognize_text'):
+        return lex_client.recognize_text(
+            botId=BOT_ID,
+            botAliasId=BOT_ALIAS_ID,
+            localeId=LOCALE_ID,
+            sessionId=user_id,  # Use user_id as the session identifier
+            text=message
         )
 
 
+def degraded_response(message, user_id):
+    """
+    Reply without Lex while the circuit breaker is open.
+    
+    Args:
+        message (str): User message
+        user_id (str): User / session identifier
+        
+    Returns:
+        tuple: (status_code, payload) - the session's last Lex reply to the
+               same message marked degraded, or a 503 busy error
+    """
+    annotate(degraded=True)
+    cached = REPLY_CACHE.get((user_id, normalize(message)))
+    if cached is None:
+        log.warning("Lex circuit open: no cached reply, answering busy")
+        return 503, error_payload(DEGRADED_REPLY)
+    
+    log.warning("Lex circuit open: serving cached reply")
+    return 200, {
+        'reply': cached['reply'],
+        'intent': cached['intent'],
+        'intent_state': 'Fulfilled',
+        'session_id': user_id,
+        'degraded': True
+    }
+
+
 def extract_bot_reply(lex_response):
     """
     Extract the bot's reply text from the Lex V2 response.
@@ -187,41 +379,65 @@ def extract_bot_reply(lex_response):
             if 'content' in first_message and first_message['content']:
                 return first_message['content']
             else:
-                print("Warning: Message exists but has no content")
+                log.warning("Warning: Message exists but has no content")
                 return "Sorry, I encountered a problem. Please try again."
         else:
-            print("Warning: No messages in Lex response")
+            log.warning("Warning: No messages in Lex response")
             return "Sorry, I encountered a problem. Please try again."
             
     except (KeyError, IndexError, TypeError) as e:
-        print(f"Error extracting bot reply: {str(e)}")
+        log.error("Error extracting bot reply: %s", e)
         return "Sorry, I encountered a problem. Please try again."
 
 
-def create_error_response(status_code, error_message):
+def error_payload(error_message):
     """
-    Create a standardized error response for API Gateway.
+    Build the body of an error response.
     
     Args:
-        status_code (int): HTTP status code for the error
         error_message (str): Human-readable error message
         
     Returns:
-        dict: API Gateway proxy response with error details
+        dict: Error payload
     """
-    error_payload = {
+    return {
         'error': error_message,
         'status': 'error'
     }
+
+
+def create_response(status_code, payload):
+    """
+    Create an API Gateway proxy response with a JSON body.
     
+    Args:
+        status_code (int): HTTP status code
+        payload (dict): Response body
+        
+    Returns:
+        dict: API Gateway proxy response
+    """
     return {
         'statusCode': status_code,
         'headers': {
             'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Origin': '*',  # Enable CORS
             'Access-Control-Allow-Headers': 'Content-Type',
             'Access-Control-Allow-Methods': 'POST, OPTIONS'
         },
-        'body': json.dumps(error_payload)
+        'body': json.dumps(payload)
     }
 
+
+def create_error_response(status_code, error_message):
+    """
+    Create a standardized error response for API Gateway.
+    
+    Args:
+        status_code (int): HTTP status code for the error
+        error_message (str): Human-readable error message
+        
+    Returns:
+        dict: API Gateway proxy response with error details
+    """
+    return create_response(status_code, error_payload(error_message))
@@ -0,0 +1,247 @@
+"""
+Local Fast-Path Intent Classification
+
+Greetings and status checks only ever get a fixed reply from the
+fulfillment Lambda, yet each one costs a Lex call, a fulfillment
+invocation and a DynamoDB write. The fast path answers them in the proxy:
+the sample utterances of the bot's intent definitions are compiled into
+one anchored regex, and a message that matches an utterance of an intent
+in FAST_PATH_REPLIES exactly (ignoring case, punctuation and spacing) is
+answered locally. Anything else - including utterances with slots, which
+need Lex to elicit them - goes to Lex as before.
+
+Intent definitions are the JSON that `aws lexv2-models describe-intent`
+returns (UTF-8 or UTF-16, like fallback-intent.json), one file per intent,
+in FAST_PATH_INTENTS_DIR. They are exported from the live bot before each
+deploy, so the fast path only knows utterances the bot itself was built with:
+    cd src_proxy && python -m fast_path --output intents
+
+Runtime: Python 3.10
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+from structured_log import log
+
+FAST_PATH_ENABLED = os.environ.get('FAST_PATH_ENABLED', 'false').lower() == 'true'
+FAST_PATH_INTENTS_DIR = os.environ.get(
+    'FAST_PATH_INTENTS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intents')
+)
+
+# Intents that may be answered locally, with the reply the fulfillment
+# Lambda gives them (keep in sync with lambda_handler in src/app.py)
+FAST_PATH_REPLIES = {
+    'GreetingIntent': "Hello! How can I help you with your AWS questions?",
+    'CheckStatusIntent': "I am checking your status now."
+}
+
+PUNCTUATION = re.compile(r"[^\w\s']+")
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(text):
+    """
+    Lowercase text and reduce punctuation and runs of whitespace to single spaces.
+    """
+    return WHITESPACE.sub(' ', PUNCTUATION.sub(' ', text.lower())).strip()
+
+
+def read_intent_definition(path):
+    """
+    Read one describe-intent JSON file, UTF-8 or UTF-16 with a BOM.
+
+    Args:
+        path (str): File path
+
+    Returns:
+        dict: Intent definition
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if raw.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return json.loads(raw.decode('utf-16'))
+    return json.loads(raw.decode('utf-8-sig'))
+
+
+class FastPathClassifier:
+    """
+    Exact-utterance classifier over a single precompiled regex.
+    """
+
+    def __init__(self, utterances):
+        """
+        Args:
+            utterances (dict): Intent name -> list of sample utterances
+        """
+        self.intents = []
+        alternatives = []
+        seen = set()
+        for intent_name, samples in utterances.items():
+            phrases = []
+            for sample in samples:
+                phrase = normalize(sample)
+                if not phrase or '{' in sample or phrase in seen:
+                    continue
+                seen.add(phrase)
+                phrases.append(re.escape(phrase))
+            if phrases:
+                alternatives.append(f"(?P<i{len(self.intents)}>{'|'.join(phrases)})")
+                self.intents.append(intent_name)
+
+        self.utterance_count = len(seen)
+        self.pattern = re.compile(f"^(?:{'|'.join(alternatives)})$") if alternatives else None
+
+    @classmethod
+    def from_directory(cls, directory, intents=FAST_PATH_REPLIES):
+        """
+        Build a classifier from the intent definitions in a directory.
+
+        Args:
+            directory (str): Directory of describe-intent JSON files
+            intents: Intent names to keep; definitions of other intents are ignored
+
+        Returns:
+            FastPathClassifier: The classifier
+        """
+        utterances = {}
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json'):
+                continue
+            definition = read_intent_definition(os.path.join(directory, name))
+            intent_name = definition.get('intentName')
+            if intent_name not in intents:
+                continue
+            samples = [sample.get('utterance', '') for sample in definition.get('sampleUtterances', [])]
+            utterances.setdefault(intent_name, []).extend(samples)
+        return cls(utterances)
+
+    def classify(self, message):
+        """
+        Intent whose sample utterance the message matches, if any.
+
+        Args:
+            message (str): User message
+
+        Returns:
+            str or None: Intent name, or None if Lex should handle the message
+        """
+        if self.pattern is None:
+            return None
+        match = self.pattern.match(normalize(message))
+        if match is None:
+            return None
+        return self.intents[int(match.lastgroup[1:])]
+
+
+def load_classifier():
+    """
+    Build the classifier if the fast path is enabled.
+
+    Returns:
+        FastPathClassifier or None: None when disabled or the definitions cannot be read
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    try:
+        classifier = FastPathClassifier.from_directory(FAST_PATH_INTENTS_DIR)
+    except (OSError, ValueError) as e:
+        log.warning("✗ Fast path disabled: cannot read intent definitions in %s: %s", FAST_PATH_INTENTS_DIR, e)
+        return None
+    log.info("✓ Fast path ready: %d utterances across %s",
+             classifier.utterance_count, ', '.join(classifier.intents) or 'no intents')
+    return classifier
+
+
+# ============================================================================
+# EXPORT CLI
+# ============================================================================
+
+def definition_file_name(intent_name):
+    """
+    File name of an exported intent: GreetingIntent -> greeting-intent.json
+    """
+    return re.sub(r'(?<!^)(?=[A-Z])', '-', intent_name).lower() + '.json'
+
+
+def export_intents(models_client, bot_id, bot_version, locale_id, directory, intents=FAST_PATH_REPLIES):
+    """
+    Write the describe-intent definitions of a bot's fast-path intents to a directory.
+
+    Args:
+        models_client: boto3 lexv2-models client
+        bot_id (str): Lex bot ID
+        bot_version (str): Bot version to export (the one the alias serves)
+        locale_id (str): Bot locale
+        directory (str): Output directory
+        intents: Intent names to export
+
+    Returns:
+        list: Names of the exported intents
+    """
+    summaries = []
+    request = {'botId': bot_id, 'botVersion': bot_version, 'localeId': locale_id}
+    while True:
+        response = models_client.list_intents(**request)
+        summaries.extend(response.get('intentSummaries', []))
+        if not response.get('nextToken'):
+            break
+        request['nextToken'] = response['nextToken']
+
+    os.makedirs(directory, exist_ok=True)
+    exported = []
+    for summary in summaries:
+        if summary['intentName'] not in intents:
+            continue
+        definition = models_client.describe_intent(
+            intentId=summary['intentId'], botId=bot_id, botVersion=bot_version, localeId=locale_id
+        )
+        definition.pop('ResponseMetadata', None)
+        with open(os.path.join(directory, definition_file_name(summary['intentName'])), 'w', encoding='utf-8') as f:
+            json.dump(definition, f, indent=4, default=lambda value: value.timestamp())
+        exported.append(summary['intentName'])
+    return exported
+
+
+def main(argv=None):
+    """
+    Command line entry point: python -m fast_path
+    """
+    from lex_runtime import LEX_BOT_ALIAS_ID, LEX_BOT_ID, LEX_LOCALE_ID
+
+    parser = argparse.ArgumentParser(
+        prog='python -m fast_path',
+        description='Export the fast-path intent definitions from the Lex bot'
+    )
+    parser.add_argument('--bot-id', default=LEX_BOT_ID, help='Lex bot ID (default: $LEX_BOT_ID)')
+    parser.add_argument('--bot-alias-id', default=LEX_BOT_ALIAS_ID,
+                        help='Alias whose bot version is exported (default: $LEX_BOT_ALIAS_ID)')
+    parser.add_argument('--bot-version', default=None,
+                        help='Export this bot version instead of the one the alias serves')
+    parser.add_argument('--locale-id', default=LEX_LOCALE_ID, help='Bot locale (default: $LEX_LOCALE_ID)')
+    parser.add_argument('--output', default=FAST_PATH_INTENTS_DIR,
+                        help='Output directory (default: $FAST_PATH_INTENTS_DIR)')
+    args = parser.parse_args(argv)
+
+    import boto3
+    models_client = boto3.client('lexv2-models')
+
+    bot_version = args.bot_version
+    if bot_version is None:
+        alias = models_client.describe_bot_alias(botAliasId=args.bot_alias_id, botId=args.bot_id)
+        bot_version = alias['botVersion']
+
+    exported = export_intents(models_client, args.bot_id, bot_version, args.locale_id, args.output)
+    missing = sorted(set(FAST_PATH_REPLIES) - set(exported))
+    print(f"✓ Exported {', '.join(exported) or 'no intents'} of bot {args.bot_id} version {bot_version} "
+          f"to {args.output}")
+    if missing:
+        print(f"✗ Not in the bot: {', '.join(missing)} (the fast path never answers them)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
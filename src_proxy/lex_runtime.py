@@ -0,0 +1,242 @@
+"""
+Lex V2 Runtime Client Layer
+
+Builds the proxy's RecognizeText client from the environment:
+
+- explicit connect/read timeouts, so a slow or throttled Lex cannot hold a
+  request until API Gateway gives up (HTTP APIs wait at most 30 s)
+- botocore 'adaptive' retries: exponential backoff with jitter, a
+  client-side rate limiter that slows down once Lex throttles, and
+  botocore's retry quota (a per-client token bucket that stops retrying
+  when most recent calls failed) as the retry budget
+- a keep-alive connection pool sized for the batch fan-out
+- LEX_ENDPOINT_URL, to point the client at a local stub Lex endpoint
+  (see benchmarks/stub_lex.py)
+
+A CircuitBreaker sits in front of the client. After LEX_BREAKER_FAILURES
+consecutive outage errors (throttling, 5xx, timeouts) calls fail fast for
+LEX_BREAKER_RESET_SECONDS, then one trial call decides whether to close
+it again. While it is open the proxy serves the session's last Lex reply to
+the same message from a ReplyCache, or a fixed "busy" reply. Only results
+of calls admitted in the breaker's current state count, and results that
+arrive after their caller's deadline are not recorded at all.
+
+Runtime: Python 3.10
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import (ClientError, ConnectionClosedError, ConnectTimeoutError,
+                                 EndpointConnectionError, ReadTimeoutError)
+
+from structured_log import log
+
+# Lex Bot Configuration
+LEX_BOT_ID = os.environ.get('LEX_BOT_ID', 'ZUD17UCEC4')
+LEX_BOT_ALIAS_ID = os.environ.get('LEX_BOT_ALIAS_ID', 'UUORFDMIMY')
+LEX_LOCALE_ID = os.environ.get('LEX_LOCALE_ID', 'en_US')
+LEX_ENDPOINT_URL = os.environ.get('LEX_ENDPOINT_URL') or None  # e.g. http://127.0.0.1:8099 for a stub
+
+# Client Configuration (read timeout x attempts should stay under API Gateway's 30 s)
+LEX_CONNECT_TIMEOUT = float(os.environ.get('LEX_CONNECT_TIMEOUT', '1'))  # seconds
+LEX_READ_TIMEOUT = float(os.environ.get('LEX_READ_TIMEOUT', '13'))  # seconds, includes the fulfillment Lambda
+LEX_MAX_ATTEMPTS = int(os.environ.get('LEX_MAX_ATTEMPTS', '2'))  # first call + retries
+LEX_RETRY_MODE = os.environ.get('LEX_RETRY_MODE', 'adaptive')  # 'adaptive', 'standard' or 'legacy'
+LEX_MAX_POOL_CONNECTIONS = int(os.environ.get('LEX_MAX_POOL_CONNECTIONS', '10'))  # >= BATCH_MAX_WORKERS
+
+# Circuit Breaker Configuration
+LEX_BREAKER_FAILURES = int(os.environ.get('LEX_BREAKER_FAILURES', '5'))  # consecutive outage errors to open
+LEX_BREAKER_RESET_SECONDS = float(os.environ.get('LEX_BREAKER_RESET_SECONDS', '30'))  # open time before a trial call
+LEX_REPLY_CACHE_SIZE = int(os.environ.get('LEX_REPLY_CACHE_SIZE', '256'))  # replies kept for degraded mode
+
+# Error codes that mean Lex (or the fulfillment Lambda behind it) is unhealthy,
+# as opposed to a bad request
+OUTAGE_ERROR_CODES = {
+    'ThrottlingException', 'InternalFailureException', 'BadGatewayException',
+    'DependencyFailedException', 'ServiceUnavailableException', 'RequestTimeoutException'
+}
+OUTAGE_EXCEPTIONS = (ConnectTimeoutError, ReadTimeoutError, EndpointConnectionError, ConnectionClosedError)
+
+
+def expired(deadline):
+    """
+    True once a time.monotonic() deadline (None: no deadline) has passed.
+    """
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def build_client():
+    """
+    Create the lexv2-runtime client from the LEX_* settings.
+
+    Returns:
+        botocore client: Lex V2 runtime client
+    """
+    config = Config(
+        connect_timeout=LEX_CONNECT_TIMEOUT,
+        read_timeout=LEX_READ_TIMEOUT,
+        retries={'mode': LEX_RETRY_MODE, 'total_max_attempts': LEX_MAX_ATTEMPTS},
+        max_pool_connections=LEX_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True
+    )
+    return boto3.client('lexv2-runtime', endpoint_url=LEX_ENDPOINT_URL, config=config)
+
+
+def is_outage(error):
+    """
+    True if an exception from recognize_text means Lex is unhealthy.
+    """
+    if isinstance(error, ClientError):
+        return (error.response.get('Error', {}).get('Code') in OUTAGE_ERROR_CODES
+                or error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500)
+    return isinstance(error, OUTAGE_EXCEPTIONS)
+
+
+class CircuitOpen(Exception):
+    """
+    Raised instead of calling Lex while the circuit breaker is open.
+    """
+    pass
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker, shared by the threads of a container.
+
+    States: 'closed' (calls go through), 'open' (calls fail fast with
+    CircuitOpen) and 'half_open' (one trial call goes through after
+    reset_seconds; its outcome closes or re-opens the breaker).
+
+    generation changes with every state change. A call's outcome is only
+    recorded if the generation is still the one the call was admitted in,
+    so a slow call that started before the breaker opened cannot close it.
+    """
+
+    def __init__(self, failure_threshold=LEX_BREAKER_FAILURES, reset_seconds=LEX_BREAKER_RESET_SECONDS,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def _set_state(self, state):
+        self.state = state
+        self.generation += 1
+        self.trial_running = False
+
+    def allow(self):
+        """
+        Check that a call may go through.
+
+        Returns:
+            int: The generation the call is admitted in
+
+        Raises:
+            CircuitOpen: While open, or while the half-open trial call runs
+        """
+        with self.lock:
+            if self.state == 'open':
+                if self.clock() - self.opened_at < self.reset_seconds:
+                    raise CircuitOpen()
+                self._set_state('half_open')
+            if self.state == 'half_open':
+                if self.trial_running:
+                    raise CircuitOpen()
+                self.trial_running = True
+            return self.generation
+
+    def record_success(self, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            if self.state != 'closed':
+                log.info("✓ Lex circuit closed")
+                self._set_state('closed')
+            self.failures = 0
+
+    def record_failure(self, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    log.warning("✗ Lex circuit open after %d failures, failing fast for %.0f s",
+                                self.failures, self.reset_seconds)
+                self._set_state('open')
+                self.opened_at = self.clock()
+
+    def abandon(self, generation):
+        """
+        Forget a call whose outcome will not be recorded; a half-open
+        trial call frees the way for the next trial.
+        """
+        with self.lock:
+            if generation == self.generation and self.state == 'half_open':
+                self.trial_running = False
+
+    def call(self, func, *args, deadline=None, **kwargs):
+        """
+        Run func through the breaker.
+
+        Outage errors (see is_outage) count as failures; other errors, such
+        as a rejected request, mean Lex answered and count as successes.
+        Outcomes after deadline (time.monotonic()) are not recorded: the
+        caller has given up on them. Exceptions from func are re-raised.
+
+        Raises:
+            CircuitOpen: If the call was not attempted
+        """
+        generation = self.allow()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if expired(deadline):
+                self.abandon(generation)
+            elif is_outage(e):
+                self.record_failure(generation)
+            else:
+                self.record_success(generation)
+            raise
+        if expired(deadline):
+            self.abandon(generation)
+        else:
+            self.record_success(generation)
+        return result
+
+
+class ReplyCache:
+    """
+    Bounded LRU of recent replies, keyed by (session, normalized message), for degraded mode.
+    """
+
+    def __init__(self, max_entries=LEX_REPLY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
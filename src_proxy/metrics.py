@@ -0,0 +1,207 @@
+"""
+Per-Stage Latency Metrics in CloudWatch Embedded Metric Format (EMF)
+
+Each timed stage writes one EMF JSON line to stdout when it finishes.
+CloudWatch Logs turns those lines into metrics: Duration per Service and
+Stage, plus CacheHit and Error counts when a stage records them. A stage
+fails when it raises or annotates error=True (one that turns its own
+exception into a reply). Spans in
+the first invocation of a container are marked ColdStart. Locally the lines
+can be captured like any other stdout output.
+
+The handler's own span is written for every invocation. The stages inside
+it are written for a METRICS_STAGE_SAMPLE_RATE share of invocations, for
+cold starts, and whenever they fail, so a warm request costs one line.
+
+Usage:
+    @timed('get_session')
+    def get_session(...):
+        ...
+        annotate(cache_hit=True)
+        ...
+        except Exception:
+            annotate(error=True)  # handled, but the stage failed
+
+    with span('s3_download', key=key):
+        ...
+
+    with collect() as item:  # on a worker thread
+        ...
+    annotations = item.properties
+
+This file is kept identical in src/ and src_proxy/ because each function
+packages only its own code directory.
+
+Runtime: Python 3.10
+"""
+
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'Chatbot')
+SERVICE_NAME = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+METRICS_STAGE_SAMPLE_RATE = float(os.environ.get('METRICS_STAGE_SAMPLE_RATE', '1'))  # share of invocations with stage lines
+
+# Keyword flags of annotate() that are also published as 0/1 metrics
+METRIC_FLAGS = {'cache_hit': 'CacheHit', 'error': 'Error'}
+
+# Invocations handled by this container so far
+INVOCATIONS = 0
+
+# Whether the stages of the current invocation are written
+STAGES_SAMPLED = True
+
+_active = threading.local()
+
+
+def start_invocation():
+    """
+    Count an invocation and decide whether its stages are written.
+
+    Call once at the top of a Lambda handler: the span enclosing the call
+    (the handler's own) is always written.
+    """
+    global INVOCATIONS, STAGES_SAMPLED
+    INVOCATIONS += 1
+    STAGES_SAMPLED = is_cold_start() or random.random() < METRICS_STAGE_SAMPLE_RATE
+
+    stack = getattr(_active, 'stack', None)
+    if stack:
+        stack[-1].always = True
+
+
+def is_cold_start():
+    """
+    True until the container's second invocation starts.
+    """
+    return INVOCATIONS <= 1
+
+
+class Span:
+    """
+    Times one stage and emits it as an EMF record on exit (a span without a
+    stage only collects properties).
+    """
+
+    def __init__(self, stage, properties=None):
+        self.stage = stage
+        self.properties = dict(properties or {})
+        self.started = None
+        self.always = False
+
+    def set(self, **properties):
+        """
+        Attach properties (or METRIC_FLAGS) to the record.
+        """
+        self.properties.update(properties)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        stack = getattr(_active, 'stack', None)
+        if stack is None:
+            stack = _active.stack = []
+        stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration_ms = (time.perf_counter() - self.started) * 1000.0
+        _active.stack.pop()
+        if self.stage is None:
+            return False
+        failed = exc_type is not None or bool(self.properties.get('error'))
+        if METRICS_ENABLED and (self.always or STAGES_SAMPLED or failed):
+            emit(emf_record(self.stage, duration_ms, self.properties, error=failed))
+        return False
+
+
+def span(stage, **properties):
+    """
+    Context manager timing the enclosed block as stage.
+    """
+    return Span(stage, properties)
+
+
+def collect():
+    """
+    Context manager gathering the annotate() properties of the enclosed block
+    without emitting a record - for work on another thread, whose spans do
+    not see the handler's. The properties are on the returned span.
+    """
+    return Span(None)
+
+
+def timed(stage):
+    """
+    Decorator timing every call of a function as stage.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(**properties):
+    """
+    Attach properties to the innermost active span of this thread (no-op outside one).
+    """
+    stack = getattr(_active, 'stack', None)
+    if stack:
+        stack[-1].set(**properties)
+
+
+def emf_record(stage, duration_ms, properties, error=False):
+    """
+    Build the EMF record of one finished stage.
+
+    Args:
+        stage (str): Stage name (a metric dimension)
+        duration_ms (float): Duration in milliseconds
+        properties (dict): Extra properties; METRIC_FLAGS keys become metrics
+        error (bool): The stage failed (same as an error property)
+
+    Returns:
+        dict: EMF record
+    """
+    record = {
+        'Service': SERVICE_NAME,
+        'Stage': stage,
+        'ColdStart': is_cold_start(),
+        'Duration': round(duration_ms, 3)
+    }
+    metrics = [{'Name': 'Duration', 'Unit': 'Milliseconds'}]
+
+    if error:
+        properties = dict(properties, error=True)
+
+    for name, value in properties.items():
+        metric = METRIC_FLAGS.get(name)
+        if metric:
+            record[metric] = int(bool(value))
+            metrics.append({'Name': metric, 'Unit': 'Count'})
+        else:
+            record[name] = value
+
+    record['_aws'] = {
+        'Timestamp': int(time.time() * 1000),
+        'CloudWatchMetrics': [{
+            'Namespace': METRICS_NAMESPACE,
+            'Dimensions': [['Service', 'Stage']],
+            'Metrics': metrics
+        }]
+    }
+    return record
+
+
+def emit(record):
+    """
+    Write one EMF record as a single stdout line.
+    """
+    print(json.dumps(record, separators=(',', ':'), default=str))
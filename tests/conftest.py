@@ -0,0 +1,80 @@
+"""
+Shared fixtures for the fulfillment Lambda tests (src/ on sys.path) and the
+proxy tests (src_proxy/, imported by the proxy fixture).
+"""
+
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+# app.py creates boto3 clients at import; no request is ever sent
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from kb_pages import PageStore  # noqa: E402
+from kb_passages import build_passage_index  # noqa: E402
+from knowledge_base import KbDocument, KnowledgeBase  # noqa: E402
+
+PAGES = [
+    "Lambda is a compute service that runs code without servers. A cold start happens when "
+    "Lambda initializes a new execution environment for a function.",
+    "DynamoDB is a key-value and document database. On-demand capacity scales with traffic, "
+    "and provisioned capacity sets the read and write throughput of a table.",
+    "S3 stores objects in buckets. Versioning keeps every version of an object, so an "
+    "overwritten or deleted object can be restored.",
+]
+
+
+def make_document(key, texts, etag='etag-1'):
+    """
+    KbDocument over page texts, indexed like a PDF loaded at startup.
+    """
+    pages = [{'page': number, 'content': text} for number, text in enumerate(texts, 1)]
+    passages, index = build_passage_index(pages)
+    return KbDocument(key, etag, PageStore.from_pages(pages), passages, index)
+
+
+@pytest.fixture
+def knowledge_base():
+    """
+    A keyword-mode knowledge base holding PAGES as one document.
+    """
+    kb = KnowledgeBase()
+    kb.sync({'docs/aws.pdf': 'etag-1'}, lambda key, etag: make_document(key, PAGES, etag))
+    return kb
+
+
+# Proxy modules whose names clash with the fulfillment Lambda's
+PROXY_MODULES = ('app', 'fast_path', 'lex_runtime', 'metrics', 'structured_log')
+
+
+def import_proxy():
+    """
+    Import the proxy's modules without replacing the src/ ones in sys.modules.
+
+    Returns:
+        SimpleNamespace: app, fast_path, lex_runtime and metrics of src_proxy/
+    """
+    saved = {name: sys.modules.pop(name) for name in PROXY_MODULES if name in sys.modules}
+    sys.path.insert(0, os.path.join(ROOT, 'src_proxy'))
+    try:
+        modules = {name: importlib.import_module(name) for name in PROXY_MODULES}
+    finally:
+        sys.path.pop(0)
+        for name in PROXY_MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+    return types.SimpleNamespace(**modules)
+
+
+@pytest.fixture(scope='session')
+def proxy():
+    """
+    The proxy Lambda's modules (src_proxy/).
+    """
+    return import_proxy()
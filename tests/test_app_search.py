@@ -0,0 +1,66 @@
+"""
+Answer lookup in the fulfillment Lambda (app.find_answer / search_pdf_for_answer).
+"""
+
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize('question', ["What is it?", "Is it?", "tell me about it"])
+def test_stop_word_question_is_not_found(knowledge_base, question):
+    assert app.extract_keywords(question) == [question.lower()]
+    assert app.find_answer(app.extract_keywords(question), knowledge_base) is None
+    assert app.search_pdf_for_answer(question, knowledge_base) == app.NOT_FOUND_MESSAGE.format(question=question)
+
+
+def test_short_terms_of_whole_question_fallback_are_kept(knowledge_base):
+    # "s3" is too short to be a keyword, so the question falls back to itself
+    assert app.query_terms(app.extract_keywords("What is S3?")) == ['s3']
+    assert "Page 3 of aws.pdf" in app.search_pdf_for_answer("What is S3?", knowledge_base)
+
+
+def test_content_question_finds_its_page(knowledge_base):
+    answer = app.search_pdf_for_answer("What is a Lambda cold start?", knowledge_base)
+    assert answer.startswith("Lambda is a compute service")
+    assert answer.endswith("(Source: Page 1 of aws.pdf)")
+
+
+def test_search_many_answers_stop_word_questions_with_not_found(knowledge_base, monkeypatch):
+    monkeypatch.setattr(app, 'load_knowledge_base', lambda: knowledge_base)
+    answers = app.search_many(["What is it?", "How does DynamoDB scale?"])
+    assert answers[0] == app.NOT_FOUND_MESSAGE.format(question="What is it?")
+    assert "Page 2 of aws.pdf" in answers[1]
+
+
+def test_prebuilt_knowledge_base_answers_without_pypdf2(knowledge_base, monkeypatch):
+    monkeypatch.setattr(app, 'PDF_AVAILABLE', False)
+    monkeypatch.setattr(app, 'load_knowledge_base', lambda: knowledge_base)
+    app.ANSWER_CACHE.clear()
+    assert app.query_pdf_knowledge_base("What is a Lambda cold start?").startswith("Lambda is a compute service")
+    app.ANSWER_CACHE.clear()
+
+
+def test_repeated_keywords_get_their_own_cached_answer(knowledge_base, monkeypatch):
+    # Query term frequency changes the BM25 ranking...
+    index = knowledge_base.documents['docs/aws.pdf'].index
+    assert index.search(['object', 'capacity']) != index.search(['object', 'object', 'capacity'])
+
+    # ...so the answer cache must not share an entry between the two
+    searched = []
+    monkeypatch.setattr(app, 'load_knowledge_base', lambda: knowledge_base)
+    monkeypatch.setattr(app, 'find_answer', lambda keywords, *args: searched.append(keywords) or "answer")
+    app.ANSWER_CACHE.clear()
+    app.query_pdf_knowledge_base("object capacity")
+    app.query_pdf_knowledge_base("capacity object")
+    app.query_pdf_knowledge_base("object object capacity")
+    assert searched == [['object', 'capacity'], ['object', 'object', 'capacity']]
+    app.ANSWER_CACHE.clear()
+
+
+def test_extraction_without_pypdf2_fails_with_a_clear_error(monkeypatch):
+    monkeypatch.setattr(app, 'PDF_AVAILABLE', False)
+    with pytest.raises(Exception, match="PyPDF2 is not installed"):
+        app.extract_pdf_from_s3('docs/aws.pdf')
+    with pytest.raises(Exception, match="PyPDF2 is not installed"):
+        app.load_lazy_pdf_from_s3('docs/aws.pdf', 'etag-1')
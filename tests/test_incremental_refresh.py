@@ -0,0 +1,120 @@
+"""
+Refreshes rebuild only the parts of the corpus-wide indexes that changed,
+with the same results as a build from scratch.
+"""
+
+import numpy as np
+import pytest
+
+from conftest import PAGES, make_document
+import kb_dense
+import kb_spelling
+from kb_matrix import TermMatrix
+from knowledge_base import KnowledgeBase
+
+TEXTS = {
+    'docs/a.pdf': PAGES[:2],
+    'docs/b.pdf': [PAGES[2]],
+}
+CHANGED_B = ["Glacier archives objects for long-term storage. Restoring an archived object takes hours."]
+QUERIES = [['lambda'], ['object', 'versioning'], ['glacier', 'restoring'], ['capacity', 'table', 'object']]
+
+
+def refreshed(mode='keyword'):
+    """
+    (knowledge base after b.pdf changed, knowledge base built from scratch with the same documents)
+    """
+    texts = dict(TEXTS)
+    kb = KnowledgeBase(mode)
+    kb.sync({key: 'v1' for key in texts}, lambda key, etag: make_document(key, texts[key], etag))
+    texts['docs/b.pdf'] = CHANGED_B
+    kb.sync({'docs/a.pdf': 'v1', 'docs/b.pdf': 'v2'}, lambda key, etag: make_document(key, texts[key], etag))
+
+    scratch = KnowledgeBase(mode)
+    scratch.sync({key: 'v' for key in kb.documents}, lambda key, etag: kb.documents[key])
+    return kb, scratch
+
+
+def test_term_matrix_reuses_unchanged_documents():
+    texts = dict(TEXTS)
+    kb = KnowledgeBase()
+    kb.sync({key: 'v1' for key in texts}, lambda key, etag: make_document(key, texts[key], etag))
+    before = kb.term_matrix()
+
+    texts['docs/b.pdf'] = CHANGED_B
+    kb.sync({'docs/a.pdf': 'v1', 'docs/b.pdf': 'v2'}, lambda key, etag: make_document(key, texts[key], etag))
+    after = kb.term_matrix()
+
+    assert after is not before
+    assert after.term_rows[0] is before.term_rows[0]  # a.pdf kept its rows
+    assert after.term_rows[1] is not before.term_rows[1]
+
+
+@pytest.mark.parametrize('terms', QUERIES)
+def test_refreshed_term_matrix_scores_like_a_fresh_one(terms):
+    kb, scratch = refreshed()
+    np.testing.assert_allclose(kb.term_matrix().score_many([terms]), scratch.term_matrix().score_many([terms]))
+    assert kb.search(terms, 3) == scratch.search(terms, 3)
+
+
+def test_dead_rows_are_dropped_once_they_dominate():
+    first = [make_document('docs/a.pdf', [f"term{n} shared" for n in range(40)])]
+    second = [make_document('docs/a.pdf', ["shared words only"], etag='v2')]
+    matrix = TermMatrix.build(second, TermMatrix.build(first))
+    assert sorted(matrix.vocabulary) == ['only', 'shared', 'words']
+
+
+def test_spelling_reindexes_only_changed_documents(monkeypatch):
+    monkeypatch.setattr(kb_spelling, 'COMPACT_SHARE', 10.0)  # a tiny corpus would always compact
+    texts = dict(TEXTS)
+    kb = KnowledgeBase()
+    kb.sync({key: 'v1' for key in texts}, lambda key, etag: make_document(key, texts[key], etag))
+    base = kb.spelling_index().base
+
+    texts['docs/b.pdf'] = CHANGED_B
+    kb.sync({'docs/a.pdf': 'v1', 'docs/b.pdf': 'v2'}, lambda key, etag: make_document(key, texts[key], etag))
+    spelling = kb.spelling_index()
+    assert spelling.base is base and list(spelling.overlays) == [id(kb.documents['docs/b.pdf'].index)]
+    assert kb.correct_terms(['glaciar', 'lamda', 'capacty']) == ['glacier', 'lambda', 'capacity']
+
+
+def test_dense_index_embeds_only_changed_documents(monkeypatch):
+    monkeypatch.setattr(kb_dense, 'REWEIGHT_SHARE', 10.0)
+    texts = dict(TEXTS)
+    kb = KnowledgeBase('hybrid')
+    kb.sync({key: 'v1' for key in texts}, lambda key, etag: make_document(key, texts[key], etag))
+    before = kb.dense_index()
+
+    hashed = []
+    encode_terms = kb_dense.encode_terms
+    monkeypatch.setattr(kb_dense, 'encode_terms', lambda terms: hashed.extend(terms) or encode_terms(terms))
+    texts['docs/b.pdf'] = CHANGED_B
+    kb.sync({'docs/a.pdf': 'v1', 'docs/b.pdf': 'v2'}, lambda key, etag: make_document(key, texts[key], etag))
+    dense = kb.dense_index()
+
+    assert sorted(hashed) == sorted(kb.documents['docs/b.pdf'].index.vocabulary)
+    a_end = dense.matrix.doc_offsets[1]
+    np.testing.assert_array_equal(dense.vectors[:a_end], before.vectors[:a_end])
+    assert dense.changed_passages == 2  # b.pdf's old and new passage
+
+    scratch = kb_dense.DenseIndex.build(dense.matrix)
+    np.testing.assert_allclose(dense.vectors[a_end:], scratch.vectors[a_end:], atol=1e-6)
+
+
+def test_dense_index_reweights_everything_once_enough_changed():
+    kb, scratch = refreshed('hybrid')
+    dense = kb.dense_index()
+    assert dense.changed_passages == 0
+    np.testing.assert_allclose(dense.vectors, scratch.dense_index().vectors, atol=1e-6)
+
+
+def test_dense_index_keeps_ivf_clusters(monkeypatch):
+    monkeypatch.setattr(kb_dense, 'REWEIGHT_SHARE', 10.0)
+    first = [make_document('docs/a.pdf', PAGES * 4), make_document('docs/b.pdf', PAGES[:1])]
+    second = [first[0], make_document('docs/b.pdf', CHANGED_B, etag='v2')]
+    previous = kb_dense.DenseIndex.build(TermMatrix.build(first), ivf_min_passages=2)
+    dense = kb_dense.DenseIndex.build(TermMatrix.build(second, previous.matrix), previous)
+
+    assert dense.centroids is previous.centroids
+    assert sorted(dense.members.tolist()) == list(range(dense.matrix.column_count))
+    assert dense.search(['glacier', 'restoring'], 1)[0][0] is second[1]
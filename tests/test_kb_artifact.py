@@ -0,0 +1,146 @@
+"""
+An artifact reads back as the pages and index it was written from, older
+format versions still load, and a stale artifact is never served.
+"""
+
+import hashlib
+import shutil
+
+import pytest
+
+import app
+import kb_artifact
+from conftest import PAGES
+from kb_artifact import (ArtifactError, build_artifact, load_artifact, load_artifact_index, matches_source,
+                         section_sizes, source_etags, write_artifact)
+from kb_passages import build_passage_index
+from kb_text import clean_pdf_text
+from pdf_extract import extract_pdf_pages
+from test_lazy_pdf import make_pdf
+
+QUERIES = [['lambda'], ['object', 'versioning'], ['capacity', 'table'], ['cold', 'start']]
+
+
+def page_dicts(texts):
+    return [{'page': number, 'content': text} for number, text in enumerate(texts, 1)]
+
+
+def write_version(path, version, monkeypatch):
+    """
+    Write PAGES as an artifact of an older format version: its sections are a prefix of SECTIONS.
+    """
+    pages = page_dicts(PAGES)
+    passages, index = build_passage_index(pages)
+    with monkeypatch.context() as patch:
+        patch.setattr(kb_artifact, 'FORMAT_VERSION', version)
+        patch.setattr(kb_artifact, 'SECTIONS', kb_artifact.SECTIONS[:kb_artifact.SECTION_COUNTS[version]])
+        write_artifact(path, pages, passages, index, {'etag': 'etag-1'})
+
+
+def assert_same_index(loaded, built):
+    assert loaded.vocabulary == built.vocabulary
+    for name in ('offsets', 'doc_ids', 'freqs', 'doc_lengths', 'position_offsets', 'positions'):
+        assert list(getattr(loaded, name)) == list(getattr(built, name)), name
+    for terms in QUERIES:
+        assert loaded.search(terms) == built.search(terms)
+
+
+def test_round_trip_reproduces_pages_and_index(tmp_path):
+    pages = page_dicts(PAGES)
+    passages, index = build_passage_index(pages)
+    path = str(tmp_path / 'kb.kbidx')
+    write_artifact(path, pages, passages, index, {'source': 'aws.pdf', 'etag': 'etag-1'})
+
+    loaded_pages, loaded_passages, loaded_index, metadata = load_artifact(path)
+
+    assert [page['content'] for page in loaded_pages] == PAGES
+    assert [page['page'] for page in loaded_pages] == [1, 2, 3]
+    assert [loaded_passages.span(i) for i in range(len(passages))] == \
+        [passages.span(i) for i in range(len(passages))]
+    assert_same_index(loaded_index, index)
+    assert metadata['etag'] == 'etag-1' and metadata['page_count'] == 3 and not metadata['index_only']
+
+
+def test_pdf_round_trip_matches_extraction(tmp_path):
+    pdf = make_pdf(12)
+    path = str(tmp_path / 'manual.pdf.kbidx')
+    build_artifact(pdf, path)
+
+    extracted = extract_pdf_pages(pdf, clean_pdf_text)
+    pages, passages, index, metadata = load_artifact(path)
+    assert list(pages) == extracted
+    assert_same_index(index, build_passage_index(extracted)[1])
+    assert set(section_sizes(path)) == set(kb_artifact.SECTIONS)
+
+
+@pytest.mark.parametrize('version', [2, 3])
+def test_older_versions_still_load(tmp_path, monkeypatch, version):
+    path = str(tmp_path / f'v{version}.kbidx')
+    write_version(path, version, monkeypatch)
+
+    pages, passages, index, metadata = load_artifact(path)
+    assert [page['content'] for page in pages] == PAGES
+    assert index.positional == (version >= 3)  # version 2 has no token positions
+
+    page_numbers, passages, index, metadata, page_refs = load_artifact_index(path)
+    assert list(page_numbers) == [1, 2, 3] and page_refs is None
+
+
+@pytest.mark.parametrize('version, section_count', [(1, 12), (5, 16), (3, 15)])
+def test_unknown_versions_are_rejected(tmp_path, monkeypatch, version, section_count):
+    path = tmp_path / 'bad.kbidx'
+    write_version(str(path), 3, monkeypatch)
+    data = bytearray(path.read_bytes())
+    kb_artifact._HEADER.pack_into(data, 0, kb_artifact.MAGIC, version, section_count)
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ArtifactError, match='Unsupported artifact version'):
+        load_artifact(str(path))
+
+
+def test_local_builds_record_every_possible_etag():
+    data = bytes(range(256)) * (9 * 1024 * 4)  # 9 MiB
+    etags = source_etags(data)
+
+    parts = [data[:8 * 1024 * 1024], data[8 * 1024 * 1024:]]
+    multipart = hashlib.md5(b''.join(hashlib.md5(part).digest() for part in parts)).hexdigest() + '-2'
+    assert etags[0] == hashlib.md5(data).hexdigest()
+    assert multipart in etags
+    assert len(etags) == 3  # single PUT, 8 MiB and 5 MiB parts
+
+    assert source_etags(b'%PDF small') == [hashlib.md5(b'%PDF small').hexdigest()]
+
+
+def test_source_check():
+    assert matches_source({'etag': 'abc'}, '"abc"') is True
+    assert matches_source({'etags': ['abc', 'def-2']}, 'def-2') is True
+    assert matches_source({'etags': ['abc']}, 'xyz') is False
+    assert matches_source({'source': 'manual.pdf'}, 'abc') is None
+    assert matches_source({'etag': 'abc'}, None) is None
+
+
+class FakeS3:
+    def __init__(self, artifact_path):
+        self.artifact_path = artifact_path
+
+    def download_file(self, Bucket, Key, Filename):
+        shutil.copy(self.artifact_path, Filename)
+
+
+@pytest.mark.parametrize('metadata, etag, usable', [
+    ({'etag': 'etag-1'}, 'etag-1', True),
+    ({'etag': 'etag-1'}, 'etag-2', False),
+    ({'etags': ['md5-of-the-local-file']}, 'md5-of-the-local-file', True),
+    ({'etags': ['md5-of-the-local-file']}, 'md5-of-a-newer-upload', False),
+    ({'source': 'manual.pdf'}, 'etag-1', False),  # built without recording the source ETag
+])
+def test_handler_rejects_stale_artifacts(tmp_path, monkeypatch, metadata, etag, usable):
+    pages = page_dicts(PAGES)
+    passages, index = build_passage_index(pages)
+    path = str(tmp_path / 'built.kbidx')
+    write_artifact(path, pages, passages, index, metadata)
+    monkeypatch.setattr(app, 's3_client', FakeS3(path))
+    monkeypatch.setattr(app, 'PDF_INDEX_LOCAL_DIR', str(tmp_path / 'downloads'))
+
+    loaded = app.load_kb_artifact_from_s3('manual.pdf', etag)
+    assert (loaded is not None) == usable
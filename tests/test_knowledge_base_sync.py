@@ -0,0 +1,111 @@
+"""
+KnowledgeBase.sync(): per-document failures and all-or-nothing refreshes.
+"""
+
+import pytest
+
+import app
+import knowledge_base as knowledge_base_module
+from conftest import PAGES, make_document
+from knowledge_base import KnowledgeBase
+
+TEXTS = {
+    'docs/a.pdf': [PAGES[0]],
+    'docs/b.pdf': [PAGES[1]],
+    'docs/c.pdf': [PAGES[2]],
+}
+
+
+def loader(failing=()):
+    def load(key, etag):
+        if key in failing:
+            raise ValueError(f"cannot parse {key}")
+        return make_document(key, TEXTS[key], etag)
+    return load
+
+
+def sources(results):
+    return [document.source for document, _, _ in results]
+
+
+def test_failing_loader_keeps_previous_copy_and_applies_the_rest():
+    kb = KnowledgeBase()
+    kb.sync({key: 'v1' for key in TEXTS}, loader())
+    previous_b = kb.documents['docs/b.pdf']
+
+    listing = {'docs/a.pdf': 'v1', 'docs/b.pdf': 'v2', 'docs/c.pdf': 'v2'}
+    loaded, removed, failed = kb.sync(listing, loader(failing={'docs/b.pdf'}))
+
+    assert (loaded, removed, failed) == (['docs/c.pdf'], [], ['docs/b.pdf'])
+    assert kb.version == 2
+    assert kb.documents['docs/b.pdf'] is previous_b
+    assert kb.documents['docs/c.pdf'].etag == 'v2'
+    # The corpus-wide indexes cover exactly the documents being served
+    assert kb.term_matrix().documents == [kb.documents[key] for key in sorted(kb.documents)]
+    assert sources(kb.search(['dynamodb'], limit=1)) == ['docs/b.pdf']
+
+    # Still stale, so the next sync retries it
+    loaded, _, failed = kb.sync(listing, loader())
+    assert (loaded, failed) == (['docs/b.pdf'], [])
+    assert kb.documents['docs/b.pdf'].etag == 'v2'
+
+
+def test_failing_new_document_is_skipped():
+    kb = KnowledgeBase()
+    loaded, removed, failed = kb.sync({key: 'v1' for key in TEXTS}, loader(failing={'docs/a.pdf'}))
+
+    assert (loaded, failed) == (['docs/b.pdf', 'docs/c.pdf'], ['docs/a.pdf'])
+    assert sorted(kb.documents) == ['docs/b.pdf', 'docs/c.pdf']
+    assert kb.search(['lambda']) == []
+    assert kb.correct_terms(['lambdda']) == ['lambdda']
+
+
+def test_failed_index_build_leaves_the_knowledge_base_unchanged(monkeypatch):
+    kb = KnowledgeBase()
+    kb.sync({'docs/a.pdf': 'v1', 'docs/b.pdf': 'v1'}, loader())
+    before = (dict(kb.documents), kb.version, kb.matrix, kb.spelling)
+
+    def fail(*args, **kwargs):
+        raise MemoryError("no room for the matrix")
+    monkeypatch.setattr(knowledge_base_module.TermMatrix, 'build', fail)
+
+    with pytest.raises(MemoryError):
+        kb.sync({'docs/a.pdf': 'v2', 'docs/c.pdf': 'v1'}, loader())
+    assert (dict(kb.documents), kb.version, kb.matrix, kb.spelling) == before
+
+
+@pytest.fixture
+def s3_knowledge_base(monkeypatch):
+    """
+    app.sync_knowledge_base() against a fake listing; yields the listing to edit.
+    """
+    listing = {key: 'v1' for key in TEXTS}
+    failing = set()
+    monkeypatch.setattr(app, 'PDF_S3_BUCKET', 'bucket')
+    monkeypatch.setattr(app, 'KNOWLEDGE_BASE', None)
+    monkeypatch.setattr(app, 'list_knowledge_base_pdfs', lambda: dict(listing))
+    monkeypatch.setattr(app, 'load_pdf_from_s3', lambda key, etag: loader(failing)(key, etag))
+    app.ANSWER_CACHE.clear()
+    yield listing, failing
+    app.ANSWER_CACHE.clear()
+
+
+def test_refresh_with_a_failing_pdf_clears_answers_of_the_applied_changes(s3_knowledge_base):
+    listing, failing = s3_knowledge_base
+    kb = app.sync_knowledge_base()
+    app.ANSWER_CACHE.put((('s3',), kb.version), "cached answer")
+
+    listing.update({'docs/b.pdf': 'v2', 'docs/c.pdf': 'v2'})
+    failing.add('docs/b.pdf')
+    kb = app.sync_knowledge_base()
+
+    assert kb is app.KNOWLEDGE_BASE and kb.version == 2
+    assert len(app.ANSWER_CACHE) == 0
+
+
+def test_first_load_fails_when_no_pdf_loads(s3_knowledge_base):
+    _, failing = s3_knowledge_base
+    failing.update(TEXTS)
+    with pytest.raises(Exception, match="no PDF could be loaded"):
+        app.sync_knowledge_base()
+    assert app.KNOWLEDGE_BASE is None
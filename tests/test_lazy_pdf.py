@@ -0,0 +1,116 @@
+"""
+Lazy mode reads only the parts of a PDF that the extracted pages need.
+"""
+
+import io
+
+import pytest
+
+from kb_artifact import build_artifact, load_artifact_index
+from kb_text import clean_pdf_text
+from lazy_pdf import LazyPdfPages, S3RangeReader
+
+PAGE_COUNT = 120
+SECTION_PAGES = 40
+
+
+def page_lines(page_num):
+    return [f"Page {page_num} describes topic{page_num} in line {line} of the manual." for line in range(30)]
+
+
+def make_pdf(page_count):
+    """
+    PDF whose pages sit in a two-level page tree and inherit /Resources from the root.
+    """
+    sections = range(0, page_count, SECTION_PAGES)
+    first_page_obj = 4 + len(sections)
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        (f'<< /Type /Pages /Kids [{" ".join(f"{4 + i} 0 R" for i in range(len(sections)))}] /Count {page_count} '
+         f'/Resources << /Font << /F1 3 0 R >> >> /MediaBox [0 0 612 792] >>').encode(),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    for first in sections:
+        last = min(first + SECTION_PAGES, page_count)
+        kids = ' '.join(f'{first_page_obj + 2 * page} 0 R' for page in range(first, last))
+        objects.append(f'<< /Type /Pages /Parent 2 0 R /Kids [{kids}] /Count {last - first} >>'.encode())
+    for page in range(page_count):
+        parent = 4 + page // SECTION_PAGES
+        objects.append(f'<< /Type /Page /Parent {parent} 0 R /Contents {first_page_obj + 2 * page + 1} 0 R >>'.encode())
+        text = '\n'.join(f'({line}) Tj T*' for line in page_lines(page + 1))
+        stream = f'BT /F1 10 Tf 50 750 Td 12 TL\n{text}\nET'.encode('latin-1')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+
+    pdf = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+    xref = len(pdf)
+    pdf += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    pdf += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    pdf += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return bytes(pdf)
+
+
+class FakeS3:
+    """
+    Serves one object for head_object and ranged get_object calls.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.data), 'ETag': '"etag-1"'}
+
+    def get_object(self, Bucket, Key, Range, IfMatch):
+        start, end = (int(bound) for bound in Range.split('=')[1].split('-'))
+        return {'Body': io.BytesIO(self.data[start:end + 1])}
+
+
+@pytest.fixture(scope='module')
+def lazy_pdf(tmp_path_factory):
+    pdf = make_pdf(PAGE_COUNT)
+    path = str(tmp_path_factory.mktemp('artifact') / 'manual.pdf.kbidx')
+    build_artifact(pdf, path, include_text=False)
+    page_numbers, passages, index, metadata, page_refs = load_artifact_index(path)
+    return pdf, page_numbers, page_refs
+
+
+def open_lazy(pdf, page_numbers, page_refs):
+    stream = S3RangeReader(FakeS3(pdf), 'bucket', 'manual.pdf', block_size=4096, max_blocks=8)
+    return stream, LazyPdfPages(stream, page_numbers, clean=clean_pdf_text, page_refs=page_refs)
+
+
+def test_artifact_records_page_refs(lazy_pdf):
+    pdf, page_numbers, page_refs = lazy_pdf
+    assert list(page_numbers) == list(range(1, PAGE_COUNT + 1))
+    refs = list(page_refs)
+    assert len(refs) == 2 * PAGE_COUNT
+    assert all(refs[0::2]) and not any(refs[1::2])  # object numbers, generation 0
+
+
+def test_one_page_reads_a_small_part_of_the_pdf(lazy_pdf):
+    pdf, page_numbers, page_refs = lazy_pdf
+    stream, pages = open_lazy(pdf, page_numbers, page_refs)
+    opened = stream.bytes_fetched
+
+    text = pages.page_text(77)
+    assert 'topic77' in text and 'topic76' not in text
+    assert stream.bytes_fetched - opened < len(pdf) // 10
+
+    # Without page references PyPDF2 walks the whole page tree first
+    stream, pages = open_lazy(pdf, page_numbers, None)
+    assert pages.page_text(77) == text
+    assert stream.bytes_fetched > len(pdf) // 2
+
+
+def test_resolved_pages_match_pypdf2(lazy_pdf):
+    pdf, page_numbers, page_refs = lazy_pdf
+    _, direct = open_lazy(pdf, page_numbers, page_refs)
+    _, walked = open_lazy(pdf, page_numbers, None)
+    for page_num in (1, SECTION_PAGES, SECTION_PAGES + 1, PAGE_COUNT):
+        page = direct.page(page_num)
+        assert '/Resources' in page and '/MediaBox' in page  # inherited from the root
+        assert direct.page_text(page_num) == walked.page_text(page_num)
@@ -0,0 +1,188 @@
+"""
+The Lex client takes its limits from the environment, and the circuit
+breaker fails fast while Lex is down, serving recent replies meanwhile.
+"""
+
+import json
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+from conftest import import_proxy
+
+THROTTLED = ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'RecognizeText')
+REJECTED = ClientError({'Error': {'Code': 'ValidationException', 'Message': 'bad text'}}, 'RecognizeText')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def fail(error):
+    def call():
+        raise error
+    return call
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(proxy, clock):
+    return proxy.lex_runtime.CircuitBreaker(failure_threshold=3, reset_seconds=30, clock=clock)
+
+
+def test_outage_errors_open_the_breaker(proxy, breaker):
+    for _ in range(2):
+        with pytest.raises(ClientError):
+            breaker.call(fail(THROTTLED))
+    assert breaker.state == 'closed'
+
+    # A rejected request means Lex answered: it resets the count
+    with pytest.raises(ClientError):
+        breaker.call(fail(REJECTED))
+    assert breaker.failures == 0
+
+    for _ in range(3):
+        with pytest.raises(ReadTimeoutError):
+            breaker.call(fail(ReadTimeoutError(endpoint_url='http://lex')))
+    assert breaker.state == 'open'
+
+    calls = []
+    with pytest.raises(proxy.lex_runtime.CircuitOpen):
+        breaker.call(lambda: calls.append(1))
+    assert not calls
+
+
+def test_one_trial_call_after_the_reset_time(proxy, breaker, clock):
+    for _ in range(3):
+        with pytest.raises(ClientError):
+            breaker.call(fail(THROTTLED))
+
+    clock.now += 29
+    with pytest.raises(proxy.lex_runtime.CircuitOpen):
+        breaker.allow()
+
+    clock.now += 1
+    generation = breaker.allow()
+    assert breaker.state == 'half_open'
+    with pytest.raises(proxy.lex_runtime.CircuitOpen):
+        breaker.allow()  # only one trial at a time
+
+    # A failed trial re-opens it for another reset period
+    breaker.record_failure(generation)
+    assert breaker.state == 'open'
+    with pytest.raises(proxy.lex_runtime.CircuitOpen):
+        breaker.allow()
+
+    clock.now += 30
+    assert breaker.call(lambda: 'ok') == 'ok'
+    assert breaker.state == 'closed' and breaker.failures == 0
+
+
+def test_outcomes_of_an_older_state_are_ignored(breaker):
+    generation = breaker.allow()
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == 'open'
+
+    breaker.record_success(generation)
+    assert breaker.state == 'open'
+
+
+def test_a_late_trial_frees_the_next_trial(breaker, clock):
+    for _ in range(3):
+        with pytest.raises(ClientError):
+            breaker.call(fail(THROTTLED))
+    clock.now += 30
+
+    assert breaker.call(lambda: 'late', deadline=0.0) == 'late'
+    assert breaker.state == 'half_open' and not breaker.trial_running
+    breaker.allow()
+
+
+def test_reply_cache_is_a_bounded_lru(proxy):
+    cache = proxy.lex_runtime.ReplyCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+    disabled = proxy.lex_runtime.ReplyCache(max_entries=0)
+    disabled.put('a', 1)
+    assert disabled.get('a') is None
+
+
+class ScriptedLex:
+    def __init__(self):
+        self.error = None
+
+    def recognize_text(self, botId, botAliasId, localeId, sessionId, text):
+        if self.error:
+            raise self.error
+        return {
+            'messages': [{'content': f"reply to {text}"}],
+            'sessionState': {'intent': {'name': 'FallbackIntent', 'state': 'Fulfilled'}}
+        }
+
+
+def test_open_breaker_serves_the_sessions_cached_reply(proxy, monkeypatch):
+    app = proxy.app
+    lex = ScriptedLex()
+    monkeypatch.setattr(app, 'lex_client', lex)
+    monkeypatch.setattr(app, 'LEX_BREAKER', proxy.lex_runtime.CircuitBreaker(failure_threshold=1))
+    monkeypatch.setattr(app, 'REPLY_CACHE', proxy.lex_runtime.ReplyCache())
+    monkeypatch.setattr(app, 'FAST_PATH', None)
+
+    assert app.process_message({'message': 'What is S3?', 'user_id': 'u1'})[0] == 200
+    lex.error = THROTTLED
+    assert app.process_message({'message': 'what is s3', 'user_id': 'u1'})[0] == 500
+    assert app.LEX_BREAKER.state == 'open'
+
+    status_code, payload = app.process_message({'message': 'What is S3', 'user_id': 'u1'})
+    assert status_code == 200
+    assert payload['reply'] == "reply to What is S3?" and payload['degraded'] is True
+
+    # Not another session's reply, and not an unseen message
+    status_code, payload = app.process_message({'message': 'What is S3?', 'user_id': 'u2'})
+    assert status_code == 503 and payload['error'] == app.DEGRADED_REPLY
+    assert app.process_message({'message': 'What is EC2?', 'user_id': 'u1'})[0] == 503
+
+    response = app.lambda_handler({'body': json.dumps({'message': 'what is s3?', 'user_id': 'u1'})}, None)
+    assert json.loads(response['body'])['degraded'] is True
+
+
+def test_client_config_comes_from_the_environment(monkeypatch):
+    monkeypatch.setenv('LEX_CONNECT_TIMEOUT', '2')
+    monkeypatch.setenv('LEX_READ_TIMEOUT', '7')
+    monkeypatch.setenv('LEX_MAX_ATTEMPTS', '4')
+    monkeypatch.setenv('LEX_RETRY_MODE', 'standard')
+    monkeypatch.setenv('LEX_MAX_POOL_CONNECTIONS', '16')
+    monkeypatch.setenv('LEX_ENDPOINT_URL', 'http://127.0.0.1:8099')
+    monkeypatch.setenv('LEX_BREAKER_FAILURES', '9')
+    monkeypatch.setenv('LEX_REPLY_CACHE_SIZE', '3')
+    lex_runtime = import_proxy().lex_runtime
+
+    client = lex_runtime.build_client()
+    config = client.meta.config
+    assert (config.connect_timeout, config.read_timeout) == (2.0, 7.0)
+    assert config.retries == {'mode': 'standard', 'total_max_attempts': 4}
+    assert config.max_pool_connections == 16 and config.tcp_keepalive
+    assert client.meta.endpoint_url == 'http://127.0.0.1:8099'
+    assert lex_runtime.CircuitBreaker().failure_threshold == 9
+    assert lex_runtime.ReplyCache().max_entries == 3
+
+
+def test_client_defaults(proxy):
+    config = proxy.lex_runtime.build_client().meta.config
+    assert (config.connect_timeout, config.read_timeout) == (1.0, 13.0)
+    assert config.retries == {'mode': 'adaptive', 'total_max_attempts': 2}
+    assert config.max_pool_connections == 10
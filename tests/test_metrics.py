@@ -0,0 +1,120 @@
+"""
+Stage spans become EMF lines. A warm request writes only its handler line;
+cold starts and failed stages are always written in full.
+"""
+
+import json
+
+import pytest
+
+import app
+import metrics
+from structured_log import log
+from test_sessions import FakeTable
+
+
+def emf_lines(captured):
+    return [json.loads(line) for line in captured.out.splitlines() if line.startswith('{"Service"')]
+
+
+def lex_event(question):
+    return {
+        'sessionId': 's1',
+        'inputTranscript': question,
+        'sessionState': {'intent': {'name': 'FallbackIntent'}, 'sessionAttributes': {}}
+    }
+
+
+@pytest.fixture
+def handler(knowledge_base, monkeypatch):
+    """
+    lambda_handler over the test knowledge base and a FakeTable, logging JSON
+    at INFO and writing stage lines for no warm request (template settings,
+    with a sample rate of 0 instead of 0.05).
+    """
+    monkeypatch.setattr(app, 'USE_PDF_KB', True)
+    monkeypatch.setattr(app, 'load_knowledge_base', lambda: knowledge_base)
+    monkeypatch.setattr(app, 'table', FakeTable())
+    monkeypatch.setattr(app, 'SESSION_STORE_MODE', 'put')
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', True)
+    monkeypatch.setattr(metrics, 'METRICS_STAGE_SAMPLE_RATE', 0)
+    monkeypatch.setattr(metrics, 'INVOCATIONS', 0)
+    monkeypatch.setattr(log, 'base_level', 20)
+    monkeypatch.setattr(log, 'sample_rate', 0)
+    monkeypatch.setattr(log, 'log_format', 'json')
+    app.ANSWER_CACHE.clear()
+    app.SESSION_CACHE.clear()
+    yield app.lambda_handler
+    app.ANSWER_CACHE.clear()
+    app.SESSION_CACHE.clear()
+
+
+@pytest.fixture
+def warm_unsampled(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', True)
+    monkeypatch.setattr(metrics, 'METRICS_STAGE_SAMPLE_RATE', 0)
+    monkeypatch.setattr(metrics, 'INVOCATIONS', 5)
+    monkeypatch.setattr(metrics, 'STAGES_SAMPLED', False)
+
+
+def test_handled_search_error_is_a_failed_stage(warm_unsampled, monkeypatch, capsys):
+    def broken():
+        raise RuntimeError("index is corrupt")
+
+    monkeypatch.setattr(app, 'USE_PDF_KB', True)
+    monkeypatch.setattr(app, 'load_knowledge_base', broken)
+
+    assert "error searching the knowledge base" in app.query_pdf_knowledge_base("What is S3?")
+
+    records = emf_lines(capsys.readouterr())
+    assert [record['Stage'] for record in records] == ['query_pdf_knowledge_base']
+    assert records[0]['Error'] == 1 and records[0]['exception'] == 'RuntimeError'
+    assert {'Name': 'Error', 'Unit': 'Count'} in records[0]['_aws']['CloudWatchMetrics'][0]['Metrics']
+
+
+def test_error_metric_is_listed_once():
+    record = metrics.emf_record('stage', 1.0, {'error': True}, error=True)
+    names = [metric['Name'] for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']]
+    assert names == ['Duration', 'Error']
+    assert record['Error'] == 1
+
+    assert 'Error' not in metrics.emf_record('stage', 1.0, {}, error=False)
+
+
+def test_cold_start_writes_every_stage(handler, capsys):
+    handler(lex_event("What is a Lambda cold start?"), None)
+
+    records = emf_lines(capsys.readouterr())
+    stages = [record['Stage'] for record in records]
+    assert {'get_session', 'save_session', 'query_pdf_knowledge_base', 'score_passages'} <= set(stages)
+    assert stages[-1] == 'lambda_handler'
+    assert all(record['ColdStart'] for record in records)
+
+
+def test_warm_cached_request_writes_one_log_line_and_one_emf_line(handler, capsys):
+    handler(lex_event("What is a Lambda cold start?"), None)  # cold start, fills the caches
+    handler(lex_event("What is a Lambda cold start?"), None)
+    capsys.readouterr()
+
+    response = handler(lex_event("What is a Lambda cold start?"), None)
+    assert response['messages'][0]['content'].startswith("Lambda is a compute service")
+
+    output = capsys.readouterr().out.splitlines()
+    assert len(output) == 2
+    log_line, emf_line = (json.loads(line) for line in output)
+    assert log_line['level'] == 'INFO' and log_line['message'].startswith('Processing')
+    assert emf_line['Stage'] == 'lambda_handler' and not emf_line['ColdStart']
+
+
+def test_failed_stage_is_written_in_an_unsampled_request(warm_unsampled, capsys):
+    with metrics.span('lambda_handler'):
+        metrics.start_invocation()
+        with metrics.span('get_session'):
+            pass
+        with pytest.raises(ValueError):
+            with metrics.span('save_session'):
+                raise ValueError("throttled")
+
+    records = emf_lines(capsys.readouterr())
+    assert [(record['Stage'], record.get('Error')) for record in records] == \
+        [('save_session', 1), ('lambda_handler', None)]
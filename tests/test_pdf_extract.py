@@ -0,0 +1,23 @@
+"""
+Parallel extraction returns exactly what sequential extraction does.
+"""
+
+from kb_text import clean_pdf_text
+from pdf_extract import extract_pdf_pages, extract_pdf_pages_parallel, pdf_page_count
+from test_lazy_pdf import make_pdf
+
+PAGE_COUNT = 45
+
+
+def test_page_count_reads_the_page_tree_root():
+    pdf = make_pdf(PAGE_COUNT)
+    assert pdf_page_count(pdf) == PAGE_COUNT
+
+
+def test_parallel_extraction_matches_sequential():
+    pdf = make_pdf(PAGE_COUNT)
+    expected = extract_pdf_pages(pdf, clean_pdf_text)
+    assert len(expected) == PAGE_COUNT
+
+    assert extract_pdf_pages_parallel(pdf, 3, clean=clean_pdf_text) == expected
+    assert extract_pdf_pages_parallel(pdf, 4, clean=clean_pdf_text, total_pages=PAGE_COUNT) == expected
@@ -0,0 +1,151 @@
+"""
+A batch is sent one worker per session, answers every message in input
+order, and gives up on what is still running at its deadline.
+"""
+
+import json
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+
+class FakeLex:
+    """
+    RecognizeText stub: replies "reply to <text>", raises the errors set per
+    text and holds the texts in blocked until release is set.
+    """
+
+    def __init__(self, errors=None, blocked=(), delay=0.0):
+        self.errors = errors or {}
+        self.blocked = set(blocked)
+        self.delay = delay
+        self.release = threading.Event()
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def recognize_text(self, botId, botAliasId, localeId, sessionId, text):
+        with self.lock:
+            self.calls.append((sessionId, text))
+        if text in self.blocked:
+            self.release.wait(5)
+        time.sleep(self.delay)
+        if text in self.errors:
+            raise self.errors[text]
+        return {
+            'messages': [{'content': f"reply to {text}"}],
+            'sessionState': {'intent': {'name': 'FallbackIntent', 'state': 'Fulfilled'}}
+        }
+
+
+@pytest.fixture
+def proxy_app(proxy, monkeypatch):
+    """
+    The proxy app with a fresh breaker and reply cache and no fast path.
+    """
+    monkeypatch.setattr(proxy.app, 'LEX_BREAKER', proxy.lex_runtime.CircuitBreaker(failure_threshold=2))
+    monkeypatch.setattr(proxy.app, 'REPLY_CACHE', proxy.lex_runtime.ReplyCache())
+    monkeypatch.setattr(proxy.app, 'FAST_PATH', None)
+    return proxy.app
+
+
+def use_lex(monkeypatch, app, lex):
+    monkeypatch.setattr(app, 'lex_client', lex)
+    return lex
+
+
+def run_batch(app, messages):
+    response = app.handle_batch(messages)
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])['results']
+
+
+def test_each_session_keeps_its_order(proxy_app, monkeypatch):
+    lex = use_lex(monkeypatch, proxy_app, FakeLex(delay=0.01))
+    messages = [{'message': f"{user} turn {turn}", 'user_id': user}
+                for turn in range(4) for user in ('u1', 'u2', 'u3')]
+
+    results = run_batch(proxy_app, messages)
+
+    assert [result['reply'] for result in results] == [f"reply to {item['message']}" for item in messages]
+    for user in ('u1', 'u2', 'u3'):
+        assert [text for session, text in lex.calls if session == user] == \
+            [f"{user} turn {turn}" for turn in range(4)]
+
+
+def test_a_failed_message_does_not_fail_the_batch(proxy_app, monkeypatch):
+    denied = ClientError({'Error': {'Code': 'AccessDeniedException', 'Message': 'denied'}}, 'RecognizeText')
+    use_lex(monkeypatch, proxy_app, FakeLex(errors={'denied': denied}))
+
+    results = run_batch(proxy_app, [
+        {'message': 'hello', 'user_id': 'u1'},
+        {'message': 'no user'},
+        {'message': 'denied', 'user_id': 'u2'},
+        'not an object',
+    ])
+
+    assert [result['status_code'] for result in results] == [200, 400, 500, 400]
+    assert results[0]['reply'] == "reply to hello"
+    assert 'user_id' in results[1]['error']
+
+
+def test_batch_size_is_limited(proxy_app, monkeypatch):
+    use_lex(monkeypatch, proxy_app, FakeLex())
+    messages = [{'message': f"turn {turn}", 'user_id': 'u1'} for turn in range(proxy_app.BATCH_MAX_MESSAGES + 1)]
+
+    response = proxy_app.handle_batch(messages)
+    assert response['statusCode'] == 400
+    assert str(proxy_app.BATCH_MAX_MESSAGES) in json.loads(response['body'])['error']
+
+    assert len(run_batch(proxy_app, messages[:-1])) == proxy_app.BATCH_MAX_MESSAGES
+
+
+def test_deadline_answers_504_and_drops_the_late_reply(proxy_app, monkeypatch):
+    lex = use_lex(monkeypatch, proxy_app, FakeLex(blocked={'slow'}))
+    monkeypatch.setattr(proxy_app, 'BATCH_DEADLINE_SECONDS', 0.2)
+    workers_before = set(threading.enumerate())
+
+    results = run_batch(proxy_app, [
+        {'message': 'slow', 'user_id': 'u1'},
+        {'message': 'after slow', 'user_id': 'u1'},
+        {'message': 'fast', 'user_id': 'u2'},
+    ])
+    assert [result['status_code'] for result in results] == [504, 504, 200]
+
+    # Lex goes down while the abandoned call still runs; its late success
+    # must neither close the breaker nor fill the reply cache
+    breaker = proxy_app.LEX_BREAKER
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    lex.release.set()
+    for worker in set(threading.enumerate()) - workers_before:
+        worker.join(5)
+
+    assert breaker.state == 'open'
+    assert proxy_app.REPLY_CACHE.get(('u1', 'slow')) is None
+    assert proxy_app.REPLY_CACHE.get(('u2', 'fast')) is not None
+    assert ('u1', 'after slow') not in lex.calls
+
+
+def test_worker_annotations_reach_the_batch_line(proxy, proxy_app, monkeypatch, capsys):
+    class Greetings:
+        def classify(self, message):
+            return 'GreetingIntent' if message == 'hi' else None
+
+    use_lex(monkeypatch, proxy_app, FakeLex())
+    monkeypatch.setattr(proxy_app, 'FAST_PATH', Greetings())
+    monkeypatch.setattr(proxy.metrics, 'STAGES_SAMPLED', True)
+
+    results = run_batch(proxy_app, [
+        {'message': 'hi', 'user_id': 'u1'},
+        {'message': 'hi', 'user_id': 'u2'},
+        {'message': 'what is S3', 'user_id': 'u3'},
+    ])
+    assert [result['intent'] for result in results] == ['GreetingIntent', 'GreetingIntent', 'FallbackIntent']
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"Service"')]
+    batch = [record for record in records if record['Stage'] == 'batch']
+    assert len(batch) == 1
+    assert batch[0]['fast_path'] == 2 and batch[0]['messages'] == 3
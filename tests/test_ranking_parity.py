@@ -0,0 +1,69 @@
+"""
+The NumPy term-matrix path and the pure-Python BM25 path rank alike, ties included.
+"""
+
+import random
+
+import pytest
+
+import knowledge_base as knowledge_base_module
+from conftest import make_document
+from knowledge_base import KnowledgeBase
+
+WORDS = ('lambda', 'cold', 'start', 'bucket', 'object', 'versioning', 'table', 'capacity',
+         'region', 'timeout', 'memory', 'queue')
+
+
+def make_corpus(seed=11):
+    """
+    Two documents of short, repetitive pages, so many passages score exactly alike.
+    """
+    rng = random.Random(seed)
+    documents = {}
+    for key in ('docs/b.pdf', 'docs/a.pdf'):
+        pages = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 6))) + '.' for _ in range(60)]
+        documents[key] = pages + pages[:20]  # identical pages tie exactly
+    kb = KnowledgeBase()
+    kb.sync({key: 'etag' for key in documents}, lambda key, etag: make_document(key, documents[key], etag))
+    return kb
+
+
+def keys(results):
+    return [(document.source, passage_id) for document, passage_id, _ in results]
+
+
+@pytest.mark.parametrize('limit', [1, 5, 20, None])
+def test_matrix_and_pure_python_paths_agree(limit):
+    kb = make_corpus()
+    assert kb.term_matrix() is not None
+    rng = random.Random(5)
+    queries = [rng.sample(WORDS, rng.randint(1, 3)) for _ in range(40)]
+
+    documents = list(kb.documents.values())
+    ties = 0
+    for terms in queries:
+        with_matrix = kb.search(terms, limit)
+        pure_python = kb.search(terms, limit, documents=documents)
+        assert keys(with_matrix) == keys(pure_python), terms
+        assert [score for *_, score in with_matrix] == pytest.approx([score for *_, score in pure_python])
+        full = kb.search(terms)
+        ties += len(full) > 1 and full[0][2] == full[1][2]
+    assert ties  # the best score is shared by several passages for some queries
+
+
+def test_search_without_numpy_matches_search_many(monkeypatch):
+    kb = make_corpus()
+    queries = [['versioning'], ['cold', 'start'], ['table', 'capacity', 'region']]
+    batched = [keys(results) for results in kb.search_many(queries, limit=3)]
+
+    monkeypatch.setattr(knowledge_base_module, 'NUMPY_AVAILABLE', False)
+    kb = make_corpus()
+    assert kb.term_matrix() is None
+    assert [keys(kb.search(terms, 3)) for terms in queries] == batched
+
+
+def test_inverted_index_breaks_ties_by_doc_id():
+    document = make_document('docs/a.pdf', ['lambda timeout.', 'queue.', 'lambda timeout.', 'lambda timeout.'])
+    ranked = document.index.search(['lambda'], limit=2)
+    assert [doc_id for doc_id, _ in ranked] == [0, 2]
+    assert [doc_id for doc_id, _ in document.index.search(['lambda'])] == [0, 2, 3]
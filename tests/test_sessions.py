@@ -0,0 +1,253 @@
+"""
+Session writes are guarded by the stored version, so concurrent containers never drop a turn.
+"""
+
+import copy
+import re
+
+import pytest
+from botocore.exceptions import ClientError
+
+import app
+from session_history import decode_history
+
+
+def conditional_check_failed(operation):
+    return ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'failed'}}, operation)
+
+
+def split_arguments(text):
+    """
+    Split an expression list at the commas outside parentheses.
+    """
+    parts, depth, start = [], 0, 0
+    for position, char in enumerate(text):
+        depth += {'(': 1, ')': -1}.get(char, 0)
+        if char == ',' and depth == 0:
+            parts.append(text[start:position].strip())
+            start = position + 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+class FakeTable:
+    """
+    In-memory session table honouring the version conditions of save_session()
+    and the update expressions of update_session() / trim_session_history().
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.updates = []
+        self.before_update = None  # called with the request, e.g. to write from "another container"
+
+    def get_item(self, Key):
+        item = self.items.get(Key['session_id'])
+        return {'Item': copy.deepcopy(item)} if item is not None else {}
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None):
+        stored = self.items.get(Item['session_id'], {})
+        if ConditionExpression == 'attribute_not_exists(#version)':
+            ok = 'version' not in stored
+        elif ConditionExpression == '#version = :expected':
+            ok = stored.get('version') == ExpressionAttributeValues[':expected']
+        else:
+            ok = True
+        if not ok:
+            raise conditional_check_failed('PutItem')
+        self.items[Item['session_id']] = copy.deepcopy(Item)
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeNames,
+                    ExpressionAttributeValues, ReturnValues='NONE'):
+        self.updates.append(UpdateExpression)
+        if self.before_update:
+            self.before_update(UpdateExpression)
+        names, values = ExpressionAttributeNames, ExpressionAttributeValues
+        item = copy.deepcopy(self.items.get(Key['session_id'], dict(Key)))
+
+        function, argument, operand = re.fullmatch(r'(\w+)\((#\w+)\)(?: = (:\w+))?', ConditionExpression).groups()
+        name = names[argument]
+        ok = {
+            'attribute_exists': lambda: name in item,
+            'attribute_not_exists': lambda: name not in item,
+            'size': lambda: len(item.get(name, [])) == values[operand],
+        }[function]()
+        if not ok:
+            raise conditional_check_failed('UpdateItem')
+
+        def evaluate(expression):
+            if expression.startswith(':'):
+                return copy.deepcopy(values[expression])
+            function, arguments = re.fullmatch(r'(\w+)\((.*)\)', expression).groups()
+            first, second = split_arguments(arguments)
+            if function == 'if_not_exists':
+                return item.get(names[first], evaluate(second))
+            return evaluate(first) + evaluate(second)  # list_append
+
+        touched, removals = set(), []
+        for action, clause in re.findall(r'(SET|ADD|REMOVE) (.*?)(?= SET | ADD | REMOVE |$)', UpdateExpression):
+            for part in split_arguments(clause):
+                if action == 'SET':
+                    target, expression = part.split(' = ', 1)
+                    item[names[target]] = evaluate(expression)
+                    touched.add(names[target])
+                elif action == 'ADD':
+                    path, operand = part.split(' ')
+                    *parents, leaf = [names[segment] for segment in path.split('.')]
+                    container = item
+                    for parent in parents:
+                        container = container[parent]
+                    container[leaf] = container.get(leaf, 0) + values[operand]
+                    touched.add(names[path.split('.')[0]])
+                else:
+                    target, index = re.fullmatch(r'(#\w+)\[(\d+)\]', part).groups()
+                    removals.append((names[target], int(index)))
+        for name, index in sorted(removals, reverse=True):
+            del item[name][index]
+
+        self.items[Key['session_id']] = item
+        if ReturnValues == 'UPDATED_NEW':
+            return {'Attributes': {name: copy.deepcopy(item[name]) for name in touched}}
+        return {}
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeTable()
+    monkeypatch.setattr(app, 'table', table)
+    monkeypatch.setattr(app, 'SESSION_HISTORY_ENCODING', 'full')
+    app.SESSION_CACHE.clear()
+    yield table
+    app.SESSION_CACHE.clear()
+
+
+def turn(text):
+    return {'intent': 'FallbackIntent', 'user_input': text, 'bot_response': f"reply to {text}"}
+
+
+def user_inputs(item):
+    return [stored['user_input'] for stored in decode_history(item['conversation_history'])]
+
+
+def test_turns_are_appended_with_increasing_versions(table):
+    assert app.rewrite_session('s1', 'FallbackIntent', turn('first'))
+    assert app.rewrite_session('s1', 'FallbackIntent', turn('second'))
+    assert table.items['s1']['version'] == 2
+    assert user_inputs(table.items['s1']) == ['first', 'second']
+
+
+def test_write_from_another_container_is_not_overwritten(table):
+    assert app.rewrite_session('s1', 'FallbackIntent', turn('first'))
+
+    # Another container appends a turn; this container's cached copy is now stale
+    other = copy.deepcopy(table.items['s1'])
+    other['conversation_history'].append(app.encode_turn(turn('elsewhere'), 'full'))
+    other['version'] = 2
+    table.items['s1'] = other
+
+    conflicts = app.SESSION_WRITE_STATS['conflicts']
+    assert app.rewrite_session('s1', 'FallbackIntent', turn('second'))
+    assert app.SESSION_WRITE_STATS['conflicts'] == conflicts + 1
+    assert table.items['s1']['version'] == 3
+    assert user_inputs(table.items['s1']) == ['first', 'elsewhere', 'second']
+
+
+def test_history_keeps_the_last_turns(table, monkeypatch):
+    monkeypatch.setattr(app, 'SESSION_HISTORY_LIMIT', 3)
+    for n in range(5):
+        app.rewrite_session('s1', 'FallbackIntent', turn(f"turn {n}"))
+    assert user_inputs(table.items['s1']) == ['turn 2', 'turn 3', 'turn 4']
+    assert table.items['s1']['intent_count'] == {'FallbackIntent': 5}
+
+
+def test_update_mode_creates_the_session_on_its_first_turn(table):
+    assert app.update_session('s1', 'FallbackIntent', turn('first'))
+
+    item = table.items['s1']
+    assert user_inputs(item) == ['first']
+    assert item['intent_count'] == {'FallbackIntent': 1}
+    assert (item['history_length'], item['version']) == (1, 1)
+    assert len(table.updates) == 2  # the existing-session update fails its condition first
+
+
+def test_update_mode_appends_to_a_put_mode_session(table):
+    app.rewrite_session('s1', 'FallbackIntent', turn('first'))
+    app.rewrite_session('s1', 'GreetingIntent', turn('second'))
+
+    assert app.update_session('s1', 'FallbackIntent', turn('third'))
+
+    item = table.items['s1']
+    assert user_inputs(item) == ['first', 'second', 'third']
+    assert item['intent_count'] == {'FallbackIntent': 2, 'GreetingIntent': 1}
+    assert (item['history_length'], item['version']) == (3, 3)
+    assert len(table.updates) == 1
+
+
+def test_update_mode_trims_at_twice_the_limit(table, monkeypatch):
+    monkeypatch.setattr(app, 'SESSION_HISTORY_LIMIT', 3)
+    for n in range(5):
+        app.update_session('s1', 'FallbackIntent', turn(f"turn {n}"))
+    assert len(user_inputs(table.items['s1'])) == 5
+
+    app.update_session('s1', 'FallbackIntent', turn('turn 5'))
+
+    item = table.items['s1']
+    assert user_inputs(item) == ['turn 3', 'turn 4', 'turn 5']
+    assert item['history_length'] == 3
+    assert item['intent_count'] == {'FallbackIntent': 6}
+
+
+def test_trim_follows_the_stored_list_after_put_mode_writes(table, monkeypatch):
+    monkeypatch.setattr(app, 'SESSION_HISTORY_LIMIT', 3)
+    for n in range(5):
+        app.rewrite_session('s1', 'FallbackIntent', turn(f"put {n}"))
+    assert table.items['s1']['history_length'] == 3
+
+    for n in range(3):
+        app.update_session('s1', 'FallbackIntent', turn(f"update {n}"))
+
+    assert user_inputs(table.items['s1']) == ['update 0', 'update 1', 'update 2']
+    assert table.items['s1']['history_length'] == 3
+
+
+def test_trim_racing_an_append_leaves_the_session_alone(table, monkeypatch):
+    monkeypatch.setattr(app, 'SESSION_HISTORY_LIMIT', 3)
+    for n in range(5):
+        app.update_session('s1', 'FallbackIntent', turn(f"turn {n}"))
+
+    def append_elsewhere(update_expression):
+        if update_expression.startswith('REMOVE'):
+            stored = table.items['s1']
+            stored['conversation_history'].append(app.encode_turn(turn('elsewhere'), 'full'))
+            stored['history_length'] += 1
+
+    table.before_update = append_elsewhere
+    assert app.update_session('s1', 'FallbackIntent', turn('turn 5'))
+    assert len(user_inputs(table.items['s1'])) == 7
+
+    # The next turn trims instead
+    table.before_update = None
+    app.update_session('s1', 'FallbackIntent', turn('turn 6'))
+    assert user_inputs(table.items['s1']) == ['turn 5', 'elsewhere', 'turn 6']
+
+
+def test_digest_keeps_every_source_of_a_multi_snippet_answer(knowledge_base):
+    document = knowledge_base.documents['docs/aws.pdf']
+    first_passages = {}
+    for passage_id in range(len(document.passages)):
+        first_passages.setdefault(document.passages.span(passage_id)[0], passage_id)
+    answer = "\n\n".join(app.format_answer(document, first_passages[position])[1] for position in (2, 0))
+    stored = app.encode_turn({'intent': 'FallbackIntent', 'user_input': 'q', 'bot_response': answer}, 'digest')
+
+    assert stored['sources'] == [{'page': 3, 'document': document.title}, {'page': 1, 'document': document.title}]
+    assert stored['response_chars'] == len(answer) and 'bot_response' not in stored
+
+
+def test_every_encoding_decodes():
+    full = turn('what is s3')
+    assert decode_history([app.encode_turn(full, encoding) for encoding in ('full', 'compressed')]) == [full, full]
+
+    # Digests written before multi-snippet answers had one source
+    legacy = {'intent': 'FallbackIntent', 'user_input': 'q', 'source_page': 2, 'source_document': 'aws.pdf'}
+    assert decode_history([legacy])[0]['sources'] == [{'page': 2, 'document': 'aws.pdf'}]
@@ -0,0 +1,85 @@
+"""
+Typo-tolerant term lookup (kb_spelling.py).
+"""
+
+import random
+
+import pytest
+
+from conftest import make_document
+import kb_spelling
+from kb_spelling import CorpusSpelling, SpellingIndex, edit_distance
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+@pytest.mark.parametrize('left, right, distance', [
+    ('lambda', 'lambda', 0),
+    ('lamda', 'lambda', 1),
+    ('lmabda', 'lambda', 1),  # adjacent transposition
+    ('dynamdb', 'dynamodb', 1),
+    ('capacity', 'capcaity', 1),
+    ('bucket', 'basket', 2),
+])
+def test_edit_distance(left, right, distance):
+    assert edit_distance(left, right, 2) == distance
+
+
+def test_edit_distance_stops_at_limit():
+    assert edit_distance('lambda', 'dynamodb', 2) == 3
+
+
+def test_correct_prefers_closest_then_most_common():
+    document = make_document('docs/a.pdf', ["lambda lambda lambda.", "lambada.", "versioning."])
+    spelling = SpellingIndex.build([document.index])
+    assert spelling.correct('lamda') == 'lambda'
+    assert spelling.correct('versoining') == 'versioning'
+    assert spelling.correct('lambda') == 'lambda'
+    assert spelling.correct('lmb') == 'lmb'  # too short to correct
+    assert spelling.correct('ec2x') == 'ec2x'  # digits are never corrected
+    assert spelling.correct('zzzzzz') == 'zzzzzz'
+
+
+def random_documents(rng, count, vocabulary, first=0):
+    return [make_document(f"docs/{n}.pdf", [' '.join(rng.sample(vocabulary, 30)) + '.' for _ in range(20)])
+            for n in range(first, first + count)]
+
+
+def assert_same_lookups(corpus, merged, rng):
+    for term in rng.sample(merged.terms, 100):
+        i = rng.randrange(len(term))
+        typo = term[:i] + rng.choice(LETTERS) + term[i + 1:]
+        assert (typo in corpus) == (typo in merged), typo
+        assert corpus.correct(typo) == merged.correct(typo), typo
+        assert corpus.candidates(typo, 2) == merged.candidates(typo, 2), typo
+
+
+def test_refreshed_corpus_spelling_matches_one_index_over_the_current_documents(monkeypatch):
+    monkeypatch.setattr(kb_spelling, 'COMPACT_SHARE', 10.0)  # never compact here
+    rng = random.Random(3)
+    vocabulary = sorted({''.join(rng.choice('abcdelmnorst') for _ in range(rng.randint(4, 10)))
+                         for _ in range(600)})
+    documents = random_documents(rng, 4, vocabulary[:400])
+    corpus = CorpusSpelling.build(document.index for document in documents)
+
+    # Replace one document, remove another, add a new one (with new terms)
+    documents = [documents[0], documents[2]] + random_documents(rng, 2, vocabulary[200:], first=4)
+    corpus = CorpusSpelling.build((document.index for document in documents), corpus)
+    assert len(corpus.overlays) == 2 and len(corpus.base_indexes) == 2
+
+    merged = SpellingIndex.build(document.index for document in documents)
+    assert all(term in corpus for term in merged.terms)
+    assert not any(term in corpus for term in vocabulary if term not in merged)
+    assert_same_lookups(corpus, merged, rng)
+
+
+def test_corpus_spelling_compacts_once_changes_dominate():
+    rng = random.Random(4)
+    vocabulary = sorted({''.join(rng.choice('abcdelmnorst') for _ in range(rng.randint(4, 10)))
+                         for _ in range(400)})
+    documents = random_documents(rng, 2, vocabulary)
+    corpus = CorpusSpelling.build(document.index for document in documents)
+    documents = random_documents(rng, 2, vocabulary, first=2)
+    corpus = CorpusSpelling.build((document.index for document in documents), corpus)
+    assert corpus.overlays == {} and corpus.removed_freqs == {}
+    assert_same_lookups(corpus, SpellingIndex.build(document.index for document in documents), rng)
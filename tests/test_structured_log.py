@@ -0,0 +1,81 @@
+"""
+The logger writes only enabled levels, formats lazily and logs a sample of
+requests in full.
+"""
+
+import json
+
+import structured_log
+from structured_log import StructuredLogger
+
+
+class Unprintable:
+    """
+    Fails the test if it is ever formatted or serialized.
+    """
+
+    def __str__(self):
+        raise AssertionError("formatted a disabled message")
+
+    __repr__ = __str__
+
+
+class Context:
+    aws_request_id = 'req-1'
+
+
+def lines(capsys):
+    return capsys.readouterr().out.splitlines()
+
+
+def test_levels_below_the_configured_one_cost_nothing(capsys):
+    log = StructuredLogger(level='WARNING', sample_rate=0, log_format='json')
+    log.start_request(Context())
+
+    log.info("skipped %s", Unprintable())
+    log.payload('DEBUG', 'Skipped payload', {'value': Unprintable()})
+    log.warning("kept %d", 1, session_id='s1')
+
+    assert [json.loads(line) for line in lines(capsys)] == [
+        {'level': 'WARNING', 'message': 'kept 1', 'request_id': 'req-1', 'session_id': 's1'}
+    ]
+
+
+def test_payloads_are_cut_to_the_limit(capsys):
+    log = StructuredLogger(level='DEBUG', sample_rate=0, payload_max_chars=20, log_format='json')
+    log.payload('DEBUG', 'Event', {'text': 'x' * 100})
+
+    message = json.loads(lines(capsys)[0])['message']
+    assert message.startswith('Event: {"text": "xxxx') and message.endswith('...(92 more chars)')
+
+
+def test_sampled_requests_are_logged_at_debug(capsys, monkeypatch):
+    log = StructuredLogger(level='INFO', sample_rate=0.1, log_format='json')
+
+    monkeypatch.setattr(structured_log.random, 'random', lambda: 0.05)
+    log.start_request(Context())
+    log.debug("full detail")
+    assert json.loads(lines(capsys)[0]) == {
+        'level': 'DEBUG', 'message': 'full detail', 'request_id': 'req-1', 'sampled': True
+    }
+
+    # The next request is not sampled and goes back to INFO
+    monkeypatch.setattr(structured_log.random, 'random', lambda: 0.5)
+    log.start_request(Context())
+    log.debug("full detail")
+    assert lines(capsys) == []
+    assert not log.sampled and not log.is_enabled('DEBUG') and log.is_enabled('INFO')
+
+
+def test_rate_zero_never_samples(monkeypatch):
+    monkeypatch.setattr(structured_log.random, 'random', lambda: 0.0)
+    log = StructuredLogger(level='ERROR', sample_rate=0)
+    log.start_request()
+    assert not log.sampled and not log.is_enabled('WARNING')
+
+
+def test_text_format_outside_lambda(capsys):
+    log = StructuredLogger(level='INFO', sample_rate=0, log_format='text')
+    log.info("✓ Loaded %d pages", 3)
+    log.info("Session saved", session_id='s1')
+    assert lines(capsys) == ['✓ Loaded 3 pages', 'Session saved {"session_id": "s1"}']
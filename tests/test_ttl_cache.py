@@ -0,0 +1,42 @@
+"""
+TTLCache: LRU eviction, expiry and counters.
+"""
+
+from ttl_cache import MISSING, TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_their_ttl():
+    clock = Clock()
+    cache = TTLCache(max_entries=4, ttl_seconds=10, clock=clock)
+    cache.put('a', None)  # None is a value, not a miss
+    clock.now = 9.9
+    assert cache.get('a') is None
+    clock.now = 10
+    assert cache.get('a') is MISSING
+    assert len(cache) == 0 and cache.stats()['expirations'] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2, ttl_seconds=60, clock=Clock())
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is MISSING
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_zero_entries_disables_the_cache():
+    cache = TTLCache(max_entries=0)
+    cache.put('a', 1)
+    assert cache.get('a') is MISSING
+    assert cache.stats() == {'size': 0, 'hits': 0, 'misses': 1, 'hit_ratio': 0.0, 'evictions': 0, 'expirations': 0}